@@ -0,0 +1,110 @@
+# coding: utf-8 -*-
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import base64
+import os
+
+from ansible.errors import AnsibleActionFail
+from ansible.module_utils.basic import env_fallback
+from ansible.plugins.action import ActionBase
+
+from ..module_utils.config_loader import ConfigLoader
+from ..plugin_utils import console_batch
+from ..plugin_utils.console import get_ssl_context
+
+
+ARGUMENT_SPEC = dict(
+    devices=dict(type="list", elements="str", required=True),
+    command=dict(type="str", required=True),
+    concurrency=dict(type="int", default=50),
+    timeout=dict(type="float", default=60),
+    compression=dict(type="str", default="deflate", choices=["deflate", "none"]),
+    audit_log=dict(type="str", default="command", choices=["command", "session", "off"]),
+    flightctl_host=dict(type="str", fallback=(env_fallback, ["FLIGHTCTL_HOST"])),
+    flightctl_token=dict(type="str", no_log=True, fallback=(env_fallback, ["FLIGHTCTL_TOKEN"])),
+    flightctl_validate_certs=dict(
+        type="bool", aliases=["verify_ssl"], fallback=(env_fallback, ["FLIGHTCTL_VERIFY_SSL"]),
+    ),
+    flightctl_ca_path=dict(type="path", aliases=["ca_path"], fallback=(env_fallback, ["FLIGHTCTL_CA_PATH"])),
+    flightctl_config_file=dict(
+        type="path", aliases=["config_file"], fallback=(env_fallback, ["FLIGHTCTL_CONFIG_FILE"]),
+    ),
+)
+
+
+class ActionModule(ActionBase):
+    """Run a command on many device consoles from the controller."""
+
+    TRANSFERS_FILES = False
+    _requires_connection = False
+    # Commands are run on the devices as they are, check mode skips the task instead
+    _supports_check_mode = False
+
+    def run(self, tmp=None, task_vars=None):
+        result = super().run(tmp, task_vars)
+        del tmp
+
+        _validation, args = self.validate_argument_spec(argument_spec=ARGUMENT_SPEC)
+
+        if console_batch.WEBSOCKETS_IMPORT_ERROR:
+            raise AnsibleActionFail(
+                "The websockets Python library is required"
+            ) from console_batch.WEBSOCKETS_IMPORT_ERROR
+        if args["concurrency"] < 1:
+            raise AnsibleActionFail("concurrency must be at least 1")
+
+        config = self._load_config(args["flightctl_config_file"])
+        host_url = args["flightctl_host"] or getattr(config, "host", None)
+        if not host_url:
+            raise AnsibleActionFail("flightctl_host must be specified")
+
+        validate_certs = args["flightctl_validate_certs"]
+        if validate_certs is None:
+            validate_certs = getattr(config, "verify_ssl", True)
+
+        results = console_batch.run(
+            args["devices"],
+            args["command"],
+            host_url,
+            token=args["flightctl_token"] or getattr(config, "token", None),
+            ssl_context=self._build_ssl_context(validate_certs, args["flightctl_ca_path"], config),
+            concurrency=args["concurrency"],
+            timeout=args["timeout"],
+            compression=None if args["compression"] == "none" else args["compression"],
+            audit_log=args["audit_log"],
+        )
+
+        result.update(console_batch.summarize(results))
+        # Not "results", which Ansible would treat as loop items and fail the task for any device
+        result["device_results"] = results
+        return result
+
+    @staticmethod
+    def _load_config(config_file):
+        if not config_file:
+            return None
+        if not os.path.exists(config_file):
+            raise AnsibleActionFail(f"Config file {config_file} does not exist")
+        try:
+            return ConfigLoader(config_file=config_file)
+        except Exception as e:
+            raise AnsibleActionFail(f"Failed to load config file {config_file}: {e}") from e
+
+    @staticmethod
+    def _build_ssl_context(validate_certs, ca_path, config):
+        """Return the SSL context shared by all the console sessions."""
+        if not validate_certs:
+            return get_ssl_context(False)
+        ca_data = None
+        encoded_ca_data = getattr(config, "ca_data", None)
+        if not ca_path and encoded_ca_data:
+            try:
+                ca_data = base64.b64decode(encoded_ca_data).decode("utf-8")
+            except (ValueError, UnicodeDecodeError) as e:
+                raise AnsibleActionFail("Invalid CA data – cannot decode base64-encoded PEM") from e
+        return get_ssl_context(True, ca_path, ca_data)
@@ -0,0 +1,68 @@
+# coding: utf-8 -*-
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import os
+import tempfile
+
+from ansible import constants as C
+from ansible.errors import AnsibleActionFail, AnsibleError
+from ansible.module_utils.common.text.converters import to_text
+from ansible.plugins.action import ActionBase
+
+from ..plugin_utils import console_archive
+
+
+ARGUMENT_SPEC = dict(
+    src=dict(type="path", required=True),
+    dest=dict(type="str", required=True),
+    compare=dict(type="bool", default=True),
+)
+
+
+class ActionModule(ActionBase):
+    """Copy a directory tree to a device in a single archive."""
+
+    TRANSFERS_FILES = True
+
+    def run(self, tmp=None, task_vars=None):
+        result = super().run(tmp, task_vars)
+        del tmp
+
+        _validation, args = self.validate_argument_spec(argument_spec=ARGUMENT_SPEC)
+
+        if not hasattr(self._connection, "put_archive"):
+            raise AnsibleActionFail(
+                f"{self._task.action} requires the flightctl.core.flightctl_console connection, "
+                f"not {self._connection.transport}"
+            )
+
+        # Like copy, a trailing slash copies the contents of the directory
+        contents_only = args["src"].endswith(os.sep)
+        try:
+            src = self._find_needle("files", args["src"])
+        except AnsibleError as e:
+            raise AnsibleActionFail(to_text(e)) from e
+        tree = console_archive.collect_tree(src, contents_only)
+        dest = args["dest"]
+
+        files, dirs = tree.files, tree.dirs
+        if args["compare"] and (files or dirs):
+            manifest = self._low_level_execute_command(console_archive.manifest_command(dest, tree))
+            if manifest["rc"] != 0:
+                raise AnsibleActionFail(f"Failed to compare {dest} with {src}: {manifest['stderr']}")
+            files, dirs = console_archive.compare_tree(tree, manifest["stdout"])
+
+        result.update(dest=dest, src=src, files=files, changed=bool(files or dirs))
+        if not result["changed"] or self._task.check_mode:
+            return result
+
+        with tempfile.NamedTemporaryFile(dir=C.DEFAULT_LOCAL_TMP, suffix=".tar.gz") as archive:
+            console_archive.build_archive(tree, files, dirs, archive)
+            archive.flush()
+            self._connection.put_archive(archive.name, dest)
+        return result
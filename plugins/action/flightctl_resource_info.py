@@ -0,0 +1,13 @@
+# coding: utf-8 -*-
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+from ..plugin_utils.api_worker import ApiWorkerAction
+
+
+class ActionModule(ApiWorkerAction):
+    """Run flightctl_resource_info in the persistent API worker when it is enabled."""
@@ -12,6 +12,9 @@ name: flightctl_console
 short_description: Connect to Flight Control managed devices
 description:
   - This connection plugin allows Ansible to connect to managed Flight Control devices through the API's console endpoint.
+  - Uploaded files are always sent whole. M(ansible.builtin.copy) and M(ansible.builtin.template) already skip
+    destinations whose checksum matches. To only send the files of a tree that changed, use
+    M(flightctl.core.flightctl_console_copy), which compares each file with the device first.
 author:
   - "Dakota Crowder (@dakcrowder)"
 version_added: "0.7.0"
@@ -64,6 +67,221 @@ options:
       - name: ansible_flightctl_ca_path
     env:
       - name: FLIGHTCTL_CA_PATH
+  flightctl_persist_timeout:
+    description:
+    - Keep the device console session open in a local background process for this many seconds of
+      inactivity, so that later tasks and playbook runs against the same device reuse it instead of
+      opening a new WebSocket.
+    - This is similar to SSH C(ControlPersist). Set to C(0) to open a new session for every task.
+    - If value not set, will try environment variable C(FLIGHTCTL_PERSIST_TIMEOUT).
+    type: int
+    default: 0
+    version_added: "1.7.0"
+    vars:
+      - name: ansible_flightctl_persist_timeout
+    env:
+      - name: FLIGHTCTL_PERSIST_TIMEOUT
+  flightctl_control_path_dir:
+    description:
+    - Directory holding the UNIX sockets of persistent console sessions.
+    - Only used when O(flightctl_persist_timeout) is greater than C(0).
+    - If value not set, will try environment variable C(FLIGHTCTL_CONTROL_PATH_DIR).
+    type: path
+    default: ~/.ansible/cp
+    version_added: "1.7.0"
+    vars:
+      - name: ansible_flightctl_control_path_dir
+    env:
+      - name: FLIGHTCTL_CONTROL_PATH_DIR
+  flightctl_compression:
+    description:
+    - WebSocket compression to negotiate with the API server.
+    - C(deflate) negotiates the permessage-deflate extension, which greatly reduces the size of command
+      output and file transfers. The negotiated extension and compression ratio are shown at C(-vvv).
+    - C(none) disables compression, which saves CPU when the link to the API server is fast.
+    - If value not set, will try environment variable C(FLIGHTCTL_COMPRESSION).
+    type: str
+    choices: [deflate, none]
+    default: deflate
+    version_added: "1.7.0"
+    vars:
+      - name: ansible_flightctl_compression
+    env:
+      - name: FLIGHTCTL_COMPRESSION
+  flightctl_transfer_mode:
+    description:
+    - How file contents are carried over the console stream by C(put_file) and C(fetch_file).
+    - C(base64) encodes file contents as text, which adds a third to every transferred byte.
+    - C(binary) sends raw bytes with a length header, written on the device by C(head -c). It requires
+      a POSIX shell and C(head) with support for C(-c) on the device.
+    - If value not set, will try environment variable C(FLIGHTCTL_TRANSFER_MODE).
+    type: str
+    choices: [base64, binary]
+    default: base64
+    version_added: "1.7.0"
+    vars:
+      - name: ansible_flightctl_transfer_mode
+    env:
+      - name: FLIGHTCTL_TRANSFER_MODE
+  flightctl_audit_log:
+    description:
+    - How console activity is recorded in the device journal with C(systemd-cat) under the C(ansible-console) tag.
+    - C(command) logs every command, file upload and file download, which spawns extra processes on
+      the device for each of them.
+    - C(session) logs once per console session, along with the first command sent over it. With
+      O(flightctl_persist_timeout) a session is shared by all the tasks run against a device.
+    - C(off) does not log to the device journal.
+    - If value not set, will try environment variable C(FLIGHTCTL_AUDIT_LOG).
+    type: str
+    choices: [command, session, 'off']
+    default: command
+    version_added: "1.7.0"
+    vars:
+      - name: ansible_flightctl_audit_log
+    env:
+      - name: FLIGHTCTL_AUDIT_LOG
+  flightctl_command_timeout:
+    description:
+    - Seconds to wait for a command, file upload or file download to complete on the device.
+    - When the timeout expires the console session is closed, so that a stalled device does not hold
+      the worker forever, and a new session is opened for the next task.
+    - C(0) waits forever.
+    - If value not set, will try environment variable C(FLIGHTCTL_COMMAND_TIMEOUT).
+    type: float
+    default: 0
+    version_added: "1.7.0"
+    vars:
+      - name: ansible_flightctl_command_timeout
+    env:
+      - name: FLIGHTCTL_COMMAND_TIMEOUT
+  flightctl_ping_interval:
+    description:
+    - Seconds between WebSocket keepalive pings sent to the API server.
+    - C(0) disables keepalive pings.
+    - If value not set, will try environment variable C(FLIGHTCTL_PING_INTERVAL).
+    type: float
+    default: 20
+    version_added: "1.7.0"
+    vars:
+      - name: ansible_flightctl_ping_interval
+    env:
+      - name: FLIGHTCTL_PING_INTERVAL
+  flightctl_ping_timeout:
+    description:
+    - Seconds to wait for the answer to a keepalive ping before the WebSocket is considered broken.
+    - C(0) waits forever.
+    - If value not set, will try environment variable C(FLIGHTCTL_PING_TIMEOUT).
+    type: float
+    default: 20
+    version_added: "1.7.0"
+    vars:
+      - name: ansible_flightctl_ping_timeout
+    env:
+      - name: FLIGHTCTL_PING_TIMEOUT
+  flightctl_idle_timeout:
+    description:
+    - Close the console session once it has been idle for this many seconds, a new session is opened
+      for the next command. This avoids reusing sessions silently dropped by middleboxes.
+    - Not used with O(flightctl_persist_timeout), the persistent session closes itself once idle.
+    - C(0) keeps idle sessions open.
+    - If value not set, will try environment variable C(FLIGHTCTL_IDLE_TIMEOUT).
+    type: float
+    default: 0
+    version_added: "1.7.0"
+    vars:
+      - name: ansible_flightctl_idle_timeout
+    env:
+      - name: FLIGHTCTL_IDLE_TIMEOUT
+  flightctl_reconnect_retries:
+    description:
+    - How many times to reconnect when the console session is lost during an operation.
+    - File downloads and uploads are retried, uploads larger than 512KiB resume from the last chunk
+      verified on the device. Commands are only retried if they had not been sent to the device yet.
+    - C(0) disables reconnecting, uploads are then always sent in one stream.
+    - If value not set, will try environment variable C(FLIGHTCTL_RECONNECT_RETRIES).
+    type: int
+    default: 3
+    version_added: "1.7.0"
+    vars:
+      - name: ansible_flightctl_reconnect_retries
+    env:
+      - name: FLIGHTCTL_RECONNECT_RETRIES
+  flightctl_reconnect_backoff:
+    description:
+    - Seconds to wait before the first reconnect attempt, the delay doubles with every attempt.
+    - If value not set, will try environment variable C(FLIGHTCTL_RECONNECT_BACKOFF).
+    type: float
+    default: 1
+    version_added: "1.7.0"
+    vars:
+      - name: ansible_flightctl_reconnect_backoff
+    env:
+      - name: FLIGHTCTL_RECONNECT_BACKOFF
+  flightctl_reconnect_backoff_max:
+    description:
+    - Maximum number of seconds to wait between two reconnect attempts.
+    - If value not set, will try environment variable C(FLIGHTCTL_RECONNECT_BACKOFF_MAX).
+    type: float
+    default: 30
+    version_added: "1.7.0"
+    vars:
+      - name: ansible_flightctl_reconnect_backoff_max
+    env:
+      - name: FLIGHTCTL_RECONNECT_BACKOFF_MAX
+  flightctl_fetch_compression:
+    description:
+    - Compress files on the device before they are downloaded with C(fetch_file).
+    - C(gzip) compresses with C(gzip -c) on the device and decompresses on the controller as the file
+      is written, which shrinks text such as logs and journal exports several times. Devices without
+      C(gzip) fall back to uncompressed downloads.
+    - Only the decompression is streamed. Like uncompressed downloads, the compressed file is received
+      in memory as a whole before it is decompressed into the destination, at most 1MiB at a time.
+    - C(none) downloads files as they are.
+    - If value not set, will try environment variable C(FLIGHTCTL_FETCH_COMPRESSION).
+    type: str
+    choices: [none, gzip]
+    default: none
+    version_added: "1.7.0"
+    vars:
+      - name: ansible_flightctl_fetch_compression
+    env:
+      - name: FLIGHTCTL_FETCH_COMPRESSION
+  flightctl_exec_mode:
+    description:
+    - How commands are run on the device.
+    - C(shell) writes every command to the stdin of the console shell.
+    - C(python) starts a Python exec server on the device the first time a module is run, with the
+      interpreter Ansible uses for modules. Modules then run in a process forked from it, with the common
+      modules imported already, instead of a new interpreter, and get their real exit status. Other
+      commands and file transfers still go through the console shell, which keeps its working directory
+      and environment for the whole session; the server is stopped for them and started again for the
+      next module. The console falls back to C(shell) when the interpreter cannot be started.
+    - C(python) also enables pipelining, when it is enabled in the Ansible configuration, which sends
+      modules over stdin instead of copying them to the device first. This avoids most of the file
+      transfers and makes the best use of the exec server.
+    - Not used with O(flightctl_persist_timeout), which shares the console shell between processes.
+    - If value not set, will try environment variable C(FLIGHTCTL_EXEC_MODE).
+    type: str
+    choices: [shell, python]
+    default: shell
+    version_added: "1.7.0"
+    vars:
+      - name: ansible_flightctl_exec_mode
+    env:
+      - name: FLIGHTCTL_EXEC_MODE
+  flightctl_stats_file:
+    description:
+    - Path of a JSON lines file to which the statistics of every console session are appended when it
+      is closed. They are also shown at C(-vvv).
+    - The statistics include the bytes and frames exchanged per channel, the number of commands, their
+      time to first byte and wall time, and the throughput of file uploads and downloads.
+    - If value not set, will try environment variable C(FLIGHTCTL_STATS_FILE).
+    type: path
+    version_added: "1.7.0"
+    vars:
+      - name: ansible_flightctl_stats_file
+    env:
+      - name: FLIGHTCTL_STATS_FILE
 '''
 
 
@@ -102,17 +320,25 @@ EXAMPLES = r"""
 
 
 import base64
+import contextlib
+import hashlib
+import inspect
 import json
 import os
+import posixpath
 import re
+import secrets
+import shlex
 import ssl
-import urllib.parse
+import time
+import zlib
 from enum import Enum
 
 try:
-    from websockets.sync.client import connect
-    from websockets.exceptions import ConnectionClosedOK, ConnectionClosedError
+    from websockets.sync.client import ClientConnection, connect
+    from websockets.exceptions import ConnectionClosedOK, ConnectionClosedError, InvalidStatus
 except ImportError as imp_exc:
+    ClientConnection = object
     WEBSOCKETS_IMPORT_ERROR = imp_exc
 else:
     WEBSOCKETS_IMPORT_ERROR = None
@@ -120,15 +346,63 @@ else:
 from ansible.plugins.connection import ConnectionBase
 from ansible.errors import AnsibleConnectionFailure
 from ..module_utils.config_loader import ConfigLoader
+from ..plugin_utils import console_mux, console_zygote
+from ..plugin_utils.console import (
+    STD_ERR_CHANNEL,
+    STD_IN_CHANNEL,
+    STD_OUT_CHANNEL,
+    STREAM_ERR_CHANNEL,
+    SUBPROTOCOL,
+    ResumableSSLContext,
+    audit_log_command,
+    console_url,
+    get_ssl_context,
+)
+from ..plugin_utils.console_stats import SessionStats
+from ..plugin_utils.persistent import control_path, spawn_daemon, spawn_lock
 
 
 CMD_END_MARKER = "__ANSIBLE_CMD_END__"
 PUT_FILE_MARKER = "__ANSIBLE_PUT_FILE__"
+STDIN_READY_MARKER = "__ANSIBLE_STDIN_READY__"
+ZYGOTE_EXITED_LINE = b"__ANSIBLE_ZYGOTE__ exited"
+
+# Raw file contents are sent to the device in messages of at most this many bytes
+STDIN_CHUNK_SIZE = 64 * 1024
+
+# Larger uploads are sent in chunks of this size, so that they can resume after a reconnect
+PUT_CHUNK_SIZE = 512 * 1024
 
-STD_IN_CHANNEL = 0
-STD_OUT_CHANNEL = 1
-STD_ERR_CHANNEL = 2
-STREAM_ERR_CHANNEL = 3
+# Compressed downloads are decompressed to at most this many bytes at a time
+FETCH_DECOMPRESS_CHUNK_SIZE = 1024 * 1024
+
+
+class _MeteredClientConnection(ClientConnection):
+    """WebSocket connection that counts the bytes exchanged on the wire.
+
+    Wire bytes are counted after compression, so comparing them with the size of the
+    messages gives the effective compression ratio.
+    """
+
+    def __init__(self, sock, protocol, *args, **kwargs):
+        self.wire_bytes_sent = 0
+        self.wire_bytes_received = 0
+
+        receive_data = protocol.receive_data
+        data_to_send = protocol.data_to_send
+
+        def counting_receive_data(data):
+            self.wire_bytes_received += len(data)
+            return receive_data(data)
+
+        def counting_data_to_send():
+            chunks = data_to_send()
+            self.wire_bytes_sent += sum(len(chunk) for chunk in chunks)
+            return chunks
+
+        protocol.receive_data = counting_receive_data
+        protocol.data_to_send = counting_data_to_send
+        super().__init__(sock, protocol, *args, **kwargs)
 
 
 class CommandType(Enum):
@@ -137,6 +411,74 @@ class CommandType(Enum):
     FETCH = 3
 
 
+def _gunzip_to(data, out_file):
+    """Decompress gzip ``data`` into ``out_file`` a chunk at a time, returns the decompressed size.
+
+    ``data`` is the whole compressed download, only the decompressed side is streamed.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    size = 0
+    pending = data
+    try:
+        while not decompressor.eof:
+            chunk = decompressor.decompress(pending, FETCH_DECOMPRESS_CHUNK_SIZE)
+            pending = decompressor.unconsumed_tail
+            if not chunk and not pending:
+                break
+            out_file.write(chunk)
+            size += len(chunk)
+    except zlib.error as e:
+        raise AnsibleConnectionFailure(f"Failed to decompress fetched content: {e}") from e
+    if not decompressor.eof:
+        raise AnsibleConnectionFailure("Fetched content was truncated")
+    return size
+
+
+_ENV_ASSIGNMENT = re.compile(r"[A-Za-z_][A-Za-z0-9_]*=")
+_PYTHON_INTERPRETER = re.compile(r"(.*/)?(platform-)?python[0-9.]*")
+_SHELL_SPECIAL = re.compile(r"[;&|<>$`(){}*?!~\\\s]")
+
+
+def _python_request(cmd):
+    """Parse a command that only runs a Python interpreter, as Ansible runs modules.
+
+    Returns:
+        A dict with the ``interpreter``, its ``argv`` and ``env``, or None for any other command.
+    """
+    try:
+        argv = shlex.split(cmd)
+        if len(argv) == 3 and argv[0] in ("/bin/sh", "sh", "/bin/bash", "bash") and argv[1] == "-c":
+            argv = shlex.split(argv[2])
+    except ValueError:
+        return None
+    if argv[-3:] == ["&&", "sleep", "0"]:
+        argv = argv[:-3]
+
+    env = {}
+    while argv and _ENV_ASSIGNMENT.match(argv[0]):
+        name, _sep, value = argv.pop(0).partition("=")
+        env[name] = value
+
+    if not argv or len(argv) > 2 or not _PYTHON_INTERPRETER.fullmatch(argv[0]):
+        return None
+    if len(argv) == 2 and (argv[1].startswith("-") or _SHELL_SPECIAL.search(argv[1])):
+        return None
+    return {"interpreter": argv[0], "argv": argv[1:], "env": env}
+
+
+def _zygote_request(request):
+    """Encode a request to the Python exec server as a line."""
+    return base64.b64encode(json.dumps(request).encode()) + b"\n"
+
+
+class _SessionLost(AnsibleConnectionFailure):
+    """The console session was lost, ``sent`` tells whether the command may have reached the device."""
+
+    def __init__(self, message, sent=False):
+        super().__init__(message)
+        self.sent = sent
+
+
 class Connection(ConnectionBase):
     """Flight Control connection plugin."""
 
@@ -157,8 +499,45 @@ class Connection(ConnectionBase):
     # Config file representation
     config_file = None
 
+    # Persistent session settings
+    persist_timeout = 0
+    control_path_dir = None
+
+    # WebSocket compression, and the wire byte counts used to report its ratio
+    compression = 'deflate'
+    _wire_baseline = None
+
+    # File transfer encoding and device journal logging
+    transfer_mode = 'base64'
+    audit_log = 'command'
+    _session_log_pending = False
+
+    # Statistics of the current session
+    stats_file = None
+    _stats = None
+
+    # Timeouts and keepalive
+    command_timeout = 0
+    ping_interval = 20
+    ping_timeout = 20
+    idle_timeout = 0
+
+    # Reconnect attempts and the exponential backoff between them
+    reconnect_retries = 3
+    reconnect_backoff = 1
+    reconnect_backoff_max = 30
+
+    # Download compression
+    fetch_compression = 'none'
+
+    # Exec mode, and the interpreter of the Python exec server running on the device
+    exec_mode = 'shell'
+    _zygote = None
+    _zygote_unavailable = ()
+
     # Websocket state
     _ws = None
+    _last_used = 0
 
     def __init__(self, *args, **kwargs):
         if WEBSOCKETS_IMPORT_ERROR:
@@ -236,6 +615,21 @@ class Connection(ConnectionBase):
         # Note: _set_ca_cert is dependent on validate_certs state
         # so it should be called after _set_validate_certs
         self._set_ca_cert() if self.validate_certs else None
+        self.persist_timeout = self.get_option('flightctl_persist_timeout') or 0
+        self.control_path_dir = self.get_option('flightctl_control_path_dir')
+        self.compression = self.get_option('flightctl_compression') or 'deflate'
+        self.transfer_mode = self.get_option('flightctl_transfer_mode') or 'base64'
+        self.audit_log = self.get_option('flightctl_audit_log') or 'command'
+        self.command_timeout = self.get_option('flightctl_command_timeout') or 0
+        self.ping_interval = self.get_option('flightctl_ping_interval')
+        self.ping_timeout = self.get_option('flightctl_ping_timeout')
+        self.idle_timeout = self.get_option('flightctl_idle_timeout') or 0
+        self.reconnect_retries = self.get_option('flightctl_reconnect_retries') or 0
+        self.reconnect_backoff = self.get_option('flightctl_reconnect_backoff') or 0
+        self.reconnect_backoff_max = self.get_option('flightctl_reconnect_backoff_max') or 0
+        self.fetch_compression = self.get_option('flightctl_fetch_compression') or 'none'
+        self.exec_mode = self.get_option('flightctl_exec_mode') or 'shell'
+        self.stats_file = self.get_option('flightctl_stats_file')
 
         self._display.vvv(
             f"Connection info:\n"
@@ -248,14 +642,8 @@ class Connection(ConnectionBase):
     def _build_ssl_context(self):
         """Build SSL context for the WebSocket connection."""
         if self.validate_certs:
-            if self.ca_path:
-                return ssl.create_default_context(cafile=self.ca_path)
-            elif self.ca_data:
-                return ssl.create_default_context(cadata=self.ca_data)
-            else:
-                return ssl.create_default_context()
-        else:
-            return ssl._create_unverified_context()
+            return get_ssl_context(True, self.ca_path, self.ca_data)
+        return get_ssl_context(False)
 
     def _connect(self):
         """Open websocket connection using synchronous API."""
@@ -266,79 +654,359 @@ class Connection(ConnectionBase):
         ws_url = self._build_websocket_url()
         self._display.vvv(f"Connecting to WebSocket URL: {ws_url}")
 
+        try:
+            self._session_log_pending = False
+            self._zygote = None
+            self._zygote_unavailable = set()
+            self._last_used = time.monotonic()
+            self._stats = SessionStats(self.device_name)
+            if self.persist_timeout > 0:
+                self._ws = self._connect_persistent(ws_url)
+            else:
+                self._ws = self._open_websocket(ws_url)
+                for line in self._describe_websocket(self._ws):
+                    self._display.vvv(line)
+                self._session_log_pending = self.audit_log == 'session'
+            return self
+        except InvalidStatus as e:
+            if e.response.status_code >= 500:
+                raise _SessionLost(f"WebSocket connect failed {e}") from e
+            # Authentication errors and unknown devices are not worth retrying
+            raise AnsibleConnectionFailure(f"WebSocket connect failed {e}") from e
+        except Exception as e:
+            raise _SessionLost(f"WebSocket connect failed {e}") from e
+
+    def _open_websocket(self, ws_url):
+        """
+        Open a new WebSocket to the device console endpoint.
+
+        This also runs in the persistent session daemon, where the display is not available:
+        it must not log anything, see _describe_websocket.
+        """
         headers = {}
         if self.token:
             headers['Authorization'] = f"Bearer {self.token}"
 
+        ws = connect(
+            ws_url,
+            additional_headers=headers,
+            ssl_context=self._build_ssl_context(),
+            subprotocols=[SUBPROTOCOL],
+            compression=None if self.compression == 'none' else self.compression,
+            create_connection=_MeteredClientConnection,
+            ping_interval=self.ping_interval or None,
+            ping_timeout=self.ping_timeout or None,
+        )
+        # Exclude the opening handshake from the compression ratio
+        self._wire_baseline = (getattr(ws, 'wire_bytes_sent', 0), getattr(ws, 'wire_bytes_received', 0))
+        return ws
+
+    def _describe_websocket(self, ws):
+        """Returns the lines to log about a WebSocket opened by _open_websocket."""
+        lines = []
+        sock = getattr(ws, 'socket', None)
+        if isinstance(sock, ssl.SSLSocket):
+            lines.append(f"TLS session reused: {sock.session_reused}")
+
+        extensions = [ext.name for ext in getattr(ws.protocol, 'extensions', [])]
+        lines.append(f"Negotiated WebSocket extensions: {', '.join(extensions) or 'none'}")
+        return lines
+
+    def _count_frame(self, direction, message):
+        """Count a message before compression, ``direction`` is either sent or received."""
+        if self._stats is not None:
+            self._stats.count_frame(direction, message)
+
+    def _count_transfer(self, kind, size, started):
+        """Count a file transfer of ``size`` bytes that started at monotonic time ``started``."""
+        if self._stats is not None:
+            self._stats.count_transfer(kind, size, time.monotonic() - started)
+
+    def _report_compression(self):
+        """Show the compression ratio achieved on the current WebSocket."""
+        if not isinstance(self._ws, _MeteredClientConnection) or self._stats is None:
+            return
+        wire = (
+            self._ws.wire_bytes_sent - self._wire_baseline[0],
+            self._ws.wire_bytes_received - self._wire_baseline[1],
+        )
+        message_bytes = (self._stats.total_bytes("sent"), self._stats.total_bytes("received"))
+        ratios = []
+        for label, message_bytes, wire_bytes in zip(("sent", "received"), message_bytes, wire):
+            ratio = f"{message_bytes / wire_bytes:.2f}" if wire_bytes else "n/a"
+            ratios.append(f"{label} {message_bytes}B in {wire_bytes}B on the wire (ratio {ratio})")
+        self._display.vvv(f"WebSocket compression: {'; '.join(ratios)}")
+
+    def _report_stats(self):
+        """Show the statistics of the current session, and append them to the stats file."""
+        if self._stats is None:
+            return
+        self._display.vvv(f"Console session stats: {self._stats.summary()}")
+        if self.stats_file:
+            try:
+                self._stats.append_to(self.stats_file)
+            except OSError as e:
+                self._display.warning(f"Unable to write console session stats to {self.stats_file}: {e}")
+        self._stats = None
+
+    def _connect_persistent(self, ws_url):
+        """Attach to the persistent session for this device, starting it if needed."""
+        token_digest = hashlib.sha256((self.token or "").encode()).hexdigest()
+        path = control_path(self.control_path_dir, "flightctl-console", self.host_url, self.device_name, token_digest)
+
         try:
-            self._ws = connect(
-                ws_url,
-                additional_headers=headers,
-                ssl_context=self._build_ssl_context(),
-                subprotocols=["v5.channel.k8s.io"],
+            return console_mux.MuxClient(path)
+        except OSError:
+            pass
+
+        with spawn_lock(path):
+            # Another fork may have started the session while we waited for the lock
+            try:
+                return console_mux.MuxClient(path)
+            except OSError:
+                pass
+
+            self._display.vvv(f"Starting persistent console session at {path}")
+            description = spawn_daemon(
+                path,
+                setup=lambda: self._open_websocket(ws_url),
+                serve=lambda listener, ws: console_mux.serve(listener, ws, self.persist_timeout),
+                describe=lambda ws: "\n".join(self._describe_websocket(ws)),
             )
-            return self
-        except Exception as e:
-            raise AnsibleConnectionFailure(f"WebSocket connect failed {e}") from e
+            for line in description.splitlines():
+                self._display.vvv(line)
+            self._session_log_pending = self.audit_log == 'session'
+            return console_mux.MuxClient(path)
 
     def _build_websocket_url(self):
         """Builds a proper WebSocket URL from host URL."""
-        # Remove any trailing slashes
-        host_url = self.host_url.rstrip('/')
-
-        # Strip the https protocol if present
-        if re.match("^https{0,1}://", host_url):
-            host_url = host_url.split("://", 1)[1]
-
-        # Add wss:// prefix if not already present
-        if not host_url.startswith("wss://"):
-            host_url = f"wss://{host_url}"
-
-        metadata = self._build_metadata()
-        encoded_metadata = urllib.parse.quote(metadata)
+        return console_url(self.host_url, self.device_name)
 
-        return f"{host_url}/ws/v1/devices/{self.device_name}/console?metadata={encoded_metadata}"
-
-    def _build_metadata(self):
-        """Build the JSON metadata payload for a command."""
-        metadata = {
-            "tty": False,
-            "command": {
-                "command": "",
-                "args": [],
-            },
-        }
-        return json.dumps(metadata)
+    @property
+    def has_pipelining(self):
+        """Modules are only sent over stdin to the Python exec server."""
+        try:
+            return self.get_option('flightctl_exec_mode') == 'python'
+        except KeyError:
+            return False
 
     def exec_command(self, cmd, in_data=None, sudoable=False):
         """Run a bash command over the websocket."""
-        if in_data:
+        if in_data and not self.has_pipelining:
             raise AnsibleConnectionFailure("Pipelining not supported")
 
-        if not self._ws:
-            self._connect()
+        self._close_if_idle()
 
         try:
-            stdout, stderr = self._send_command(cmd, CommandType.EXEC)
-            return 0, stdout.encode(), stderr.encode()
+            return self._with_reconnect(lambda: self._exec(cmd, in_data), connect=True)
         except Exception as e:
             raise AnsibleConnectionFailure("exec_command failed") from e
 
-    def _build_command(self, cmd, type):
-        """Build the command string to be sent over the WebSocket."""
+    def _exec(self, cmd, in_data):
+        """Run a command over the current session, returns its exit status, stdout and stderr."""
+        if self.exec_mode == 'python' and self.persist_timeout <= 0:
+            request = _python_request(cmd)
+            if request is not None:
+                interpreter = request.pop("interpreter")
+                if interpreter not in self._zygote_unavailable and (
+                    self._zygote == interpreter or self._start_zygote(interpreter)
+                ):
+                    return self._zygote_call(request, in_data)
+
+        # Other commands run in the console shell, which stops the exec server if it runs, so
+        # that they keep the working directory and environment of the session and return the
+        # same results whether or not a module ran before them
+        if in_data:
+            # The exec server is not available, feed the input to the command from the shell instead.
+            # What the command does not read is drained, so that it is not run by the shell.
+            stdout, stderr = self._send_command_raw(
+                f"head -c {len(in_data)} | ({cmd}; cat > /dev/null)", CommandType.EXEC, payload=in_data
+            )
+            return 0, stdout.strip(), stderr.strip()
+        stdout, stderr = self._send_command(cmd, CommandType.EXEC)
+        return 0, stdout.encode(), stderr.encode()
+
+    def _start_zygote(self, interpreter):
+        """Start the Python exec server with ``interpreter``, returns False if it could not be started.
+
+        The server replaces the shell as the reader of stdin until it exits, after which the shell
+        echoes ZYGOTE_EXITED_LINE.
+        """
+        if self._zygote:
+            self._stop_zygote()
+
+        self._display.vvv(f"Starting Python exec server with {interpreter}")
+        source = base64.b64encode(inspect.getsource(console_zygote).encode()).decode()
+        cmd = (
+            f"{shlex.quote(interpreter)} -u -c \"import base64; exec(base64.b64decode('{source}'))\"; "
+            f"echo '{ZYGOTE_EXITED_LINE.decode()}'"
+        )
+        output = bytearray()
+        err_output = bytearray()
+        with self._zygote_errors():
+            self._send_stdin([self._build_command(cmd, CommandType.EXEC, marker=None).encode()])
+            while True:
+                line = self._receive_line(output, err_output, self._deadline())
+                if line == console_zygote.READY_LINE:
+                    self._zygote = interpreter
+                    return True
+                if line == ZYGOTE_EXITED_LINE:
+                    self._display.vvv(f"Python exec server not available: {err_output.decode(errors='ignore').strip()}")
+                    self._zygote_unavailable.add(interpreter)
+                    return False
+
+    def _stop_zygote(self):
+        """Stop the Python exec server, which hands stdin back to the shell."""
+        self._display.vvv("Stopping Python exec server")
+        self._zygote = None
+        output = bytearray()
+        with self._zygote_errors():
+            self._send_stdin([_zygote_request({"exit": True})])
+            while self._receive_line(output, bytearray(), self._deadline()) != ZYGOTE_EXITED_LINE:
+                pass
+
+    def _zygote_call(self, request, in_data):
+        """Run a request on the Python exec server, returns its exit status, stdout and stderr."""
+        started = time.monotonic()
+        marker = self._new_marker()
+        request = dict(request, marker=marker, stdin=base64.b64encode(in_data or b"").decode())
+        if self.audit_log == 'command':
+            # Logged by the server, which saves spawning systemd-cat
+            request["log"] = "exec_command"
+        line = _zygote_request(request)
+
+        output = bytearray()
+        with self._zygote_errors(sent=True):
+            self._send_stdin([line[i:i + STDIN_CHUNK_SIZE] for i in range(0, len(line), STDIN_CHUNK_SIZE)])
+            sent_at = time.monotonic()
+            response = first_byte_at = None
+            deadline = self._deadline()
+            while response is None:
+                line = self._receive_line(output, bytearray(), deadline)
+                first_byte_at = first_byte_at or time.monotonic()
+                if line.endswith(marker.encode()):
+                    response = json.loads(base64.b64decode(line[:-len(marker)]))
+                elif line == ZYGOTE_EXITED_LINE:
+                    break
+        if response is None:
+            # The server could not read the request and handed stdin back to the shell
+            self._zygote = None
+            raise AnsibleConnectionFailure("The Python exec server exited without answering the request")
+
+        self._last_used = time.monotonic()
+        if self._stats is not None:
+            self._stats.count_command("exec", self._last_used - started, first_byte_at - sent_at)
+        return response["rc"], base64.b64decode(response["stdout"]), base64.b64decode(response["stderr"])
+
+    def _receive_line(self, output, err_output, deadline):
+        """Take the next line out of ``output``, receiving more output until it is complete."""
+        end_at = output.find(b"\n")
+        if end_at == -1:
+            end_at, _first_byte_at = self._receive_until(b"\n", output, err_output, deadline)
+        line = bytes(output[:end_at]).strip()
+        del output[:end_at + 1]
+        return line
+
+    def _deadline(self):
+        return time.monotonic() + self.command_timeout if self.command_timeout else None
+
+    @contextlib.contextmanager
+    def _zygote_errors(self, sent=False):
+        """Report the errors of an exchange with the Python exec server like those of shell commands."""
+        if not self._ws:
+            raise _SessionLost("WebSocket is not connected.")
+        try:
+            yield
+        except TimeoutError as e:
+            self._reap()
+            raise _SessionLost(f"Command did not complete within {self.command_timeout} seconds", sent=True) from e
+        except (ConnectionClosedOK, ConnectionClosedError):
+            self._ws = None
+            raise _SessionLost("WebSocket is not connected", sent=sent)
+        except Exception as e:
+            raise AnsibleConnectionFailure("Error during command execution") from e
+
+    def _close_if_idle(self):
+        """Close the console session if it has been idle for too long, returns True if it was closed."""
+        idle = time.monotonic() - self._last_used
+        if self._ws and self.idle_timeout and self.persist_timeout <= 0 and idle > self.idle_timeout:
+            self._display.vvv(f"Closing console session idle for {idle:.0f}s")
+            self.close()
+            return True
+        return False
+
+    def _with_reconnect(self, operation, resend=False, connect=False):
+        """Run ``operation``, reconnecting with a bounded exponential backoff when the session is lost.
+
+        Args:
+            operation: Callable running the operation over the current session.
+            resend: Whether the operation is safe to run again after its command reached the device.
+            connect: Whether to open the session before the first attempt if it is not open.
+
+        Returns:
+            The value returned by ``operation``.
+        """
+        attempt = 0
+        while True:
+            try:
+                if not self._ws and (connect or attempt):
+                    self._connect()
+                return operation()
+            except _SessionLost as e:
+                if attempt >= self.reconnect_retries or (e.sent and not resend):
+                    raise
+                attempt += 1
+                delay = min(self.reconnect_backoff * 2 ** (attempt - 1), self.reconnect_backoff_max)
+                self._display.vvv(
+                    f"Console session lost ({e}), reconnecting in {delay:.1f}s "
+                    f"(attempt {attempt} of {self.reconnect_retries})"
+                )
+                self.close()
+                time.sleep(delay)
+
+    def _reap(self):
+        """Drop a console session that stopped responding, it cannot be reused safely."""
+        self._display.vvv("Closing unresponsive console session")
+        if isinstance(self._ws, console_mux.MuxClient):
+            # Other forks must not attach to the stalled shell either
+            self._ws.shutdown()
+        self.close()
+
+    @staticmethod
+    def _new_marker():
+        """Return an end marker unique to one command.
+
+        A fixed marker could appear in the output of a command, for instance when fetching a
+        file that contains it, and would cut that output short.
+        """
+        return f"{CMD_END_MARKER}{secrets.token_hex(8)}"
+
+    def _build_command(self, cmd, type, marker=CMD_END_MARKER):
+        """Build the command string to be sent over the WebSocket.
+
+        With ``marker`` set to None the command that echoes the end marker is left out,
+        so that the caller can send data for the command to read from stdin first.
+        """
         full_cmd = cmd.strip()
         log_cmd = ""
-        if type == CommandType.EXEC:
-            log_cmd = "echo exec_command | systemd-cat -t ansible-console"
-        elif type == CommandType.PUT:
-            log_cmd = "echo put_file | systemd-cat -t ansible-console"
-        elif type == CommandType.FETCH:
-            log_cmd = "echo fetch_file | systemd-cat -t ansible-console"
+        if self.audit_log == 'command':
+            if type == CommandType.EXEC:
+                log_cmd = audit_log_command("exec_command")
+            elif type == CommandType.PUT:
+                log_cmd = audit_log_command("put_file")
+            elif type == CommandType.FETCH:
+                log_cmd = audit_log_command("fetch_file")
+        elif self._session_log_pending:
+            # Logged with the first command to save a round trip to the device
+            log_cmd = audit_log_command("console_session")
+            self._session_log_pending = False
 
         if log_cmd:
             full_cmd = f"{log_cmd}\n{full_cmd}"
 
-        return full_cmd + f'\necho {CMD_END_MARKER}\n'
+        if marker is None:
+            return full_cmd + '\n'
+        return full_cmd + f'\necho {marker}\n'
 
     def _send_command(self, cmd, type):
         """Send a command over the WebSocket and receive output/error streams.
@@ -353,8 +1021,8 @@ class Connection(ConnectionBase):
         Commands are sent on channel 0 (STDIN) and the output is received on channel 1 (STDOUT).
         Any error output is received on channel 2 (STDERR). Channel 3 indicates a remote error.
 
-        Sent commands are terminated with a special marker (CMD_END_MARKER) echoed to STDOUT
-        to indicate the end of the command output.
+        Sent commands are terminated with a marker, CMD_END_MARKER followed by a nonce unique to
+        the command, echoed to STDOUT to indicate the end of the command output.
 
         Args:
             cmd: The command string to execute on the remote device.
@@ -366,76 +1034,171 @@ class Connection(ConnectionBase):
             AnsibleConnectionFailure: If the WebSocket is not connected or if a remote stream error occurs.
             Exception: For other unexpected errors during WebSocket communication.
         """
-        if not self._ws:
-            raise AnsibleConnectionFailure("WebSocket is not connected.")
+        stdout, stderr = self._send_command_raw(cmd, type)
+        return stdout.decode(errors="ignore").strip(), stderr.decode(errors="ignore").strip()
 
-        try:
-            full_cmd = self._build_command(cmd, type)
-            self._ws.send(bytes([STD_IN_CHANNEL]) + full_cmd.encode())
+    def _send_command_raw(self, cmd, type, payload=None):
+        """Send a command over the WebSocket and return its raw output streams.
 
-            output = ""
-            err_output = ""
-            while True:
-                msg = self._ws.recv()
-                channel = msg[0]
-                content = msg[1:].decode(errors="ignore")
-
-                if channel == STD_OUT_CHANNEL:
-                    output += content
-
-                    # Only break if we received CMD_END_MARKER
-                    if CMD_END_MARKER in output:
-                        break
-                elif channel == STD_ERR_CHANNEL:
-                    err_output += content
-                elif channel == STREAM_ERR_CHANNEL:
-                    raise Exception("Stream error occurred: " + content)
-
-            return output.replace(CMD_END_MARKER, "").strip(), err_output.strip()
+        Args:
+            cmd: The command string to execute on the remote device.
+            type: The CommandType of the command.
+            payload: Optional bytes written to stdin right after the command, for the
+                command to consume.
+
+        Returns:
+            A tuple containing the captured stdout and stderr as bytes.
+        """
+        if not self._ws:
+            raise _SessionLost("WebSocket is not connected.")
+        if self._zygote:
+            # Hand stdin back to the shell
+            self._stop_zygote()
+
+        sent = False
+        started = time.monotonic()
+        marker = self._new_marker()
+        try:
+            deadline = None
+            first_byte_at = None
+            output = bytearray()
+            err_output = bytearray()
+            if payload is None:
+                self._send_stdin([self._build_command(cmd, type, marker).encode()])
+                sent = True
+                sent_at = time.monotonic()
+            else:
+                # Only send the payload once the command runs, shells such as dash read ahead
+                # on stdin and would take part of it for commands
+                self._send_stdin([self._build_command(f"echo {STDIN_READY_MARKER}\n{cmd}", type, marker=None).encode()])
+                sent = True
+                sent_at = time.monotonic()
+                if self.command_timeout:
+                    deadline = sent_at + self.command_timeout
+                ready = f"{STDIN_READY_MARKER}\n".encode()
+                ready_at, first_byte_at = self._receive_until(ready, output, err_output, deadline)
+                del output[:ready_at + len(ready)]
+                messages = [payload[i:i + STDIN_CHUNK_SIZE] for i in range(0, len(payload), STDIN_CHUNK_SIZE)]
+                messages.append(f"\necho {marker}\n".encode())
+                self._send_stdin(messages)
+
+            if deadline is None and self.command_timeout:
+                deadline = sent_at + self.command_timeout
+            end_at, received_at = self._receive_until(marker.encode(), output, err_output, deadline)
+            first_byte = (first_byte_at or received_at) - sent_at
+
+            self._last_used = time.monotonic()
+            if self._stats is not None:
+                self._stats.count_command(type.name.lower(), self._last_used - started, first_byte)
+            return bytes(output[:end_at]), bytes(err_output)
+        except TimeoutError as e:
+            self._reap()
+            raise _SessionLost(f"Command did not complete within {self.command_timeout} seconds", sent=True) from e
         except (ConnectionClosedOK, ConnectionClosedError):
             self._ws = None  # Clear the websocket reference since it's no longer usable
-            raise AnsibleConnectionFailure("WebSocket is not connected")
+            raise _SessionLost("WebSocket is not connected", sent=sent)
         except Exception as e:
             raise AnsibleConnectionFailure("Error during command execution") from e
 
+    def _send_stdin(self, messages):
+        """Send each of ``messages`` to the stdin channel."""
+        for data in messages:
+            message = bytes([STD_IN_CHANNEL]) + data
+            self._ws.send(message)
+            self._count_frame("sent", message)
+
+    def _receive_until(self, end, output, err_output, deadline):
+        """Receive command output until ``end`` shows up on stdout.
+
+        Stdout and stderr are appended to ``output`` and ``err_output``.
+
+        Returns:
+            The index of ``end`` in ``output``, and the monotonic time of the first message received.
+        """
+        first_byte_at = None
+        while True:
+            msg = self._ws.recv(timeout=max(deadline - time.monotonic(), 0) if deadline else None)
+            if first_byte_at is None:
+                first_byte_at = time.monotonic()
+            self._count_frame("received", msg)
+            channel = msg[0]
+            content = msg[1:]
+
+            if channel == STD_OUT_CHANNEL:
+                # Only search the new content, plus enough of the old for a marker split
+                # across messages
+                search_from = max(len(output) - len(end) + 1, 0)
+                output += content
+                end_at = output.find(end, search_from)
+                if end_at != -1:
+                    return end_at, first_byte_at
+            elif channel == STD_ERR_CHANNEL:
+                err_output += content
+            elif channel == STREAM_ERR_CHANNEL:
+                raise Exception("Stream error occurred: " + content.decode(errors="ignore"))
+
     def put_file(self, in_path, out_path):
         """Upload a file by streaming its contents over stdin."""
+        if self._close_if_idle() or not self._ws:
+            self._connect()
         try:
-            # Read file contents and encode in base64
             with open(in_path, 'rb') as f:
                 content = f.read()
 
-            b64content = base64.b64encode(content).decode()
-
-            # Create a command that will decode the base64 data and write to the output file
-            cmd = f"mkdir -p $(dirname '{out_path}') && cat << '{PUT_FILE_MARKER}' | base64 -d > '{out_path}'\n{b64content}\n{PUT_FILE_MARKER}"
-
             self._display.vvv(f"Copying file to {out_path}")
+            started = time.monotonic()
+
+            self._upload_file(content, out_path)
 
-            self._send_command(cmd, CommandType.PUT)
+            self._count_transfer("put", len(content), started)
         except Exception as e:
             raise AnsibleConnectionFailure("put_file failed") from e
 
-    def fetch_file(self, in_path, out_path):
-        """Download a file from the remote system to the local system."""
+    def put_archive(self, in_path, out_path):
+        """Unpack a local gzip compressed tar archive into a remote directory.
+
+        The archive is uploaded next to its destination like any other file, then unpacked
+        and removed by a single command, so that copying a whole directory tree costs
+        about as much as copying one file.
+        """
+        if self._close_if_idle() or not self._ws:
+            self._connect()
         try:
-            self._display.vvv(f"Fetching file from {in_path} to {out_path}")
+            with open(in_path, 'rb') as f:
+                content = f.read()
 
-            # Read the remote file and encode it as base64
-            cmd = f"cat '{in_path}' 2>/dev/null | base64"
-            stdout, stderr = self._send_command(cmd, CommandType.FETCH)
+            self._display.vvv(f"Unpacking archive into {out_path}")
+            started = time.monotonic()
 
-            if stderr:
-                raise AnsibleConnectionFailure(f"Error reading remote file: {stderr}")
+            archive_path = posixpath.join(out_path, f".ansible-archive-{secrets.token_hex(8)}.tar.gz")
+            self._upload_file(content, archive_path)
+            cmd = (
+                f"tar -xzf '{archive_path}' -C '{out_path}'; rc=$?; rm -f '{archive_path}'; "
+                f"[ $rc -eq 0 ] && echo {PUT_FILE_MARKER}"
+            )
+            # Not resent, the archive is gone once a first attempt ran
+            self._with_reconnect(lambda: self._run_put_command(cmd, out_path))
 
-            if not stdout:
-                raise AnsibleConnectionFailure(f"Remote file {in_path} not found or is empty")
+            self._count_transfer("put", len(content), started)
+        except Exception as e:
+            raise AnsibleConnectionFailure("put_archive failed") from e
 
-            # Decode the base64 content
-            try:
-                content = base64.b64decode(stdout)
-            except Exception as e:
-                raise AnsibleConnectionFailure(f"Failed to decode base64 content: {e}") from e
+    def fetch_file(self, in_path, out_path):
+        """Download a file from the remote system to the local system."""
+        if self._close_if_idle() or not self._ws:
+            self._connect()
+        try:
+            self._display.vvv(f"Fetching file from {in_path} to {out_path}")
+            started = time.monotonic()
+
+            compressed = None
+            if self.fetch_compression == 'gzip':
+                compressed = self._with_reconnect(lambda: self._fetch_file_gzip(in_path), resend=True)
+            if compressed is None:
+                if self.transfer_mode == 'binary':
+                    content = self._with_reconnect(lambda: self._fetch_file_binary(in_path), resend=True)
+                else:
+                    content = self._with_reconnect(lambda: self._fetch_file_base64(in_path), resend=True)
 
             # Create the local directory if it doesn't exist
             local_dir = os.path.dirname(out_path)
@@ -444,22 +1207,194 @@ class Connection(ConnectionBase):
 
             # Write the content to the local file
             with open(out_path, 'wb') as f:
-                f.write(content)
+                if compressed is None:
+                    f.write(content)
+                    size = len(content)
+                else:
+                    size = _gunzip_to(compressed, f)
+                    self._display.vvv(f"Fetched {size} bytes of {in_path} as {len(compressed)} compressed bytes")
+            self._count_transfer("fetch", size, started)
         except Exception as e:
             raise AnsibleConnectionFailure(f"fetch_file failed {e}") from e
 
+    def _upload_file(self, content, out_path):
+        """Upload the whole content of a file."""
+        # Chunks only pay for their extra commands when the upload can resume after a reconnect
+        if len(content) > PUT_CHUNK_SIZE and self.reconnect_retries > 0:
+            self._put_file_chunked(content, out_path)
+        elif self.transfer_mode == 'binary':
+            self._with_reconnect(lambda: self._put_file_binary(content, out_path), resend=True)
+        else:
+            # Create a command that will decode the base64 data and write to the output file
+            b64content = base64.b64encode(content).decode()
+            cmd = f"mkdir -p $(dirname '{out_path}') && cat << '{PUT_FILE_MARKER}' | base64 -d > '{out_path}'\n{b64content}\n{PUT_FILE_MARKER}"
+            self._with_reconnect(lambda: self._send_command(cmd, CommandType.PUT), resend=True)
+
+    def _fetch_file_base64(self, in_path):
+        """Read a remote file encoded as base64 text."""
+        cmd = f"cat '{in_path}' 2>/dev/null | base64"
+        stdout, stderr = self._send_command(cmd, CommandType.FETCH)
+
+        if stderr:
+            raise AnsibleConnectionFailure(f"Error reading remote file: {stderr}")
+
+        if not stdout:
+            raise AnsibleConnectionFailure(f"Remote file {in_path} not found or is empty")
+
+        # Decode the base64 content
+        try:
+            return base64.b64decode(stdout)
+        except Exception as e:
+            raise AnsibleConnectionFailure(f"Failed to decode base64 content: {e}") from e
+
+    def _put_file_binary(self, content, out_path):
+        """Write raw bytes to a remote file.
+
+        The device reads exactly len(content) bytes from stdin with ``head -c``.  The bytes
+        are consumed even if the file cannot be written, so that they are never run as
+        shell commands.
+        """
+        size = len(content)
+        cmd = (
+            f"if mkdir -p \"$(dirname '{out_path}')\" && : > '{out_path}'; "
+            f"then head -c {size} > '{out_path}' && echo {PUT_FILE_MARKER}; "
+            f"else head -c {size} > /dev/null; fi"
+        )
+        self._run_put_command(cmd, out_path, payload=content)
+
+    def _put_file_chunked(self, content, out_path):
+        """Upload a large file in chunks, resuming after a reconnect.
+
+        Chunks are appended to a partial file next to ``out_path``, which is moved into place
+        once complete.  After a reconnect the partial file is checked against the local
+        content, and the upload resumes from the last chunk boundary that matches.
+        """
+        part_path = f"{out_path}.part"
+        progress = {"started": False, "offset": 0}
+
+        def upload():
+            if progress["started"]:
+                progress["offset"] = self._verified_offset(part_path, content)
+                self._display.vvv(f"Resuming upload of {out_path} at byte {progress['offset']}")
+            progress["started"] = True
+
+            if progress["offset"] == 0:
+                self._run_put_command(f"mkdir -p \"$(dirname '{part_path}')\" && : > '{part_path}' && echo {PUT_FILE_MARKER}", part_path)
+            while progress["offset"] < len(content):
+                chunk = content[progress["offset"]:progress["offset"] + PUT_CHUNK_SIZE]
+                self._append_chunk(chunk, part_path)
+                progress["offset"] += len(chunk)
+            self._run_put_command(f"mv -f '{part_path}' '{out_path}' && echo {PUT_FILE_MARKER}", out_path)
+
+        self._with_reconnect(upload, resend=True)
+
+    def _run_put_command(self, cmd, path, payload=None):
+        """Run a command writing to ``path``, which must echo PUT_FILE_MARKER once it succeeded."""
+        stdout, stderr = self._send_command_raw(cmd, CommandType.PUT, payload=payload)
+        if PUT_FILE_MARKER.encode() not in stdout:
+            raise AnsibleConnectionFailure(f"Unable to write remote file {path}: {stderr.decode(errors='ignore').strip()}")
+
+    def _append_chunk(self, chunk, part_path):
+        """Append a chunk of the file being uploaded to the partial file."""
+        if self.transfer_mode == 'binary':
+            cmd = (
+                f"if [ -w '{part_path}' ]; then head -c {len(chunk)} >> '{part_path}' && echo {PUT_FILE_MARKER}; "
+                f"else head -c {len(chunk)} > /dev/null; fi"
+            )
+            self._run_put_command(cmd, part_path, payload=chunk)
+        else:
+            b64chunk = base64.b64encode(chunk).decode()
+            cmd = f"cat << '{PUT_FILE_MARKER}' | base64 -d >> '{part_path}' && echo {PUT_FILE_MARKER}\n{b64chunk}\n{PUT_FILE_MARKER}"
+            self._run_put_command(cmd, part_path)
+
+    def _verified_offset(self, part_path, content):
+        """Return how many bytes of the partial upload can be kept, truncating the rest."""
+        stdout, _stderr = self._send_command(f"wc -c < '{part_path}' 2>/dev/null || echo 0", CommandType.PUT)
+        try:
+            size = int(stdout.split()[0])
+        except (IndexError, ValueError):
+            return 0
+
+        offset = min(size, len(content)) // PUT_CHUNK_SIZE * PUT_CHUNK_SIZE
+        if offset == 0:
+            return 0
+        stdout, _stderr = self._send_command(
+            f"dd if=/dev/null of='{part_path}' bs=1 seek={offset} 2>/dev/null; head -c {offset} '{part_path}' | sha256sum",
+            CommandType.PUT,
+        )
+        if stdout.split()[:1] != [hashlib.sha256(content[:offset]).hexdigest()]:
+            return 0
+        return offset
+
+    def _fetch_file_gzip(self, in_path):
+        """Read a remote file compressed with gzip, returns None if the device has no gzip.
+
+        The compressed data is preceded by a status line, it is sent as base64 text unless
+        the transfer mode is binary.  It is returned whole, the caller decompresses it.
+        """
+        encode = "" if self.transfer_mode == 'binary' else " | base64"
+        cmd = (
+            f"if ! command -v gzip > /dev/null 2>&1; then echo -2; "
+            f"elif [ -f '{in_path}' ] && [ -r '{in_path}' ]; then echo 0; gzip -c '{in_path}'{encode}; "
+            f"else echo -1; fi"
+        )
+        stdout, stderr = self._send_command_raw(cmd, CommandType.FETCH)
+
+        status, _sep, data = stdout.partition(b"\n")
+        status = status.strip()
+        if status == b"-2":
+            self._display.vvv("gzip is not available on the device, fetching uncompressed")
+            return None
+        if status == b"-1":
+            raise AnsibleConnectionFailure(f"Remote file {in_path} not found")
+        if status != b"0":
+            raise AnsibleConnectionFailure(f"Unexpected response reading remote file: {stderr.decode(errors='ignore')}")
+
+        if self.transfer_mode == 'binary':
+            return data
+        try:
+            return base64.b64decode(data)
+        except Exception as e:
+            raise AnsibleConnectionFailure(f"Failed to decode base64 content: {e}") from e
+
+    def _fetch_file_binary(self, in_path):
+        """Read a remote file as raw bytes preceded by its length."""
+        cmd = f"if [ -f '{in_path}' ] && [ -r '{in_path}' ]; then wc -c < '{in_path}'; cat '{in_path}'; else echo -1; fi"
+        stdout, stderr = self._send_command_raw(cmd, CommandType.FETCH)
+
+        header, _sep, data = stdout.partition(b"\n")
+        try:
+            size = int(header.strip())
+        except ValueError as e:
+            raise AnsibleConnectionFailure(f"Unexpected response reading remote file: {stderr.decode(errors='ignore')}") from e
+
+        if size < 0:
+            raise AnsibleConnectionFailure(f"Remote file {in_path} not found")
+        if len(data) < size:
+            raise AnsibleConnectionFailure(f"Remote file {in_path} was truncated, got {len(data)} of {size} bytes")
+        return data[:size]
+
     def reset(self):
         """Reset the connection to the device."""
         self._display.vvv("Resetting connection")
+        if isinstance(self._ws, console_mux.MuxClient):
+            # Tear down the shared session so that a fresh one is opened below
+            self._ws.shutdown()
         self.close()
         self._connect()
 
     def close(self):
         """Close websocket if open."""
         if self._ws:
+            sock = getattr(self._ws, 'socket', None)
+            if isinstance(sock, ssl.SSLSocket) and isinstance(sock.context, ResumableSSLContext):
+                sock.context.remember_session(sock)
+            self._report_compression()
+            self._report_stats()
             try:
                 self._ws.close()
             except Exception as e:
                 self._display.vvv(f"Error closing WebSocket: {e}")
             finally:
                 self._ws = None
+                self._zygote = None
@@ -63,4 +63,28 @@ options:
     - If value not set, will try environment variable C(FLIGHTCTL_CA_PATH).
     type: path
     aliases: [ ca_path ]
+  flightctl_pool_maxsize:
+    description:
+    - Maximum number of connections to the Flight Control service kept open for reuse.
+    - Defaults to the client default of 5, or to the number of requests sent at the same time if that is higher.
+    - If value not set, will try environment variable C(FLIGHTCTL_POOL_MAXSIZE).
+    type: int
+    version_added: 1.7.0
+  flightctl_max_retries:
+    description:
+    - Number of times a request is retried after a connection error, or a C(429), C(502), C(503) or C(504)
+      response, with an exponential backoff that honors the C(Retry-After) header.
+    - Responses to requests that are not idempotent, like C(PATCH) and C(POST), are not retried.
+    - Defaults to the retries of the HTTP library, which only retries connection errors.
+    - If value not set, will try environment variable C(FLIGHTCTL_MAX_RETRIES).
+    type: int
+    version_added: 1.7.0
+  flightctl_keepalive:
+    description:
+    - Whether to send TCP keep-alive probes on open connections, so that connections kept open for reuse are not
+      dropped silently by firewalls and load balancers while idle.
+    - If value not set, will try environment variable C(FLIGHTCTL_KEEPALIVE).
+    type: bool
+    default: false
+    version_added: 1.7.0
 """
@@ -6,17 +6,17 @@ from __future__ import (absolute_import, division, print_function)
 
 __metaclass__ = type
 
-import importlib
+import threading
 from datetime import datetime
 from base64 import b64encode
 from dataclasses import dataclass
 from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple
 
-from .constants import API_MAPPING, NESTED_RESOURCES, ResourceType
+from .constants import API_MAPPING, NESTED_RESOURCES, ResourceType, resolve_for_version as _resolve_for_version
 from .core import FlightctlModule
 from .exceptions import FlightctlException, FlightctlApiException
 from .options import ApprovalOptions, GetOptions
-from .utils import diff_dicts, get_patch, json_patch
+from .utils import get_patch, get_patch_and_diff
 
 
 try:
@@ -33,10 +33,6 @@ try:
     from flightctl.models.certificate_signing_request_status import CertificateSigningRequestStatus
     from flightctl.models.device_decommission import DeviceDecommission
     from flightctl.models.device_decommission_target_type import DeviceDecommissionTargetType
-
-    from flightctl.v1alpha1.api_client import ApiClient as V1Alpha1ApiClient
-    from flightctl.v1alpha1.configuration import Configuration as V1Alpha1Configuration
-
 except ImportError as imp_exc:
     ListMeta = None
     CLIENT_IMPORT_ERROR = imp_exc
@@ -44,15 +40,12 @@ else:
     CLIENT_IMPORT_ERROR = None
 
 
-def _resolve_for_version(api_version: str, submodule: str, class_name: str):
-    """Resolve a version-specific class from the flightctl client library.
+# Names looked up per list request when prefetching, and the page size of those requests
+PREFETCH_NAMES_PER_REQUEST = 50
+PREFETCH_PAGE_SIZE = 1000
 
-    Maps an API version string (e.g. ``"v1beta1"``, ``"v1alpha1"``) to the
-    correct client package and imports ``<class_name>`` from ``<submodule>``.
-    """
-    pkg = "flightctl" if api_version == "v1beta1" else f"flightctl.{api_version}"
-    mod = importlib.import_module(f"{pkg}.{submodule}")
-    return getattr(mod, class_name)
+# Attempts of an optimistic update, which is computed again after each conflict
+OPTIMISTIC_UPDATE_ATTEMPTS = 3
 
 
 class ResourceProtocol(Protocol):
@@ -94,6 +87,11 @@ class FlightctlAPIModule(FlightctlModule):
     like GET, POST, PATCH, and DELETE.
     """
 
+    # A process that runs modules one after the other, like the API worker of the flightctl_resource
+    # action, sets this to a dict to keep the clients, and their open connections, between modules
+    client_cache: Optional[Dict[Any, Any]] = None
+    _clients_lock = threading.Lock()
+
     def __init__(
         self,
         argument_spec: Dict[str, Any],
@@ -126,24 +124,59 @@ class FlightctlAPIModule(FlightctlModule):
         if not host_url.endswith('/api/v1'):
             host_url = f"{host_url}/api/v1"
 
-        client_config = Configuration(
-            host=host_url,
-            ssl_ca_cert=self.ca_path,
+        self.set_auth()
+
+        # Clients only hold connection settings, the credentials are sent with each request
+        clients_key = (
+            host_url, self.ca_path, self.verify_ssl, self.organization, self.params.get("parallelism"),
+            self.params.get("flightctl_pool_maxsize"), self.params.get("flightctl_max_retries"),
+            self.params.get("flightctl_keepalive"),
         )
-        client_config.verify_ssl = self.verify_ssl
+        clients = self.client_cache.get(clients_key) if self.client_cache is not None else None
+        if clients is None:
+            client_config = Configuration(
+                host=host_url,
+                ssl_ca_cert=self.ca_path,
+            )
+            client_config.verify_ssl = self.verify_ssl
+            # Definitions applied concurrently each need a connection
+            self.configure_connections(client_config, min_pool_maxsize=self.params.get("parallelism") or 1)
 
-        self.set_auth()
+            client = ApiClient(client_config)
+            self._set_org_id_query_param(client)
+            clients = {"v1beta1": client}
+            if self.client_cache is not None:
+                self.client_cache[clients_key] = clients
 
-        self.client = ApiClient(client_config)
-        self._set_org_id_query_param(self.client)
+        self._clients: Dict[str, Any] = clients
+        self.client = clients["v1beta1"]
 
-        v1alpha1_config = V1Alpha1Configuration(
-            host=host_url,
-            ssl_ca_cert=self.ca_path,
-        )
-        v1alpha1_config.verify_ssl = self.verify_ssl
-        self.v1alpha1_client = V1Alpha1ApiClient(v1alpha1_config)
-        self._set_org_id_query_param(self.v1alpha1_client)
+        # API instances by API class and client, they hold no state of their own
+        self._api_instances: Dict[Tuple[Any, Any], Any] = {}
+
+    @property
+    def v1alpha1_client(self) -> Any:
+        """
+        The client of the v1alpha1 API, created on first use.
+
+        Its package is only imported by modules that manage v1alpha1 resources.
+        """
+        with self._clients_lock:
+            if "v1alpha1" not in self._clients:
+                config_cls = _resolve_for_version("v1alpha1", "configuration", "Configuration")
+                client_cls = _resolve_for_version("v1alpha1", "api_client", "ApiClient")
+
+                v1alpha1_config = config_cls(
+                    host=self.client.configuration.host,
+                    ssl_ca_cert=self.ca_path,
+                )
+                v1alpha1_config.verify_ssl = self.verify_ssl
+                client = client_cls(v1alpha1_config)
+                # Both clients talk to the same server, they share its connections
+                client.rest_client.pool_manager = self.client.rest_client.pool_manager
+                self._set_org_id_query_param(client)
+                self._clients["v1alpha1"] = client
+            return self._clients["v1alpha1"]
 
     def _set_org_id_query_param(self, client) -> None:
         """
@@ -202,6 +235,14 @@ class FlightctlAPIModule(FlightctlModule):
             _request_timeout=self.request_timeout,
         )
 
+    def _get_api(self, api_cls: Any, client: Any) -> Any:
+        """Returns the instance of a generated API class for a client, creating it on first use."""
+        key = (api_cls, client)
+        api_instance = self._api_instances.get(key)
+        if api_instance is None:
+            api_instance = self._api_instances.setdefault(key, api_cls(client))
+        return api_instance
+
     def _get_client(self, resource: ResourceType):
         """Returns the appropriate ApiClient based on the resource's api_version."""
         api_type = API_MAPPING[resource]
@@ -226,7 +267,7 @@ class FlightctlAPIModule(FlightctlModule):
             FlightctlException: If the approval request fails.
         """
         api_type = API_MAPPING[options.resource]
-        api_instance = api_type.api(self._get_client(options.resource))
+        api_instance = self._get_api(api_type.api, self._get_client(options.resource))
 
         if options.resource is ResourceType.DEVICE and options.rendered:
             get_call = getattr(api_instance, api_type.rendered)
@@ -262,7 +303,7 @@ class FlightctlAPIModule(FlightctlModule):
             FlightctlException: If the approval request fails.
         """
         api_type = API_MAPPING[options.resource]
-        api_instance = api_type.api(self._get_client(options.resource))
+        api_instance = self._get_api(api_type.api, self._get_client(options.resource))
         list_call = getattr(api_instance, api_type.list)
         api_exc = _resolve_for_version(api_type.api_version, "exceptions", "ApiException")
 
@@ -304,6 +345,50 @@ class FlightctlAPIModule(FlightctlModule):
                 summary=getattr(response, 'summary', None)
             )
 
+    def list_by_names(
+        self, resource: ResourceType, names: List[str],
+        fleet_name: Optional[str] = None, catalog_name: Optional[str] = None,
+    ) -> Dict[str, ResourceProtocol]:
+        """
+        Fetches many resources of one kind by name, with paginated list requests.
+
+        Names are looked up in chunks with a ``metadata.name in (...)`` field selector,
+        instead of one get request per name.
+
+        Args:
+            resource (ResourceType): The API Resource Type.
+            names (List[str]): The names of the resources.
+            fleet_name (Optional[str]): The owning fleet, for TemplateVersion.
+            catalog_name (Optional[str]): The owning catalog, for CatalogItem.
+
+        Returns:
+            Dict[str, ResourceProtocol]: The resources found, by name.
+
+        Raises:
+            FlightctlApiException: If a list request fails, for instance when the server
+            does not support the field selector.
+        """
+        found: Dict[str, ResourceProtocol] = {}
+        names = sorted(set(names))
+        for start in range(0, len(names), PREFETCH_NAMES_PER_REQUEST):
+            chunk = names[start:start + PREFETCH_NAMES_PER_REQUEST]
+            options = GetOptions(
+                resource=resource,
+                fleet_name=fleet_name,
+                catalog_name=catalog_name,
+                field_selector=f"metadata.name in ({','.join(chunk)})",
+                limit=PREFETCH_PAGE_SIZE,
+            )
+            while True:
+                response = self.list(options)
+                for item in response.items or []:
+                    found[item.metadata.name] = item
+                continue_token = response.metadata.var_continue if response.metadata else None
+                if not continue_token:
+                    break
+                options.continue_token = continue_token
+        return found
+
     def create(
         self, resource: ResourceType, definition: Dict[str, Any],
         parent_name: Optional[str] = None,
@@ -323,7 +408,7 @@ class FlightctlAPIModule(FlightctlModule):
             FlightctlException: If the creation fails.
         """
         api_type = API_MAPPING[resource]
-        api_instance = api_type.api(self._get_client(resource))
+        api_instance = self._get_api(api_type.api, self._get_client(resource))
         create_call = getattr(api_instance, api_type.create)
         api_exc = _resolve_for_version(api_type.api_version, "exceptions", "ApiException")
 
@@ -337,7 +422,7 @@ class FlightctlAPIModule(FlightctlModule):
 
     def update(
         self, resource: ResourceType, existing_obj: ResourceProtocol, definition: Dict[str, Any],
-        parent_name: Optional[str] = None,
+        parent_name: Optional[str] = None, optimistic: bool = False,
     ) -> Tuple[bool, Dict[str, Any]]:
         """
         Updates an existing resource.
@@ -351,6 +436,8 @@ class FlightctlAPIModule(FlightctlModule):
             existing (Dict[str, Any]): The current state of the resource.
             definition (Dict[str, Any]): The desired state of the resource.
             parent_name (Optional[str]): Parent resource name for nested resources.
+            optimistic (bool): Send the patch without applying it locally first, guarded by
+                the resourceVersion of ``existing``.  See update_optimistic.
 
         Returns:
             Tuple[bool, Dict[str, Any]]:
@@ -360,35 +447,105 @@ class FlightctlAPIModule(FlightctlModule):
         Raises:
             FlightctlException: If the update fails or there are errors with the patch.
         """
+        if optimistic:
+            return self.update_optimistic(resource, existing_obj, definition, parent_name)
+
         changed: bool = False
         existing = existing_obj.to_dict()
         name = existing["metadata"]["name"]
 
-        patch = get_patch(existing, definition)
-        obj, error = json_patch(existing, patch)
-        if error:
-            raise FlightctlException(f"There was an error with json_patch: {error}")
-
-        match, diffs = diff_dicts(existing, obj)
+        patch, diffs = get_patch_and_diff(existing, definition)
         if diffs:
-            api_type = API_MAPPING[resource]
-            api_instance = api_type.api(self._get_client(resource))
-            patch_call = getattr(api_instance, api_type.patch)
-            patch_cls = _resolve_for_version(api_type.api_version, "models.patch_request_inner", "PatchRequestInner")
-            api_exc = _resolve_for_version(api_type.api_version, "exceptions", "ApiException")
-
+            api_exc = _resolve_for_version(API_MAPPING[resource].api_version, "exceptions", "ApiException")
             try:
-                patch_params = [patch_cls.from_dict(p) for p in patch]
-                if resource in NESTED_RESOURCES and parent_name:
-                    response = self.call_api(patch_call, parent_name, name, patch_params)
-                else:
-                    response = self.call_api(patch_call, name, patch_params)
+                response = self._patch(resource, name, patch, parent_name)
                 changed |= True
             except api_exc as e:
                 raise FlightctlApiException(f"Unable to update {resource.value}: {e}")
 
         return changed, (response if diffs else existing_obj)
 
+    def update_optimistic(
+        self, resource: ResourceType, existing_obj: ResourceProtocol, definition: Dict[str, Any],
+        parent_name: Optional[str] = None,
+    ) -> Tuple[bool, Dict[str, Any]]:
+        """
+        Updates an existing resource with a patch guarded by its resourceVersion.
+
+        The patch is sent as computed, without applying it locally and diffing the result.
+        A ``test`` operation on ``/metadata/resourceVersion`` makes the server reject it if
+        the resource changed since ``existing_obj`` was read.  The server answers a failed
+        ``test`` like any patch it cannot apply, with 400 Bad Request, so a rejected patch
+        is only a conflict if the resource has a new resourceVersion when read again.  On
+        a conflict, or a 409, the patch is computed again, up to OPTIMISTIC_UPDATE_ATTEMPTS
+        times.
+
+        Args:
+            resource(ResourceType): The type of resource to update.
+            existing_obj (ResourceProtocol): The current state of the resource.
+            definition (Dict[str, Any]): The desired state of the resource.
+            parent_name (Optional[str]): Parent resource name for nested resources.
+
+        Returns:
+            Tuple[bool, Dict[str, Any]]: Whether the resource was updated, and the updated
+            resource, or the existing resource if it was already up to date.
+
+        Raises:
+            FlightctlApiException: If the update fails, or still conflicts after the last attempt.
+        """
+        api_version = API_MAPPING[resource].api_version
+        api_exc = _resolve_for_version(api_version, "exceptions", "ApiException")
+        conflict_exc = _resolve_for_version(api_version, "exceptions", "ConflictException")
+        bad_request_exc = _resolve_for_version(api_version, "exceptions", "BadRequestException")
+        name = definition["metadata"]["name"]
+
+        for _attempt in range(OPTIMISTIC_UPDATE_ATTEMPTS):
+            existing = existing_obj.to_dict()
+            patch = get_patch(existing, definition)
+            if not patch:
+                return False, existing_obj
+
+            resource_version = existing["metadata"].get("resourceVersion")
+            if resource_version:
+                patch.insert(0, {"op": "test", "path": "/metadata/resourceVersion", "value": resource_version})
+            try:
+                return True, self._patch(resource, name, patch, parent_name)
+            except (conflict_exc, bad_request_exc) as e:
+                if isinstance(e, bad_request_exc) and not resource_version:
+                    raise FlightctlApiException(f"Unable to update {resource.value}: {e}")
+                existing_obj = self.get(GetOptions(
+                    resource=resource,
+                    name=name,
+                    fleet_name=parent_name if resource is ResourceType.TEMPLATE_VERSION else None,
+                    catalog_name=parent_name if resource is ResourceType.CATALOG_ITEM else None,
+                ))
+                if existing_obj is None:
+                    raise FlightctlApiException(f"Unable to update {resource.value} - {name}: it was deleted")
+                current_version = existing_obj.to_dict()["metadata"].get("resourceVersion")
+                if isinstance(e, bad_request_exc) and current_version == resource_version:
+                    # The test held, the server rejected the rest of the patch
+                    raise FlightctlApiException(f"Unable to update {resource.value}: {e}")
+            except api_exc as e:
+                raise FlightctlApiException(f"Unable to update {resource.value}: {e}")
+
+        raise FlightctlApiException(
+            f"Unable to update {resource.value} - {name}: it changed on every one of {OPTIMISTIC_UPDATE_ATTEMPTS} attempts"
+        )
+
+    def _patch(
+        self, resource: ResourceType, name: str, patch: List[Dict[str, Any]], parent_name: Optional[str] = None,
+    ) -> ResourceProtocol:
+        """Sends a JSON patch for a resource, returns the patched resource."""
+        api_type = API_MAPPING[resource]
+        api_instance = self._get_api(api_type.api, self._get_client(resource))
+        patch_call = getattr(api_instance, api_type.patch)
+        patch_cls = _resolve_for_version(api_type.api_version, "models.patch_request_inner", "PatchRequestInner")
+
+        patch_params = [patch_cls.from_dict(p) for p in patch]
+        if resource in NESTED_RESOURCES and parent_name:
+            return self.call_api(patch_call, parent_name, name, patch_params)
+        return self.call_api(patch_call, name, patch_params)
+
     def replace(
             self, resource: ResourceType, definition: Dict[str, Any],
             parent_name: Optional[str] = None,
@@ -408,7 +565,7 @@ class FlightctlAPIModule(FlightctlModule):
         """
         name = definition["metadata"]["name"]
         api_type = API_MAPPING[resource]
-        api_instance = api_type.api(self._get_client(resource))
+        api_instance = self._get_api(api_type.api, self._get_client(resource))
         replace_call = getattr(api_instance, api_type.replace)
         api_exc = _resolve_for_version(api_type.api_version, "exceptions", "ApiException")
 
@@ -436,7 +593,7 @@ class FlightctlAPIModule(FlightctlModule):
             raise FlightctlApiException("A resource name must be provided for deletion.")
 
         api_type = API_MAPPING[resource]
-        api_instance = api_type.api(self._get_client(resource))
+        api_instance = self._get_api(api_type.api, self._get_client(resource))
         delete_call = getattr(api_instance, api_type.delete)
         api_exc = _resolve_for_version(api_type.api_version, "exceptions", "ApiException")
         try:
@@ -462,14 +619,14 @@ class FlightctlAPIModule(FlightctlModule):
         if input.resource is ResourceType.ENROLLMENT:
             # Enrollment requests require an additional body argument
             # TODO clean up the dict params -> input -> dict -> request serialization steps
-            api_instance = EnrollmentrequestApi(self.client)
+            api_instance = self._get_api(EnrollmentrequestApi, self.client)
             body = EnrollmentRequestApproval.from_dict(input.to_request_params())
             try:
                 self.call_api(api_instance.approve_enrollment_request, input.name, body)
             except ApiException as e:
                 raise FlightctlApiException(f"Unable to approve {input.resource.value} - {input.name}: {e}")
         else:
-            api_instance = CertificatesigningrequestApi(self.client)
+            api_instance = self._get_api(CertificatesigningrequestApi, self.client)
             try:
                 csr = self.call_api(api_instance.get_certificate_signing_request, input.name)
 
@@ -521,7 +678,7 @@ class FlightctlAPIModule(FlightctlModule):
             FlightctlApiException: If the request fails.
         """
         api_type = API_MAPPING[ResourceType.DEVICE]
-        api_instance = api_type.api(self.client)
+        api_instance = self._get_api(api_type.api, self.client)
 
         if not hasattr(api_instance, "decommission_device"):
             raise FlightctlException(f"Decommissioning is not supported for resource type {ResourceType.DEVICE}")
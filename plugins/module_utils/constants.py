@@ -6,9 +6,11 @@ from __future__ import (absolute_import, division, print_function)
 
 __metaclass__ = type
 
+import functools
+import importlib
 from dataclasses import dataclass
 from enum import Enum
-from typing import Optional, Union
+from typing import Any, Optional
 
 
 class ResourceType(Enum):
@@ -32,182 +34,171 @@ LIST_ONLY_RESOURCES = frozenset({ResourceType.EVENT, ResourceType.ORGANIZATION})
 
 NESTED_RESOURCES = frozenset({ResourceType.TEMPLATE_VERSION, ResourceType.CATALOG_ITEM})
 
-API_MAPPING = {}
-
-
-try:
-    # v1beta1 Apis
-    from flightctl.api.authprovider_api import AuthproviderApi
-    from flightctl.api.device_api import DeviceApi
-    from flightctl.api.event_api import EventApi
-    from flightctl.api.fleet_api import FleetApi
-    from flightctl.api.certificatesigningrequest_api import CertificatesigningrequestApi
-    from flightctl.api.enrollmentrequest_api import EnrollmentrequestApi
-    from flightctl.api.organization_api import OrganizationApi
-    from flightctl.api.repository_api import RepositoryApi
-    from flightctl.api.resourcesync_api import ResourcesyncApi
-
-    # v1beta1 Models
-    from flightctl.models.auth_provider import AuthProvider
-    from flightctl.models.device import Device
-    from flightctl.models.event import Event
-    from flightctl.models.fleet import Fleet
-    from flightctl.models.certificate_signing_request import CertificateSigningRequest
-    from flightctl.models.enrollment_request import EnrollmentRequest
-    from flightctl.models.organization import Organization
-    from flightctl.models.repository import Repository
-    from flightctl.models.resource_sync import ResourceSync
-    from flightctl.models.enrollment_config import EnrollmentConfig
-    from flightctl.models.template_version import TemplateVersion
-
-    # v1alpha1 Apis
-    from flightctl.v1alpha1.api.catalog_api import CatalogApi
-
-    # v1alpha1 Models
-    from flightctl.v1alpha1.models.catalog import Catalog
-    from flightctl.v1alpha1.models.catalog_item import CatalogItem
-
-    @dataclass
-    class ApiResource:
-        api: Union[
-            AuthproviderApi, CatalogApi, DeviceApi, EventApi, FleetApi,
-            CertificatesigningrequestApi, EnrollmentrequestApi,
-            OrganizationApi, RepositoryApi, ResourcesyncApi,
-        ]
-        model: Union[
-            AuthProvider, Catalog, CatalogItem, Device, Event, Fleet,
-            CertificateSigningRequest, EnrollmentRequest, Organization,
-            Repository, ResourceSync, EnrollmentConfig, TemplateVersion,
-        ]
-
-        api_version: str = "v1beta1"
-        get: Optional[str] = None
-        create: Optional[str] = None
-        list: Optional[str] = None
-        delete: Optional[str] = None
-        patch: Optional[str] = None
-        replace: Optional[str] = None
-        rendered: Optional[str] = None
-        decommission: Optional[str] = None
-
-    API_MAPPING = {
-        ResourceType.AUTH_PROVIDER: ApiResource(
-            api=AuthproviderApi,
-            model=AuthProvider,
-            get='get_auth_provider',
-            create='create_auth_provider',
-            list='list_auth_providers',
-            patch='patch_auth_provider',
-            replace='replace_auth_provider',
-            delete='delete_auth_provider',
-        ),
-        ResourceType.CATALOG: ApiResource(
-            api=CatalogApi,
-            model=Catalog,
-            api_version='v1alpha1',
-            get='get_catalog',
-            create='create_catalog',
-            list='list_catalogs',
-            patch='patch_catalog',
-            replace='replace_catalog',
-            delete='delete_catalog',
-        ),
-        ResourceType.CATALOG_ITEM: ApiResource(
-            api=CatalogApi,
-            model=CatalogItem,
-            api_version='v1alpha1',
-            get='get_catalog_item',
-            create='create_catalog_item',
-            list='list_catalog_items',
-            patch='patch_catalog_item',
-            replace='replace_catalog_item',
-            delete='delete_catalog_item',
-        ),
-        ResourceType.DEVICE: ApiResource(
-            api=DeviceApi,
-            model=Device,
-            get='get_device',
-            create='create_device',
-            list='list_devices',
-            patch='patch_device',
-            replace='replace_device',
-            delete='delete_device',
-            rendered='get_rendered_device',
-            decommission='decommission_device'
-
-        ),
-        ResourceType.FLEET: ApiResource(
-            api=FleetApi,
-            model=Fleet,
-            get='get_fleet',
-            create='create_fleet',
-            list='list_fleets',
-            patch='patch_fleet',
-            replace='replace_fleet',
-            delete='delete_fleet',
-        ),
-        ResourceType.CSR: ApiResource(
-            api=CertificatesigningrequestApi,
-            model=CertificateSigningRequest,
-            get='get_certificate_signing_request',
-            create='create_certificate_signing_request',
-            list='list_certificate_signing_requests',
-            patch='patch_certificate_signing_request',
-            replace='replace_certificate_signing_request',
-            delete='delete_certificate_signing_request',
-        ),
-        ResourceType.ENROLLMENT: ApiResource(
-            api=EnrollmentrequestApi,
-            model=EnrollmentRequest,
-            get='get_enrollment_request',
-            create='create_enrollment_request',
-            list='list_enrollment_requests',
-            replace='replace_enrollment_request',
-            delete='delete_enrollment_request',
-        ),
-        ResourceType.REPOSITORY: ApiResource(
-            api=RepositoryApi,
-            model=Repository,
-            get='get_repository',
-            create='create_repository',
-            list='list_repositories',
-            patch='patch_repository',
-            replace='replace_repository',
-            delete='delete_repository',
-        ),
-        ResourceType.RESOURCE_SYNC: ApiResource(
-            api=ResourcesyncApi,
-            model=ResourceSync,
-            get='get_resource_sync',
-            create='create_resource_sync',
-            list='list_resource_syncs',
-            patch='patch_resource_sync',
-            replace='replace_resource_sync',
-            delete='delete_resource_sync',
-        ),
-        ResourceType.TEMPLATE_VERSION: ApiResource(
-            api=FleetApi,
-            model=TemplateVersion,
-            get='get_template_version',
-            list='list_template_versions',
-            delete='delete_template_version',
-        ),
-        ResourceType.EVENT: ApiResource(
-            api=EventApi,
-            model=Event,
-            list='list_events',
-        ),
-        ResourceType.ORGANIZATION: ApiResource(
-            api=OrganizationApi,
-            model=Organization,
-            list='list_organizations',
-        ),
-        ResourceType.ENROLLMENT_CONFIG: ApiResource(
-            api=EnrollmentrequestApi,
-            model=EnrollmentConfig,
-            get='get_enrollment_config'
-        )
-    }
-except ImportError as imp_exc:
-    # Handled elsewhere
-    pass
+
+# Annotation holding the hash of the definition last applied by flightctl_resource
+APPLIED_HASH_ANNOTATION = "ansible.flightctl.io/applied-hash"
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_for_version(api_version: str, submodule: str, class_name: str):
+    """Resolve a version-specific class from the flightctl client library.
+
+    Maps an API version string (e.g. ``"v1beta1"``, ``"v1alpha1"``) to the
+    correct client package and imports ``<class_name>`` from ``<submodule>``.
+    Classes are resolved once per process.
+    """
+    pkg = "flightctl" if api_version == "v1beta1" else f"flightctl.{api_version}"
+    mod = importlib.import_module(f"{pkg}.{submodule}")
+    return getattr(mod, class_name)
+
+
+@dataclass
+class ApiResource:
+    """
+    The generated API and model classes of a kind, and the names of its API methods.
+
+    The classes are named ``<module>.<Class>`` relative to the ``api`` and ``models``
+    packages of the client for api_version, they are imported on first use so that
+    modules only load the parts of the client they need.
+    """
+    api_class: str
+    model_class: str
+
+    api_version: str = "v1beta1"
+    get: Optional[str] = None
+    create: Optional[str] = None
+    list: Optional[str] = None
+    delete: Optional[str] = None
+    patch: Optional[str] = None
+    replace: Optional[str] = None
+    rendered: Optional[str] = None
+    decommission: Optional[str] = None
+
+    @property
+    def api(self) -> Any:
+        module, class_name = self.api_class.rsplit(".", 1)
+        return resolve_for_version(self.api_version, f"api.{module}", class_name)
+
+    @property
+    def model(self) -> Any:
+        module, class_name = self.model_class.rsplit(".", 1)
+        return resolve_for_version(self.api_version, f"models.{module}", class_name)
+
+
+API_MAPPING = {
+    ResourceType.AUTH_PROVIDER: ApiResource(
+        api_class='authprovider_api.AuthproviderApi',
+        model_class='auth_provider.AuthProvider',
+        get='get_auth_provider',
+        create='create_auth_provider',
+        list='list_auth_providers',
+        patch='patch_auth_provider',
+        replace='replace_auth_provider',
+        delete='delete_auth_provider',
+    ),
+    ResourceType.CATALOG: ApiResource(
+        api_class='catalog_api.CatalogApi',
+        model_class='catalog.Catalog',
+        api_version='v1alpha1',
+        get='get_catalog',
+        create='create_catalog',
+        list='list_catalogs',
+        patch='patch_catalog',
+        replace='replace_catalog',
+        delete='delete_catalog',
+    ),
+    ResourceType.CATALOG_ITEM: ApiResource(
+        api_class='catalog_api.CatalogApi',
+        model_class='catalog_item.CatalogItem',
+        api_version='v1alpha1',
+        get='get_catalog_item',
+        create='create_catalog_item',
+        list='list_catalog_items',
+        patch='patch_catalog_item',
+        replace='replace_catalog_item',
+        delete='delete_catalog_item',
+    ),
+    ResourceType.DEVICE: ApiResource(
+        api_class='device_api.DeviceApi',
+        model_class='device.Device',
+        get='get_device',
+        create='create_device',
+        list='list_devices',
+        patch='patch_device',
+        replace='replace_device',
+        delete='delete_device',
+        rendered='get_rendered_device',
+        decommission='decommission_device',
+    ),
+    ResourceType.FLEET: ApiResource(
+        api_class='fleet_api.FleetApi',
+        model_class='fleet.Fleet',
+        get='get_fleet',
+        create='create_fleet',
+        list='list_fleets',
+        patch='patch_fleet',
+        replace='replace_fleet',
+        delete='delete_fleet',
+    ),
+    ResourceType.CSR: ApiResource(
+        api_class='certificatesigningrequest_api.CertificatesigningrequestApi',
+        model_class='certificate_signing_request.CertificateSigningRequest',
+        get='get_certificate_signing_request',
+        create='create_certificate_signing_request',
+        list='list_certificate_signing_requests',
+        patch='patch_certificate_signing_request',
+        replace='replace_certificate_signing_request',
+        delete='delete_certificate_signing_request',
+    ),
+    ResourceType.ENROLLMENT: ApiResource(
+        api_class='enrollmentrequest_api.EnrollmentrequestApi',
+        model_class='enrollment_request.EnrollmentRequest',
+        get='get_enrollment_request',
+        create='create_enrollment_request',
+        list='list_enrollment_requests',
+        replace='replace_enrollment_request',
+        delete='delete_enrollment_request',
+    ),
+    ResourceType.REPOSITORY: ApiResource(
+        api_class='repository_api.RepositoryApi',
+        model_class='repository.Repository',
+        get='get_repository',
+        create='create_repository',
+        list='list_repositories',
+        patch='patch_repository',
+        replace='replace_repository',
+        delete='delete_repository',
+    ),
+    ResourceType.RESOURCE_SYNC: ApiResource(
+        api_class='resourcesync_api.ResourcesyncApi',
+        model_class='resource_sync.ResourceSync',
+        get='get_resource_sync',
+        create='create_resource_sync',
+        list='list_resource_syncs',
+        patch='patch_resource_sync',
+        replace='replace_resource_sync',
+        delete='delete_resource_sync',
+    ),
+    ResourceType.TEMPLATE_VERSION: ApiResource(
+        api_class='fleet_api.FleetApi',
+        model_class='template_version.TemplateVersion',
+        get='get_template_version',
+        list='list_template_versions',
+        delete='delete_template_version',
+    ),
+    ResourceType.EVENT: ApiResource(
+        api_class='event_api.EventApi',
+        model_class='event.Event',
+        list='list_events',
+    ),
+    ResourceType.ORGANIZATION: ApiResource(
+        api_class='organization_api.OrganizationApi',
+        model_class='organization.Organization',
+        list='list_organizations',
+    ),
+    ResourceType.ENROLLMENT_CONFIG: ApiResource(
+        api_class='enrollmentrequest_api.EnrollmentrequestApi',
+        model_class='enrollment_config.EnrollmentConfig',
+        get='get_enrollment_config',
+    ),
+}
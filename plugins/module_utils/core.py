@@ -7,9 +7,11 @@ from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
 import base64
+import os
 import re
+import socket
 import tempfile
-from typing import Any, Callable, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from ansible.module_utils.basic import AnsibleModule, env_fallback
 from urllib.parse import urlparse
@@ -17,6 +19,24 @@ from urllib.parse import urlparse
 from .config_loader import ConfigLoader
 from .exceptions import FlightctlException
 
+try:
+    from urllib3.connection import HTTPConnection
+    from urllib3.util.retry import Retry
+except ImportError:
+    HTTPConnection = None
+    Retry = None
+
+
+# Backoff between retried requests, and the responses that are retried besides connection errors
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# TCP keep-alive probes of pooled connections: idle seconds before the first probe,
+# seconds between probes, and unanswered probes before the connection is dropped
+KEEPALIVE_IDLE = 30
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 3
+
 
 class FlightctlModule(AnsibleModule):
     AUTH_ARGSPEC: Dict[str, Any] = dict(
@@ -61,7 +81,22 @@ class FlightctlModule(AnsibleModule):
             type="path",
             aliases=["ca_path"],
             fallback=(env_fallback, ["FLIGHTCTL_CA_PATH"]),
-        )
+        ),
+        flightctl_pool_maxsize=dict(
+            type="int",
+            required=False,
+            fallback=(env_fallback, ["FLIGHTCTL_POOL_MAXSIZE"]),
+        ),
+        flightctl_max_retries=dict(
+            type="int",
+            required=False,
+            fallback=(env_fallback, ["FLIGHTCTL_MAX_RETRIES"]),
+        ),
+        flightctl_keepalive=dict(
+            type="bool",
+            default=False,
+            fallback=(env_fallback, ["FLIGHTCTL_KEEPALIVE"]),
+        ),
     )
     short_params: Dict[str, str] = {
         "host": "flightctl_host",
@@ -85,6 +120,10 @@ class FlightctlModule(AnsibleModule):
     ca_path: Optional[str] = None
     # authenticated = False
 
+    # A process that runs modules one after the other, like the API worker of the flightctl_resource
+    # action, sets this to a dict to load each config file once, and to keep CA files written from it
+    config_cache: Optional[Dict[Any, Any]] = None
+
     def __init__(
         self,
         argument_spec: Dict[str, Any],
@@ -141,6 +180,32 @@ class FlightctlModule(AnsibleModule):
                 f"Unable to parse flightctl_host as a URL ({e}): {self.host}"
             ) from e
 
+    def configure_connections(self, client_config: Any, min_pool_maxsize: int = 1) -> None:
+        """
+        Apply the connection pool, retry and keep-alive options to a client configuration.
+
+        Args:
+            client_config (Any): The Configuration of a flightctl client, before the client is created.
+            min_pool_maxsize (int): The least number of connections the pool must keep.
+        """
+        pool_maxsize = self.params.get("flightctl_pool_maxsize")
+        if pool_maxsize or min_pool_maxsize > 1:
+            pool_maxsize = pool_maxsize or client_config.connection_pool_maxsize
+            client_config.connection_pool_maxsize = max(pool_maxsize, min_pool_maxsize)
+
+        max_retries = self.params.get("flightctl_max_retries")
+        if max_retries is not None:
+            # Only idempotent requests are retried on responses, PATCH and POST never are
+            client_config.retries = Retry(
+                total=max_retries,
+                backoff_factor=RETRY_BACKOFF_FACTOR,
+                status_forcelist=RETRY_STATUSES,
+                raise_on_status=False,
+            )
+
+        if self.params.get("flightctl_keepalive"):
+            client_config.socket_options = HTTPConnection.default_socket_options + keepalive_socket_options()
+
     def load_config_files(self) -> None:
         """
         Load configuration files using ConfigLoader.
@@ -151,7 +216,16 @@ class FlightctlModule(AnsibleModule):
 
         try:
             # Use ConfigLoader to load config from file or fallback to defaults
-            config_loader = ConfigLoader(config_file=config_file, warn_callback=self.warn)
+            if self.config_cache is None:
+                config_loader = ConfigLoader(config_file=config_file, warn_callback=self.warn)
+            else:
+                try:
+                    key = (config_file, os.stat(config_file).st_mtime_ns)
+                except OSError:
+                    key = (config_file, None)
+                if key not in self.config_cache:
+                    self.config_cache[key] = ConfigLoader(config_file=config_file, warn_callback=self.warn)
+                config_loader = self.config_cache[key]
 
             # Map the loaded config to this module's attributes
             self.map_loaded_config(config_loader)
@@ -177,6 +251,16 @@ class FlightctlModule(AnsibleModule):
             self._create_tmp_crt(getattr(config_loader, "ca_data"))
 
     def _create_tmp_crt(self, encoded_data):
+        if self.config_cache is not None:
+            # The file outlives the module, so that clients kept by the process can still use it
+            key = ("ca_data", encoded_data)
+            if key not in self.config_cache:
+                with tempfile.NamedTemporaryFile(delete=False, suffix="crt") as temp_file:
+                    temp_file.write(base64.b64decode(encoded_data))
+                self.config_cache[key] = temp_file.name
+            self.ca_path = self.config_cache[key]
+            return
+
         decoded_data = base64.b64decode(encoded_data)
         with tempfile.NamedTemporaryFile(delete=False, suffix="crt") as temp_file:
             # Write our decoded data to a .crt file and point our ca_path to the filename
@@ -227,3 +311,16 @@ class FlightctlModule(AnsibleModule):
             self.warn_callback(warning)
         else:
             super().warn(warning)
+
+
+def keepalive_socket_options() -> List[Tuple[int, int, int]]:
+    """Returns the socket options enabling TCP keep-alive probes, with the timings the platform supports."""
+    options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    for name, value in (
+        ("TCP_KEEPIDLE", KEEPALIVE_IDLE),
+        ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL),
+        ("TCP_KEEPCNT", KEEPALIVE_COUNT),
+    ):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
@@ -58,6 +58,7 @@ class FlightctlImageBuilderModule(FlightctlModule):
             ssl_ca_cert=self.ca_path,
         )
         client_config.verify_ssl = self.verify_ssl
+        self.configure_connections(client_config)
 
         self._set_auth_headers()
 
@@ -6,13 +6,16 @@ from __future__ import (absolute_import, division, print_function)
 
 __metaclass__ = type
 
-from typing import Any, Dict, List, Tuple
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
-from .api_module import FlightctlAPIModule
-from .constants import ResourceType
+from .api_module import FlightctlAPIModule, ListResult
+from .constants import API_MAPPING, APPLIED_HASH_ANNOTATION, LIST_ONLY_RESOURCES, ResourceType
 from .exceptions import FlightctlException, ValidationException
 from .options import ApprovalOptions, GetOptions
 from .resources import create_definitions
+from .utils import definition_hash
 
 try:
     from flightctl.models.enrollment_request import EnrollmentRequest
@@ -23,6 +26,30 @@ else:
     CLIENT_IMPORT_ERROR = None
 
 
+# Kinds are applied in this order, so that a resource is created after the resources it
+# refers to (a Fleet after the Repository its configuration comes from), and deleted in
+# the reverse order.  Kinds in the same position have no such dependency.
+KIND_ORDER: Dict[ResourceType, int] = {
+    ResourceType.ORGANIZATION: 0,
+    ResourceType.AUTH_PROVIDER: 0,
+    ResourceType.REPOSITORY: 1,
+    ResourceType.CATALOG: 1,
+    ResourceType.CATALOG_ITEM: 2,
+    ResourceType.FLEET: 2,
+    ResourceType.RESOURCE_SYNC: 3,
+    ResourceType.TEMPLATE_VERSION: 3,
+    ResourceType.DEVICE: 4,
+    ResourceType.ENROLLMENT: 5,
+    ResourceType.CSR: 5,
+}
+
+
+# Existing resources of a kind are listed up front once the module applies this many of them
+PREFETCH_MIN_DEFINITIONS = 2
+
+Prefetched = Dict[Tuple[ResourceType, str], Optional[Any]]
+
+
 def get_definitions(params: Dict[str, Any]) -> List:
     """
     Retrieves the resource definitions based on the provided parameters.
@@ -55,17 +82,39 @@ def run_module(module: Any) -> None:
     Raises:
         FlightctlException: If an action fails.
     """
-    results: List[Dict[str, Any]] = []
+    parallelism = module.params.get("parallelism", 1)
+    if parallelism < 1:
+        module.fail_json(msg="parallelism must be at least 1")
+        return
 
     definitions = get_definitions(module.params)
-    for definition in definitions:
-        try:
-            changed, result = perform_action(module, definition)
-            module.result["changed"] |= changed
-        except Exception as e:
-            raise FlightctlException(f"Failed to perform action: {e}") from e
-        results.append(result)
 
+    if module.params.get("state") == "present":
+        state_hash = definition_hash(definitions)
+        module.result["state_hash"] = state_hash
+        # The caller vouches that these definitions were applied, and nothing changed since
+        known_state_hash = module.params.get("known_state_hash")
+        if known_state_hash == state_hash and not module.params.get("force_update"):
+            # Nothing was read from the server, there is no object to return
+            module.exit_json(**module.result)
+            return
+
+    prefetched = prefetch_existing(module, definitions)
+
+    # Check mode and decommissioning exit from within perform_action, they stay sequential
+    sequential = module.check_mode or module.params.get("state") == "decommission"
+    if parallelism > 1 and len(definitions) > 1 and not sequential:
+        results = apply_parallel(module, definitions, parallelism, prefetched)
+    else:
+        results = []
+        for definition in definitions:
+            results.append(_apply(module, definition, prefetched))
+
+    _exit_with_results(module, results)
+
+
+def _exit_with_results(module: Any, results: List[Dict[str, Any]]) -> None:
+    """Exits the module with the results of the definitions."""
     if len(results) == 1:
         module.result["result"] = results[0]
     else:
@@ -74,13 +123,138 @@ def run_module(module: Any) -> None:
     module.exit_json(**module.result)
 
 
-def perform_action(module, definition: Dict[str, Any]) -> Tuple[bool, Dict[str, Any]]:
+def prefetch_existing(module: Any, definitions: List[Dict[str, Any]]) -> Prefetched:
+    """
+    Looks up the existing resources of the definitions with one list per kind.
+
+    Kinds with fewer than PREFETCH_MIN_DEFINITIONS definitions, names that appear more
+    than once, and kinds the server cannot list by name are left out, those are fetched
+    one at a time by perform_action.
+
+    Args:
+        module (Any): The Ansible module instance.
+        definitions (List[Dict[str, Any]]): The resource definitions.
+
+    Returns:
+        Prefetched: The existing resource, or None if it does not exist, by kind and name.
+    """
+    if module.params.get("label_selector"):
+        return {}
+
+    names: Dict[ResourceType, List[str]] = {}
+    for definition in definitions:
+        try:
+            resource = ResourceType(definition.get("kind"))
+        except (TypeError, ValueError):
+            continue
+        # Definitions without a name are left to perform_action to validate
+        metadata = definition.get("metadata")
+        name = metadata.get("name") if isinstance(metadata, dict) else None
+        api_type = API_MAPPING.get(resource)
+        if name and api_type and api_type.list and resource not in LIST_ONLY_RESOURCES:
+            names.setdefault(resource, []).append(name)
+
+    prefetched: Prefetched = {}
+    for resource, kind_names in names.items():
+        counts = Counter(kind_names)
+        unique = [name for name in kind_names if counts[name] == 1]
+        if len(unique) < PREFETCH_MIN_DEFINITIONS:
+            continue
+        try:
+            found = module.list_by_names(
+                resource, unique,
+                fleet_name=module.params.get("fleet_name"),
+                catalog_name=module.params.get("catalog_name"),
+            )
+        except Exception as e:
+            module.debug(f"Unable to list {resource.value} resources by name, fetching them one at a time: {e}")
+            continue
+        for name in unique:
+            prefetched[(resource, name)] = found.get(name)
+    return prefetched
+
+
+def _apply(module: Any, definition: Dict[str, Any], prefetched: Optional[Prefetched] = None) -> Dict[str, Any]:
+    """Performs the action for one definition, recording whether it changed anything."""
+    try:
+        changed, result = perform_action(module, definition, prefetched)
+    except Exception as e:
+        raise FlightctlException(f"Failed to perform action: {e}") from e
+    if changed:
+        # Only ever set, so that concurrent definitions cannot undo each other
+        module.result["changed"] = True
+    return result
+
+
+def dependency_waves(definitions: List[Dict[str, Any]], state: str) -> List[List[int]]:
+    """
+    Groups definitions into waves that can be applied concurrently.
+
+    Args:
+        definitions (List[Dict[str, Any]]): The resource definitions.
+        state (str): The requested state, deletions run the waves in reverse order.
+
+    Returns:
+        List[List[int]]: The indexes of the definitions in each wave, in the order the
+        waves must run.  Kinds missing from KIND_ORDER, including invalid ones, run last.
+    """
+    waves: Dict[int, List[int]] = {}
+    for index, definition in enumerate(definitions):
+        try:
+            rank = KIND_ORDER.get(ResourceType(definition.get("kind")), len(KIND_ORDER))
+        except (TypeError, ValueError):
+            rank = len(KIND_ORDER)
+        waves.setdefault(rank, []).append(index)
+
+    ranks = sorted(waves, reverse=(state == "absent"))
+    return [waves[rank] for rank in ranks]
+
+
+def apply_parallel(
+    module: Any, definitions: List[Dict[str, Any]], parallelism: int, prefetched: Optional[Prefetched] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Applies definitions on a thread pool, one dependency wave at a time.
+
+    Args:
+        module (Any): The Ansible module instance.
+        definitions (List[Dict[str, Any]]): The resource definitions.
+        parallelism (int): The maximum number of definitions applied at once.
+        prefetched (Optional[Prefetched]): Existing resources found by prefetch_existing.
+
+    Returns:
+        List[Dict[str, Any]]: The results, in the order of the definitions.
+
+    Raises:
+        FlightctlException: If an action fails.  The following waves are not started, and
+        the error of the first failed definition in input order is raised.
+    """
+    results: List[Any] = [None] * len(definitions)
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        for wave in dependency_waves(definitions, module.params.get("state")):
+            futures = [(index, executor.submit(_apply, module, definitions[index], prefetched)) for index in wave]
+            errors = []
+            for index, future in futures:
+                try:
+                    results[index] = future.result()
+                except FlightctlException as e:
+                    errors.append((index, e))
+            if errors:
+                raise min(errors, key=lambda error: error[0])[1]
+    return results
+
+
+def perform_action(
+    module, definition: Dict[str, Any], prefetched: Optional[Prefetched] = None,
+) -> Tuple[bool, Dict[str, Any]]:
     """
     Performs the appropriate action (create, update, delete) on a resource.
 
     Args:
         module (Any): The Ansible module instance.
         definition (Dict[str, Any]): The resource definition.
+        prefetched (Optional[Prefetched]): Existing resources found by prefetch_existing,
+            the resource is fetched when it is not among them.
 
     Returns:
         Tuple[bool, Dict[str, Any]]: A tuple containing a boolean indicating if the resource
@@ -104,17 +278,21 @@ def perform_action(module, definition: Dict[str, Any]) -> Tuple[bool, Dict[str,
     changed: bool = False
     result = None
 
-    try:
-        get_options = GetOptions(
-            resource=resource,
-            name=name,
-            fleet_name=fleet_name,
-            catalog_name=catalog_name,
-            label_selector=label_selector,
-        )
-        existing_result = module.get_one_or_many(get_options)
-    except Exception as e:
-        raise FlightctlException(f"Failed to get resource: {e}") from e
+    if prefetched and (resource, name) in prefetched:
+        found = prefetched[(resource, name)]
+        existing_result = ListResult(data=[found] if found is not None else [])
+    else:
+        try:
+            get_options = GetOptions(
+                resource=resource,
+                name=name,
+                fleet_name=fleet_name,
+                catalog_name=catalog_name,
+                label_selector=label_selector,
+            )
+            existing_result = module.get_one_or_many(get_options)
+        except Exception as e:
+            raise FlightctlException(f"Failed to get resource: {e}") from e
 
     if state == "absent":
         if existing_result.data:
@@ -131,7 +309,18 @@ def perform_action(module, definition: Dict[str, Any]) -> Tuple[bool, Dict[str,
             result = existing_result
 
     elif state == "present":
+        applied_hash = None
+        if module.params.get("applied_hash_annotation"):
+            definition, applied_hash = with_applied_hash(definition)
+
         if existing_result.data:
+            existing = existing_result.data[0]
+            if applied_hash and not module.params.get("force_update"):
+                annotations = getattr(existing.metadata, "annotations", None) or {}
+                if annotations.get(APPLIED_HASH_ANNOTATION) == applied_hash:
+                    # The same definition was applied last time, no need to diff it
+                    return False, existing.to_dict()
+
             # Update resource
             if module.check_mode:
                 module.exit_json(**{"changed": True})
@@ -141,7 +330,10 @@ def perform_action(module, definition: Dict[str, Any]) -> Tuple[bool, Dict[str,
                     result = module.replace(resource, definition, parent_name)
                     changed |= True
                 else:
-                    changed, result = module.update(resource, existing_result.data[0], definition, parent_name)
+                    changed, result = module.update(
+                        resource, existing, definition, parent_name,
+                        optimistic=module.params.get("update_strategy") == "optimistic",
+                    )
             except Exception as e:
                 raise FlightctlException(f"Failed to update resource: {e}") from e
         else:
@@ -183,6 +375,28 @@ def perform_action(module, definition: Dict[str, Any]) -> Tuple[bool, Dict[str,
     return changed, result.to_dict()
 
 
+def with_applied_hash(definition: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+    """
+    Adds the hash of a definition to its annotations.
+
+    Args:
+        definition (Dict[str, Any]): The resource definition.
+
+    Returns:
+        Tuple[Dict[str, Any], str]: A copy of the definition annotated with its hash, and the hash.
+    """
+    metadata = dict(definition.get("metadata") or {})
+    annotations = {
+        key: value for key, value in (metadata.get("annotations") or {}).items()
+        if key != APPLIED_HASH_ANNOTATION
+    }
+    metadata["annotations"] = annotations
+    applied_hash = definition_hash(dict(definition, metadata=metadata))
+
+    annotations[APPLIED_HASH_ANNOTATION] = applied_hash
+    return dict(definition, metadata=metadata), applied_hash
+
+
 def perform_approval(module: FlightctlAPIModule) -> None:
     """
     Performs the approval action on a specific resource.
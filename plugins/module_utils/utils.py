@@ -6,6 +6,7 @@ from __future__ import (absolute_import, division, print_function)
 
 __metaclass__ = type
 
+import hashlib
 import json
 import traceback
 from typing import Any, Dict, List, Optional, Tuple
@@ -81,6 +82,21 @@ def json_patch(existing: Dict[str, Any], patch: List[Dict[str, Any]]) -> Tuple[O
         return None, error
 
 
+def definition_hash(definition: Any) -> str:
+    """
+    Computes a canonical hash of resource definitions.
+
+    Args:
+        definition (Any): A resource definition, or a list of them.
+
+    Returns:
+        str: The sha256 hex digest of the definition serialized as JSON with sorted keys,
+        so that the order of keys does not change the hash.
+    """
+    canonical = json.dumps(definition, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
 class JsonPatch(list):
     def __str__(self) -> str:
         """
@@ -92,27 +108,143 @@ class JsonPatch(list):
         return json.dumps(self)
 
 
-def get_patch(old: Dict[str, Any], new: Dict[str, Any]) -> List[Dict[str, Any]]:
-    patch = []
+def pointer_token(key: Any) -> str:
+    """Escapes a key for use in a JSON pointer, like annotation keys that hold a slash."""
+    return str(key).replace("~", "~0").replace("/", "~1")
 
-    def recursive_diff(old: Dict[str, Any], new: Dict[str, Any], path: str):
-        """
-        Recursive function to find differences between old and new dictionaries.
-        """
-        # for key in old.keys() - new.keys():
-        #     patch.append({"op": "remove", "path": f"{path}/{key}"})
 
-        for key in new.keys() - old.keys():
-            patch.append({"op": "add", "path": f"{path}/{key}", "value": new[key]})
+def get_patch(old: Dict[str, Any], new: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Computes the JSON patch that merges a new definition into an existing object.
 
-        for key in old.keys() & new.keys():
-            old_value = old[key]
-            new_value = new[key]
-            if isinstance(old_value, dict) and isinstance(new_value, dict):
-                recursive_diff(old_value, new_value, f"{path}/{key}")
-            elif old_value != new_value:
-                patch.append({"op": "replace", "path": f"{path}/{key}", "value": new_value})
+    Keys of dictionaries that are missing from ``new`` are left alone.  Lists are patched to
+    equal the new list: lists of objects that have a ``name`` are matched item by item on
+    their names, so that an item that changed, was appended, or was dropped from the end
+    gets its own operations.  Any other list that changed is replaced as a whole.
 
-    recursive_diff(old, new, '')
+    Args:
+        old (Dict[str, Any]): The existing object.
+        new (Dict[str, Any]): The new definition.
 
+    Returns:
+        List[Dict[str, Any]]: The JSON patch operations.
+    """
+    patch: List[Dict[str, Any]] = []
+    _diff_dict(old, new, "", patch, merge=True)
     return patch
+
+
+def get_patch_and_diff(old: Dict[str, Any], new: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Computes the JSON patch of get_patch, and the difference it makes, in one pass.
+
+    This is equivalent to applying the patch with json_patch and comparing the result to
+    ``old`` with diff_dicts, without copying ``old``.  The difference refers to the values
+    of ``old`` and ``new``, it must not be modified.
+
+    Args:
+        old (Dict[str, Any]): The existing object.
+        new (Dict[str, Any]): The new definition.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+            - The JSON patch operations.
+            - A dictionary with the differences, containing 'before' and 'after' states,
+              or an empty dictionary if the patch changes nothing.
+    """
+    patch: List[Dict[str, Any]] = []
+    before: Dict[str, Any] = {}
+    after: Dict[str, Any] = {}
+    _diff_dict(old, new, "", patch, True, before, after)
+    if not before and not after:
+        return patch, {}
+    return patch, {"before": before, "after": after}
+
+
+def _diff_dict(
+    old: Dict[str, Any], new: Dict[str, Any], path: str, patch: List[Dict[str, Any]], merge: bool,
+    before: Optional[Dict[str, Any]] = None, after: Optional[Dict[str, Any]] = None,
+) -> None:
+    """
+    Adds the operations turning ``old`` into ``new``, keeping the keys missing from ``new`` when merging.
+
+    The values that differ are recorded in ``before`` and ``after`` when given.
+    """
+    for key, new_value in new.items():
+        token = f"{path}/{pointer_token(key)}"
+        if key not in old:
+            patch.append({"op": "add", "path": token, "value": new_value})
+            if after is not None:
+                after[key] = new_value
+            continue
+
+        old_value = old[key]
+        if before is None:
+            _diff_value(old_value, new_value, token, patch, merge)
+        elif isinstance(old_value, dict) and isinstance(new_value, dict):
+            nested_before: Dict[str, Any] = {}
+            nested_after: Dict[str, Any] = {}
+            _diff_dict(old_value, new_value, token, patch, merge, nested_before, nested_after)
+            if nested_before or nested_after:
+                before[key] = nested_before
+                after[key] = nested_after
+        else:
+            operations = len(patch)
+            _diff_value(old_value, new_value, token, patch, merge)
+            if len(patch) > operations:
+                before[key] = old_value
+                after[key] = new_value
+
+    if not merge:
+        for key in old.keys() - new.keys():
+            patch.append({"op": "remove", "path": f"{path}/{pointer_token(key)}"})
+            if before is not None:
+                before[key] = old[key]
+
+
+def _diff_value(old: Any, new: Any, path: str, patch: List[Dict[str, Any]], merge: bool) -> None:
+    """Adds the operations turning ``old`` into ``new``, and nothing for identical subtrees."""
+    if old is new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        _diff_dict(old, new, path, patch, merge)
+    elif isinstance(old, list) and isinstance(new, list):
+        _diff_list(old, new, path, patch)
+    elif old != new:
+        patch.append({"op": "replace", "path": path, "value": new})
+
+
+def _list_names(items: List[Any]) -> Optional[List[Any]]:
+    """Returns the names of list items, or None unless every item is an object with a unique name."""
+    names = [item.get("name") if isinstance(item, dict) else None for item in items]
+    if None in names or len(set(map(repr, names))) != len(names):
+        return None
+    return names
+
+
+def _diff_list(old: List[Any], new: List[Any], path: str, patch: List[Dict[str, Any]]) -> None:
+    """Adds the operations turning list ``old`` into ``new``."""
+    if old == new:
+        return
+
+    common = min(len(old), len(new))
+    old_names = _list_names(old)
+    new_names = _list_names(new)
+    if old_names is not None and new_names is not None:
+        # Items keep their place when the list was only changed, appended to or truncated
+        matched = old_names[:common] == new_names[:common]
+    else:
+        matched = old[:common] == new[:common]
+    if not matched:
+        patch.append({"op": "replace", "path": path, "value": new})
+        return
+
+    for index in range(common):
+        # Comparing the items first is much cheaper than walking the equal ones
+        if old[index] != new[index]:
+            _diff_value(old[index], new[index], f"{path}/{index}", patch, merge=False)
+    for item in new[common:]:
+        patch.append({"op": "add", "path": f"{path}/-", "value": item})
+    # Remove from the end, so that the indexes of the other items do not shift
+    for index in range(len(old) - 1, common - 1, -1):
+        patch.append({"op": "remove", "path": f"{path}/{index}"})
@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# coding: utf-8 -*-
+
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+DOCUMENTATION = r"""
+module: flightctl_console_batch
+short_description: Run a command on the consoles of many devices at once
+version_added: 1.7.0
+author:
+  - "Flight Control Ansible maintainers"
+description:
+  - Runs a shell command on the console of every listed device and returns the output of each one.
+  - All console sessions are opened concurrently from the controller by a single process, so
+    fleet-wide checks do not need one Ansible fork per device.
+  - The module runs on the controller, the play does not need to target the devices.
+  - The task fails when the command fails on any device, the result of each device is in C(device_results)
+    either way. Use C(ignore_errors) or C(failed_when) to go on with the devices it succeeded on.
+  - The task reports a change when the command completed, or timed out, on at least one device.
+options:
+  devices:
+    description:
+      - Names of the devices to run the command on.
+    type: list
+    elements: str
+    required: true
+  command:
+    description:
+      - The shell command to run on each device. It is run by C(sh) as root, with stdin closed.
+    type: str
+    required: true
+  concurrency:
+    description:
+      - Maximum number of console sessions open at the same time.
+    type: int
+    default: 50
+  timeout:
+    description:
+      - Seconds allowed for each device to open its console session and run the command.
+    type: float
+    default: 60
+  compression:
+    description:
+      - WebSocket compression to negotiate with the API server.
+    type: str
+    choices: [deflate, none]
+    default: deflate
+  audit_log:
+    description:
+      - How the command is recorded in the device journal with C(systemd-cat) under the C(ansible-console)
+        tag, like with the C(flightctl.core.flightctl_console) connection.
+      - Each console session runs a single command, so C(command) and C(session) both write one entry per
+        device, C(exec_command) and C(console_session) respectively.
+      - C(off) does not log to the device journal.
+    type: str
+    choices: [command, session, 'off']
+    default: command
+  flightctl_host:
+    description:
+      - URL to Flight Control server.
+      - If value not set, will try environment variable C(FLIGHTCTL_HOST).
+    type: str
+  flightctl_token:
+    description:
+      - The Flight Control API token to use.
+      - If value not set, will try environment variable C(FLIGHTCTL_TOKEN).
+    type: str
+  flightctl_validate_certs:
+    description:
+      - Whether to allow insecure connections to Flight Control service.
+      - If C(false), SSL certificates will not be validated.
+      - If value not set, will try environment variable C(FLIGHTCTL_VERIFY_SSL), then the config file.
+        Defaults to C(true).
+    type: bool
+    aliases: [ verify_ssl ]
+  flightctl_ca_path:
+    description:
+      - Path to a CA cert file to use when making requests.
+      - If value not set, will try environment variable C(FLIGHTCTL_CA_PATH).
+    type: path
+    aliases: [ ca_path ]
+  flightctl_config_file:
+    description:
+      - Path to the config file.
+      - If value not set, will try environment variable C(FLIGHTCTL_CONFIG_FILE).
+    type: path
+    aliases: [ config_file ]
+attributes:
+  check_mode:
+    description: Can run in check_mode and return changed status prediction without modifying target.
+    support: none
+    details:
+      - The command cannot be run without its effects, the task is skipped in check mode.
+  diff_mode:
+    description: Will return details on what has changed (or possibly needs changing in check_mode), when in diff mode.
+    support: none
+requirements:
+  - jsonschema
+  - PyYAML
+  - websockets
+"""
+
+
+EXAMPLES = r"""
+- name: Check the disk usage of every device in a fleet
+  hosts: localhost
+  gather_facts: false
+  tasks:
+    - name: Get the devices of the fleet
+      flightctl.core.flightctl_resource_info:
+        kind: Device
+        owner: "Fleet/my-fleet"
+      register: fleet_devices
+
+    - name: Run df on all of them
+      flightctl.core.flightctl_console_batch:
+        devices: "{{ fleet_devices.result.data | map(attribute='metadata.name') }}"
+        command: df -h /var
+        concurrency: 100
+        flightctl_config_file: ~/.config/flightctl/client.yaml
+      register: disk_usage
+"""
+
+
+RETURN = r"""
+device_results:
+  description: The result of the command on each device, in the order of O(devices).
+  returned: always
+  type: list
+  elements: dict
+  contains:
+    device:
+      description: Name of the device.
+      returned: always
+      type: str
+    rc:
+      description: Exit status of the command.
+      returned: When the command completed
+      type: int
+    stdout:
+      description: Standard output of the command.
+      returned: When the command completed
+      type: str
+    stderr:
+      description: Standard error of the command.
+      returned: When the command completed
+      type: str
+    failed:
+      description: Whether the command could not be run or returned a non-zero exit status.
+      returned: always
+      type: bool
+    unreachable:
+      description: Set when the console session could not be opened.
+      returned: When the console session failed
+      type: bool
+    msg:
+      description: Why the command could not be run.
+      returned: When the command did not complete
+      type: str
+"""
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# coding: utf-8 -*-
+
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+DOCUMENTATION = r"""
+module: flightctl_console_copy
+short_description: Copy a directory tree to a device in a single transfer
+version_added: 1.7.0
+author:
+  - "Flight Control Ansible maintainers"
+description:
+  - Copies files from the controller to a device reached with the P(flightctl.core.flightctl_console#connection)
+    connection.
+  - The files are packed in a single gzip compressed tar archive, uploaded and unpacked on the device with C(tar),
+    so that a tree of many small files takes a few round trips instead of several per file as with
+    M(ansible.builtin.copy).
+  - Files are compared with the device by their sha256 checksum first, only the files that are missing or differ
+    are sent.
+  - Copied files and directories keep their local permissions, and are owned by C(root).
+  - Symbolic links are followed, the files they point to are copied.
+  - Supports check mode, which reports the files that would be copied.
+options:
+  src:
+    description:
+      - Local path of a file or directory to copy, relative paths are looked up like for M(ansible.builtin.copy).
+      - If O(src) is a directory ending with C(/), its contents are copied into O(dest), otherwise the directory
+        itself is copied into O(dest).
+    type: path
+    required: true
+  dest:
+    description:
+      - Absolute path of the directory on the device to copy into. It is created if it does not exist.
+    type: str
+    required: true
+  compare:
+    description:
+      - Compare the files with the device first, and only send the ones that differ.
+      - If C(false), all files are sent and the task always reports a change.
+    type: bool
+    default: true
+requirements:
+  - C(tar) with gzip support and C(sha256sum) on the device
+notes:
+  - Files present in O(dest) but not in O(src) are left alone.
+"""
+
+
+EXAMPLES = r"""
+- name: Deploy a configuration bundle
+  flightctl.core.flightctl_console_copy:
+    src: files/app-config/
+    dest: /etc/app
+
+- name: Copy the dashboards directory itself into /var/lib/grafana
+  flightctl.core.flightctl_console_copy:
+    src: dashboards
+    dest: /var/lib/grafana
+"""
+
+
+RETURN = r"""
+src:
+  description: Local path of the copied file or directory.
+  returned: always
+  type: str
+dest:
+  description: Directory on the device the files were copied into.
+  returned: always
+  type: str
+files:
+  description: Paths of the files that were copied, or would be in check mode, relative to O(dest).
+  returned: always
+  type: list
+  elements: str
+  sample: ["app.conf", "conf.d/logging.conf"]
+"""
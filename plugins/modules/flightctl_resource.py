@@ -52,12 +52,68 @@ options:
       - Provide a valid YAML template definition file for an object when creating or updating.
       - Value can be provided as string or dictionary.
     type: raw
+  parallelism:
+    description:
+      - Maximum number of resources from O(resource_definition) applied at the same time.
+      - Resources are applied in waves by kind, so that a resource is applied after the kinds it may
+        refer to. For example Repositories come before Fleets, and Fleets before Devices. Deletions run
+        the waves in reverse order. Resources of the same kind are applied concurrently.
+      - The results are reported in the order of O(resource_definition) either way.
+      - Resources are always applied one at a time in check mode, and when O(state=decommission),
+        whatever the value of this option.
+      - Must be at least V(1).
+    type: int
+    default: 1
+    version_added: 1.7.0
+  update_strategy:
+    description:
+      - How an existing resource is patched when O(state=present).
+      - With V(merge), the patch is applied to the existing resource locally first, and sent only if the
+        result differs from the existing resource.
+      - With V(optimistic), the patch is sent as computed, with a precondition on the C(metadata.resourceVersion)
+        of the existing resource. If the resource changed in the meantime the server rejects the patch with a
+        conflict, and the resource is read and patched again, up to three times.
+    type: str
+    choices: [merge, optimistic]
+    default: merge
+    version_added: 1.7.0
+  known_state_hash:
+    description:
+      - The RV(state_hash) returned by an earlier run that applied the same resources.
+      - When it matches the hash of the resources of this run, the server is not contacted at all, the module
+        reports no change and returns neither RV(result) nor RV(results).
+      - Changes made to the resources outside of this module, including deleting them, are not detected.
+        Leave this option out to check the resources against the server again.
+      - Ignored unless O(state=present), and when O(force_update=true).
+    type: str
+    version_added: 1.7.0
+  applied_hash_annotation:
+    description:
+      - Whether to record a hash of each applied resource definition in the C(ansible.flightctl.io/applied-hash)
+        annotation of the resource.
+      - When the annotation of an existing resource matches the hash of its definition, the resource is
+        reported unchanged without comparing it to the definition, and no patch is sent.
+      - Changes made to the resource outside of this module are not detected as long as they keep the
+        annotation. Remove the annotation, or set O(force_update=true), to apply the definition again.
+      - Only used when O(state=present).
+    type: bool
+    default: false
+    version_added: 1.7.0
 extends_documentation_fragment:
   - flightctl.core.auth
   - flightctl.core.state
 notes:
   - For resources other than O(kind=Device), O(resource_definition) must be specified when creating or
     updating a resource.
+  - When O(resource_definition) holds several resources of one kind, the existing ones are looked up with
+    paginated list requests filtered by name, instead of one request per resource. Servers that cannot
+    filter by name fall back to one request per resource.
+  - When the variable C(flightctl_api_worker) or the environment variable E(FLIGHTCTL_API_WORKER) is true, tasks
+    that run on the controller without become or async run the module in a persistent API worker instead of a
+    new Python process, which keeps the client loaded and its connections to the server open between tasks.
+    Modules run one at a time in the worker, which exits after C(flightctl_api_worker_timeout) seconds without
+    a task (default 60). The worker relies on internals of ansible-core, it is only used with ansible-core 2.16
+    to 2.18 and the module runs as usual with other releases.
 requirements:
   - jsonpatch
   - jsonschema
@@ -84,6 +140,22 @@ EXAMPLES = r"""
           fleet: default
           novalue: ""
 
+- name: Apply a multi-document file of repositories, fleets and devices
+  flightctl.core.flightctl_resource:
+    resource_definition: "{{ lookup('file', 'fleet-rollout.yaml') }}"
+    parallelism: 10
+
+- name: Apply fleets, skipping the server while they are unchanged since the last run
+  flightctl.core.flightctl_resource:
+    resource_definition: "{{ lookup('file', 'fleets.yaml') }}"
+    known_state_hash: "{{ fleets_state_hash | default(omit) }}"
+  register: fleets
+
+- name: Remember the state of the fleets
+  ansible.builtin.set_fact:
+    fleets_state_hash: "{{ fleets.state_hash }}"
+    cacheable: true
+
 - name: Delete a device
   flightctl.core.flightctl_resource:
     kind: Device
@@ -94,6 +166,7 @@ RETURN = r"""
 result:
   description:
     - The created, patched, or otherwise present object. Will be empty in the case of a deletion.
+    - Not returned when O(known_state_hash) matches the resources, since they are not read from the server.
   returned: success
   type: complex
   contains:
@@ -117,6 +190,14 @@ result:
       description: Current status details for the object.
       returned: success
       type: dict
+state_hash:
+  description:
+    - A hash of the resource definitions that were applied.
+    - Pass it as O(known_state_hash) to a later run to skip applying the same resources again.
+  returned: when O(state=present)
+  type: str
+  sample: 9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08
+  version_added: 1.7.0
 """
 
 
@@ -134,6 +215,10 @@ def main():
         catalog_name=dict(type="str"),
         api_version=dict(type="str"),
         resource_definition=dict(type="raw"),
+        parallelism=dict(type="int", default=1),
+        update_strategy=dict(type="str", default="merge", choices=["merge", "optimistic"]),
+        known_state_hash=dict(type="str", no_log=False),
+        applied_hash_annotation=dict(type="bool", default=False),
         **STATE_ARG_SPEC
     )
 
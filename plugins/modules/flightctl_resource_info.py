@@ -74,6 +74,13 @@ options:
     type: str
 extends_documentation_fragment:
   - flightctl.core.auth
+notes:
+  - When the variable C(flightctl_api_worker) or the environment variable E(FLIGHTCTL_API_WORKER) is true, tasks
+    that run on the controller without become or async run the module in a persistent API worker instead of a
+    new Python process, which keeps the client loaded and its connections to the server open between tasks.
+    Modules run one at a time in the worker, which exits after C(flightctl_api_worker_timeout) seconds without
+    a task (default 60). The worker relies on internals of ansible-core, it is only used with ansible-core 2.16
+    to 2.18 and the module runs as usual with other releases.
 requirements:
   - jsonschema
   - PyYAML
@@ -0,0 +1,307 @@
+# coding: utf-8 -*-
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""Persistent API worker for the flightctl_resource and flightctl_resource_info actions.
+
+Running a module costs a Python start-up, importing the flightctl client, parsing the
+client config file and a TLS handshake with the server before the first request is
+sent.  The API worker is a persistent daemon (see ``persistent.py``) on the controller
+that runs the modules in-process instead, so that tasks after the first one only pay
+for their API requests: the imports stay loaded, config files are parsed once, and the
+API clients keep their connections open between tasks.
+
+Each client connection carries one JSON request frame with the module to run, its
+arguments and the environment of the task, and gets one JSON response frame back with
+the output of the module.  Modules run one at a time.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import contextlib
+import hashlib
+import importlib
+import io
+import json
+import os
+import re
+import socket
+import traceback
+from typing import Any, Dict, Optional
+
+from ansible.errors import AnsibleActionFail, AnsibleError
+from ansible.release import __version__ as ansible_core_version
+from ansible.module_utils import basic
+from ansible.module_utils.common import warnings as module_warnings
+from ansible.module_utils.common.json import AnsibleJSONEncoder
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.plugins.action import ActionBase
+from ansible.plugins.action.normal import ActionModule as NormalActionModule
+from ansible.utils.display import Display
+from ansible.utils.unsafe_proxy import wrap_var
+from ansible.utils.vars import merge_hash
+from ansible.vars.clean import remove_internal_keys
+
+from .persistent import connect, control_path, recv_frame, send_frame, spawn_daemon, spawn_lock
+
+# How often an idle worker checks whether it should exit.
+_POLL_INTERVAL = 1.0
+
+# run_module sets the arguments of the module and resets the warnings it collected through
+# private attributes of ansible-core, which are only known to work with these releases
+_SUPPORTED_ANSIBLE_CORE = ((2, 16), (2, 19))
+
+# Seconds a worker waits for the next module before it exits, unless set by the variable
+DEFAULT_IDLE_TIMEOUT = 60
+
+display = Display()
+
+_MODULE_UTILS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "module_utils")
+
+
+class WorkerError(Exception):
+    """The worker could not be reached, or went away before answering."""
+
+
+def internals_supported(version: str = ansible_core_version) -> bool:
+    """
+    Whether run_module can run modules in-process with this release of ansible-core.
+
+    There is no public way to run a module in the current process: run_module relies on
+    ``basic._ANSIBLE_ARGS`` and on the lists of collected warnings and deprecations, which
+    ansible-core has changed before.  The worker is only used when the release is one
+    they are known to work with, and they still look the same.
+    """
+    release = tuple(int(part) for part in re.findall(r"\d+", version)[:2])
+    return (
+        _SUPPORTED_ANSIBLE_CORE[0] <= release < _SUPPORTED_ANSIBLE_CORE[1]
+        and hasattr(basic, "_ANSIBLE_ARGS")
+        and isinstance(getattr(module_warnings, "_global_warnings", None), list)
+        and isinstance(getattr(module_warnings, "_global_deprecations", None), list)
+    )
+
+
+def worker_path(directory: Optional[str]) -> str:
+    """
+    Return the control path of the worker for this controller.
+
+    The path changes with the interpreter and with the module_utils of the collection, so
+    that an upgraded collection starts a new worker instead of running in the old one.
+    """
+    stamps = []
+    for name in sorted(os.listdir(_MODULE_UTILS_DIR)):
+        if name.endswith(".py"):
+            stamps.append(f"{name}:{os.stat(os.path.join(_MODULE_UTILS_DIR, name)).st_mtime_ns}")
+    code_digest = hashlib.sha256("\0".join(stamps).encode()).hexdigest()
+    return control_path(directory, "flightctl-api", os.path.realpath(__file__), code_digest)
+
+
+def run(path: str, request: bytes, idle_timeout: float) -> Dict[str, Any]:
+    """
+    Run a module in the worker listening on ``path``, starting the worker if needed.
+
+    Args:
+        path (str): The control path of the worker.
+        request (bytes): The JSON encoded arguments of run_module.
+        idle_timeout (float): Seconds a worker started by this call waits for the next request.
+
+    Returns:
+        Dict[str, Any]: The response of the worker, see run_module.
+
+    Raises:
+        WorkerError: If the worker failed to start, or did not answer.
+    """
+    try:
+        sock = _connect_or_spawn(path, idle_timeout)
+    except Exception as e:
+        raise WorkerError(f"Unable to start the API worker: {e}") from e
+
+    try:
+        send_frame(sock, request)
+        response = recv_frame(sock)
+    except OSError as e:
+        raise WorkerError(f"Lost the API worker: {e}") from e
+    finally:
+        sock.close()
+
+    if response is None:
+        raise WorkerError("The API worker exited before returning the result of the module")
+    return json.loads(response)
+
+
+def _connect_or_spawn(path: str, idle_timeout: float) -> socket.socket:
+    try:
+        return connect(path)
+    except OSError:
+        pass
+
+    with spawn_lock(path):
+        # Another fork may have started the worker while we waited for the lock
+        try:
+            return connect(path)
+        except OSError:
+            pass
+        spawn_daemon(path, setup=_setup, serve=lambda listener, state: serve(listener, state, idle_timeout))
+        return connect(path)
+
+
+def _setup() -> Dict[str, Any]:
+    """Enable the caches of the modules in the worker, for as long as it runs."""
+    # Only the worker imports the client, the action plugins do not need it
+    from ..module_utils.api_module import FlightctlAPIModule
+    from ..module_utils.core import FlightctlModule
+
+    FlightctlModule.config_cache = {}
+    FlightctlAPIModule.client_cache = {}
+    return FlightctlModule.config_cache
+
+
+def serve(listener: socket.socket, config_cache: Dict[Any, Any], idle_timeout: float) -> None:
+    """Run the modules clients ask for until the worker has been idle for ``idle_timeout`` seconds."""
+    listener.settimeout(min(idle_timeout, _POLL_INTERVAL))
+    idle = 0.0
+    try:
+        while idle < idle_timeout:
+            try:
+                client, _addr = listener.accept()
+            except socket.timeout:
+                idle += listener.gettimeout()
+                continue
+
+            idle = 0.0
+            client.settimeout(None)
+            try:
+                request = recv_frame(client)
+                if request:
+                    send_frame(client, json.dumps(run_module(**json.loads(request))).encode())
+            except OSError:
+                pass
+            finally:
+                client.close()
+    finally:
+        # CA files written from config files were kept for the clients, remove them now
+        for key, value in config_cache.items():
+            if key[0] == "ca_data":
+                with contextlib.suppress(OSError):
+                    os.unlink(value)
+
+
+def run_module(module: str, args: Dict[str, Any], environment: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Run a module in this process, like it would run as a script.
+
+    Args:
+        module (str): The import path of the module.
+        args (Dict[str, Any]): The arguments of the module, including the internal ones.
+        environment (Dict[str, str]): The environment of the task, for the options that
+            fall back to environment variables.
+
+    Returns:
+        Dict[str, Any]: The ``rc`` the module exited with and its ``stdout``.  When the module
+        raised instead of exiting, ``rc`` is 1 and ``stderr`` holds the traceback.
+
+    The arguments, the environment and the collected warnings are process-wide, so modules
+    must run one at a time, and only when internals_supported is true.
+    """
+    stdout = io.StringIO()
+    saved_environment = dict(os.environ)
+    os.environ.clear()
+    os.environ.update(environment)
+    # Warnings and deprecations are collected per process, they must not carry over
+    del module_warnings._global_warnings[:]
+    del module_warnings._global_deprecations[:]
+    basic._ANSIBLE_ARGS = json.dumps({"ANSIBLE_MODULE_ARGS": args}).encode()
+    rc = 0
+    try:
+        with contextlib.redirect_stdout(stdout):
+            importlib.import_module(module).main()
+    except SystemExit as e:
+        rc = e.code if isinstance(e.code, int) else 1 if e.code else 0
+    except Exception:
+        return {"rc": 1, "stdout": stdout.getvalue(), "stderr": traceback.format_exc()}
+    finally:
+        basic._ANSIBLE_ARGS = None
+        os.environ.clear()
+        os.environ.update(saved_environment)
+    return {"rc": rc, "stdout": stdout.getvalue(), "stderr": ""}
+
+
+class ApiWorkerAction(NormalActionModule):
+    """
+    Runs the module of the same name in the API worker, when the worker is enabled.
+
+    The worker is enabled with the ``flightctl_api_worker`` variable, or the
+    ``FLIGHTCTL_API_WORKER`` environment variable.  It is only used for tasks that run
+    on the controller without become or async, and with the releases of ansible-core it
+    supports, the module runs as usual otherwise.
+    """
+
+    def run(self, tmp=None, task_vars=None):
+        task_vars = task_vars or {}
+        idle_timeout = self._worker_idle_timeout(task_vars)
+        if idle_timeout is None:
+            return super().run(tmp, task_vars)
+
+        result = ActionBase.run(self, tmp, task_vars)
+        del tmp
+
+        module_args = self._task.args.copy()
+        self._update_module_args(self._task.action, module_args, task_vars)
+        module = type(self).__module__.replace(".plugins.action.", ".plugins.modules.")
+        request = json.dumps(
+            {"module": module, "args": module_args, "environment": self._worker_environment()},
+            cls=AnsibleJSONEncoder, vault_to_text=True,
+        )
+
+        path = worker_path(None)
+        display.vvv(f"Running {self._task.action} in the API worker at {path}")
+        try:
+            response = run(path, request.encode(), idle_timeout)
+        except WorkerError as e:
+            raise AnsibleActionFail(str(e)) from e
+
+        data = self._parse_returned_data(response)
+        data.pop("_ansible_suppress_tmpdir_delete", None)
+        remove_internal_keys(data)
+        return merge_hash(result, wrap_var(data))
+
+    def _worker_idle_timeout(self, task_vars):
+        """Returns the idle timeout of the worker if this task runs in it, None otherwise."""
+        enabled = task_vars.get("flightctl_api_worker", os.environ.get("FLIGHTCTL_API_WORKER", False))
+        try:
+            enabled = boolean(self._templar.template(enabled), strict=True)
+        except TypeError as e:
+            raise AnsibleActionFail(f"flightctl_api_worker must be a boolean: {e}") from e
+        if not enabled:
+            return None
+        if not internals_supported():
+            display.vvv(
+                f"Not running {self._task.action} in the API worker, ansible-core {ansible_core_version} is not supported"
+            )
+            return None
+        if self._connection.transport != "local" or self._play_context.become or self._task.async_val:
+            display.vvv(f"Not running {self._task.action} in the API worker, it does not run locally")
+            return None
+
+        idle_timeout = self._templar.template(task_vars.get("flightctl_api_worker_timeout", DEFAULT_IDLE_TIMEOUT))
+        try:
+            return float(idle_timeout)
+        except (TypeError, ValueError) as e:
+            raise AnsibleActionFail(f"flightctl_api_worker_timeout must be a number: {e}") from e
+
+    def _worker_environment(self):
+        """Returns the environment the module would run with, with the environment of the task."""
+        environment = dict(os.environ)
+        environments = self._task.environment or []
+        if not isinstance(environments, list):
+            environments = [environments]
+        for task_environment in environments:
+            if not task_environment:
+                continue
+            task_environment = self._templar.template(task_environment)
+            if not isinstance(task_environment, dict):
+                raise AnsibleError(f"environment must be a dictionary, received {task_environment}")
+            environment.update((str(key), str(value)) for key, value in task_environment.items())
+        return environment
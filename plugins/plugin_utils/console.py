@@ -0,0 +1,129 @@
+# coding: utf-8 -*-
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""Shared pieces of the device console protocol.
+
+The console endpoint speaks the v5.channel.k8s.io WebSocket subprotocol: each message
+starts with a single byte naming the channel, followed by the channel data.  The SSL
+contexts of the console sessions are shared by the connection and the batch action.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import functools
+import json
+import re
+import ssl
+import urllib.parse
+
+SUBPROTOCOL = "v5.channel.k8s.io"
+
+STD_IN_CHANNEL = 0
+STD_OUT_CHANNEL = 1
+STD_ERR_CHANNEL = 2
+STREAM_ERR_CHANNEL = 3
+
+# Tag of the entries written to the device journal for console activity
+AUDIT_LOG_TAG = "ansible-console"
+
+
+def audit_log_command(event: str) -> str:
+    """Build the shell command that records ``event`` in the device journal."""
+    return f"echo {event} | systemd-cat -t {AUDIT_LOG_TAG}"
+
+
+def console_metadata() -> str:
+    """Build the JSON metadata payload that starts a non-interactive shell."""
+    metadata = {
+        "tty": False,
+        "command": {
+            "command": "",
+            "args": [],
+        },
+    }
+    return json.dumps(metadata)
+
+
+def console_url(host_url: str, device_name: str) -> str:
+    """Build the console WebSocket URL of a device from the API server URL."""
+    # Remove any trailing slashes
+    host_url = host_url.rstrip('/')
+
+    # Strip the https protocol if present
+    if re.match("^https{0,1}://", host_url):
+        host_url = host_url.split("://", 1)[1]
+
+    # Add wss:// prefix if not already present
+    if not host_url.startswith("wss://"):
+        host_url = f"wss://{host_url}"
+
+    encoded_metadata = urllib.parse.quote(console_metadata())
+
+    return f"{host_url}/ws/v1/devices/{device_name}/console?metadata={encoded_metadata}"
+
+
+class ResumableSSLContext(ssl.SSLContext):
+    """SSL context that resumes the last TLS session seen for a server.
+
+    Reconnecting to the same API host then skips the full TLS handshake.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.sessions = {}
+
+    def wrap_socket(self, sock, *args, server_hostname=None, session=None, **kwargs):
+        if session is None:
+            session = self.sessions.get(server_hostname)
+        ssl_sock = super().wrap_socket(sock, *args, server_hostname=server_hostname, session=session, **kwargs)
+        self.remember_session(ssl_sock)
+        return ssl_sock
+
+    def remember_session(self, ssl_sock):
+        """Store the session of ``ssl_sock``, TLS 1.3 tickets only arrive after the handshake."""
+        try:
+            session = ssl_sock.session
+        except (OSError, ValueError):
+            return
+        if session is not None:
+            self.sessions[ssl_sock.server_hostname] = session
+
+
+@functools.lru_cache(maxsize=None)
+def _default_context():
+    """Return the context of ssl.create_default_context, whose settings depend on the Python release."""
+    return ssl.create_default_context()
+
+
+# SSL contexts are expensive to build (the CA bundle is parsed every time), so they are
+# shared by every connection in the process that uses the same certificate settings.
+_SSL_CONTEXTS = {}
+
+
+def get_ssl_context(validate_certs, ca_path=None, ca_data=None):
+    """Return the cached SSL context for the given certificate settings."""
+    key = (bool(validate_certs), ca_path, ca_data)
+    context = _SSL_CONTEXTS.get(key)
+    if context is None:
+        context = ResumableSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        # ssl.create_default_context cannot build a subclass, its settings are copied instead
+        default = _default_context()
+        context.verify_flags = default.verify_flags
+        context.options = default.options
+        if getattr(default, "keylog_filename", None):
+            context.keylog_filename = default.keylog_filename
+        if validate_certs:
+            if ca_path:
+                context.load_verify_locations(cafile=ca_path)
+            elif ca_data:
+                context.load_verify_locations(cadata=ca_data)
+            else:
+                context.load_default_certs()
+        else:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        _SSL_CONTEXTS[key] = context
+    return context
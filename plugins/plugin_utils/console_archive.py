@@ -0,0 +1,129 @@
+# coding: utf-8 -*-
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""Copy directory trees to a device console as a single tar archive.
+
+Rather than one upload per file, the files that differ from the device are packed in
+a gzip compressed tar archive, which the connection plugin uploads and unpacks with
+one command.  Files are compared by their sha256 checksum, with one command listing
+the checksums of every destination file.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import hashlib
+import os
+import posixpath
+import shlex
+import tarfile
+from typing import BinaryIO, List, Tuple
+
+# Echoed for every destination directory that does not exist
+MISSING_DIR_MARKER = "__ANSIBLE_MISSING_DIR__"
+
+
+class Tree:
+    """Files and directories under a local ``root``, as relative POSIX paths."""
+
+    def __init__(self, root: str, files: List[str], dirs: List[str]) -> None:
+        self.root = root
+        self.files = files
+        self.dirs = dirs
+
+    def local_path(self, path: str) -> str:
+        return os.path.join(self.root, *path.split("/"))
+
+
+def collect_tree(src: str, contents_only: bool = False) -> Tree:
+    """List the files to copy from ``src``, following symbolic links.
+
+    Like ``ansible.builtin.copy``, a directory is copied with its name unless
+    ``contents_only`` is set, which is the case when ``src`` ends with a slash.
+    """
+    src = os.path.normpath(src)
+    if not os.path.isdir(src):
+        return Tree(os.path.dirname(src), [os.path.basename(src)], [])
+
+    if contents_only:
+        root, prefix = src, ""
+    else:
+        root, prefix = os.path.dirname(src), os.path.basename(src)
+
+    files = []
+    dirs = [prefix] if prefix else []
+    for dirpath, dirnames, filenames in os.walk(src, followlinks=True):
+        dirnames.sort()
+        rel_dir = os.path.relpath(dirpath, src)
+        rel_dir = "" if rel_dir == "." else rel_dir.replace(os.sep, "/")
+        base = posixpath.join(prefix, rel_dir) if rel_dir else prefix
+        dirs.extend(posixpath.join(base, name) if base else name for name in dirnames)
+        files.extend(posixpath.join(base, name) if base else name for name in sorted(filenames))
+    return Tree(root, files, dirs)
+
+
+def manifest_command(dest: str, tree: Tree) -> str:
+    """Build a command that lists the checksums of the files of ``tree`` under ``dest``.
+
+    Missing files are left out, and missing directories are reported with
+    MISSING_DIR_MARKER, as ``.`` when ``dest`` itself does not exist.  The command
+    runs in a subshell, so that it does not change the directory of the console shell.
+    """
+    files = " ".join(shlex.quote(path) for path in tree.files)
+    dirs = " ".join(shlex.quote(path) for path in tree.dirs)
+    checks = [f"sha256sum -- {files} 2>/dev/null"] if files else []
+    if dirs:
+        checks.append(f'for d in {dirs}; do [ -d "$d" ] || echo "{MISSING_DIR_MARKER} $d"; done')
+    checks.append("true")
+    return f"(if cd {shlex.quote(dest)} 2>/dev/null; then {'; '.join(checks)}; else echo \"{MISSING_DIR_MARKER} .\"; fi)"
+
+
+def compare_tree(tree: Tree, manifest: str) -> Tuple[List[str], List[str]]:
+    """Compare ``tree`` with the output of ``manifest_command``.
+
+    Returns:
+        The files that are missing or differ on the device, and the missing directories.
+    """
+    remote = {}
+    missing_dirs = set()
+    for line in manifest.splitlines():
+        if line.startswith(MISSING_DIR_MARKER + " "):
+            missing_dirs.add(line[len(MISSING_DIR_MARKER) + 1:])
+            continue
+        digest, sep, path = line.partition("  ")
+        # Names with special characters are escaped by sha256sum, those are always copied
+        if sep and not digest.startswith("\\"):
+            remote[path] = digest
+
+    if "." in missing_dirs:
+        return list(tree.files), list(tree.dirs)
+
+    changed = [path for path in tree.files if remote.get(path) != _sha256(tree.local_path(path))]
+    return changed, [path for path in tree.dirs if path in missing_dirs]
+
+
+def build_archive(tree: Tree, files: List[str], dirs: List[str], fileobj: BinaryIO) -> None:
+    """Write a gzip compressed tar archive of ``files`` and ``dirs`` of ``tree`` to ``fileobj``.
+
+    Members are owned by root, and keep their local permissions.
+    """
+    def owned_by_root(info: tarfile.TarInfo) -> tarfile.TarInfo:
+        info.uid = info.gid = 0
+        info.uname = info.gname = "root"
+        return info
+
+    with tarfile.open(fileobj=fileobj, mode="w:gz", dereference=True) as archive:
+        for path in dirs:
+            archive.add(tree.local_path(path), arcname=path, recursive=False, filter=owned_by_root)
+        for path in files:
+            archive.add(tree.local_path(path), arcname=path, recursive=False, filter=owned_by_root)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
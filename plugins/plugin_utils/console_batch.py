@@ -0,0 +1,191 @@
+# coding: utf-8 -*-
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""Run a single command on the consoles of many devices from one process.
+
+Every device gets its own console WebSocket, and all of them are driven by one asyncio
+event loop, so checking hundreds of devices does not need hundreds of Ansible forks.
+The number of sessions open at the same time is bounded by ``concurrency``.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import asyncio
+import secrets
+import ssl
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from websockets.asyncio.client import connect
+    from websockets.exceptions import ConnectionClosed
+except ImportError as imp_exc:
+    WEBSOCKETS_IMPORT_ERROR = imp_exc
+else:
+    WEBSOCKETS_IMPORT_ERROR = None
+
+from .console import (
+    STD_ERR_CHANNEL,
+    STD_IN_CHANNEL,
+    STD_OUT_CHANNEL,
+    STREAM_ERR_CHANNEL,
+    SUBPROTOCOL,
+    audit_log_command,
+    console_url,
+)
+
+# Prefix of the marker echoed after the command together with its exit status
+RC_MARKER = "__ANSIBLE_BATCH_RC__"
+
+# Event recorded in the device journal for each value of the audit_log option.  Every
+# session runs a single command, so both log once per device.
+AUDIT_LOG_EVENTS = {"command": "exec_command", "session": "console_session", "off": None}
+
+
+def new_marker() -> str:
+    """Return an exit status marker unique to one command.
+
+    A fixed marker could appear in the output of the command, for instance when it
+    prints a log of an earlier batch, and would end that output early with a wrong rc.
+    """
+    return f"{RC_MARKER}{secrets.token_hex(8)}"
+
+
+def wrap_command(command: str, marker: str, audit_event: Optional[str] = None) -> str:
+    """Wrap ``command`` so that its exit status is reported after its output, behind ``marker``.
+
+    The command runs in a subshell with stdin closed, so that it cannot consume the
+    lines that follow it, and the remote shell exits once the status is reported.
+    With ``audit_event`` set, the event is recorded in the device journal first.
+    """
+    audit = f"{audit_log_command(audit_event)}\n" if audit_event else ""
+    return f'{audit}(\n{command}\n) </dev/null\necho "{marker}$?"\nexit\n'
+
+
+async def _run_command(ws: Any, command: str, audit_event: Optional[str] = None) -> Tuple[int, bytes, bytes]:
+    """Run ``command`` over an open console WebSocket, returns the rc, stdout and stderr."""
+    marker = new_marker()
+    await ws.send(bytes([STD_IN_CHANNEL]) + wrap_command(command, marker, audit_event).encode())
+
+    marker = marker.encode()
+    marker_pos = -1
+    stdout = bytearray()
+    stderr = bytearray()
+    while True:
+        try:
+            message = await ws.recv()
+        except ConnectionClosed as e:
+            raise RuntimeError("console closed before the command completed") from e
+
+        channel = message[0]
+        content = message[1:]
+        if channel == STD_OUT_CHANNEL:
+            # The marker may be split between two messages
+            search_from = max(0, len(stdout) - len(marker))
+            stdout += content
+            if marker_pos < 0:
+                marker_pos = stdout.find(marker, search_from)
+            if marker_pos >= 0:
+                end = stdout.find(b"\n", marker_pos)
+                if end >= 0:
+                    rc = int(stdout[marker_pos + len(marker):end])
+                    return rc, bytes(stdout[:marker_pos]), bytes(stderr)
+        elif channel == STD_ERR_CHANNEL:
+            stderr += content
+        elif channel == STREAM_ERR_CHANNEL:
+            raise RuntimeError(f"Stream error occurred: {content.decode(errors='replace')}")
+
+
+async def _run_on_device(
+    device: str, command: str, host_url: str, timeout: float, audit_event: Optional[str], **connect_kwargs: Any,
+) -> Dict[str, Any]:
+    """Open a console session to ``device`` and run ``command`` within ``timeout`` seconds."""
+
+    async def session() -> Tuple[int, bytes, bytes]:
+        async with connect(console_url(host_url, device), **connect_kwargs) as ws:
+            return await _run_command(ws, command, audit_event)
+
+    result: Dict[str, Any] = {"device": device}
+    try:
+        rc, stdout, stderr = await asyncio.wait_for(session(), timeout)
+    except asyncio.TimeoutError:
+        result.update(failed=True, msg=f"Command timed out after {timeout} seconds")
+    except Exception as e:
+        result.update(failed=True, unreachable=True, msg=str(e) or e.__class__.__name__)
+    else:
+        result.update(
+            rc=rc,
+            stdout=stdout.decode(errors="replace").rstrip("\r\n"),
+            stderr=stderr.decode(errors="replace").rstrip("\r\n"),
+            failed=rc != 0,
+        )
+    return result
+
+
+async def run_batch(
+    devices: List[str],
+    command: str,
+    host_url: str,
+    token: Optional[str] = None,
+    ssl_context: Optional[ssl.SSLContext] = None,
+    concurrency: int = 50,
+    timeout: float = 60,
+    compression: Optional[str] = "deflate",
+    audit_log: str = "command",
+) -> List[Dict[str, Any]]:
+    """Run ``command`` on every device and collect the results.
+
+    Args:
+        devices (List[str]): Names of the devices to run the command on.
+        command (str): The shell command to run.
+        host_url (str): URL of the Flight Control API server.
+        token (str): Bearer token used to authenticate.
+        ssl_context (ssl.SSLContext): SSL context shared by all the sessions.
+        concurrency (int): Maximum number of console sessions open at the same time.
+        timeout (float): Seconds allowed for each device, including opening the session.
+        compression (str): WebSocket compression to negotiate, None disables it.
+        audit_log (str): How the command is recorded in the device journal, see AUDIT_LOG_EVENTS.
+
+    Returns:
+        List[Dict[str, Any]]: One result per device, in the order of ``devices``.
+    """
+    if WEBSOCKETS_IMPORT_ERROR:
+        raise WEBSOCKETS_IMPORT_ERROR
+
+    audit_event = AUDIT_LOG_EVENTS[audit_log]
+    semaphore = asyncio.Semaphore(concurrency)
+    connect_kwargs: Dict[str, Any] = dict(
+        additional_headers={"Authorization": f"Bearer {token}"} if token else {},
+        subprotocols=[SUBPROTOCOL],
+        compression=compression,
+    )
+    if ssl_context is not None:
+        connect_kwargs["ssl"] = ssl_context
+
+    async def run_one(device: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await _run_on_device(device, command, host_url, timeout, audit_event, **connect_kwargs)
+
+    return list(await asyncio.gather(*(run_one(device) for device in devices)))
+
+
+def run(devices: List[str], command: str, host_url: str, **kwargs: Any) -> List[Dict[str, Any]]:
+    """Synchronous wrapper around ``run_batch``."""
+    return asyncio.run(run_batch(devices, command, host_url, **kwargs))
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Return the task result for the results of the devices.
+
+    The task changed something when the command may have run on a device, that is when it
+    completed or timed out there, and it failed when the command failed on any device.
+    """
+    summary: Dict[str, Any] = {"changed": any(not result.get("unreachable") for result in results)}
+    failed = [result["device"] for result in results if result["failed"]]
+    if failed:
+        summary.update(
+            failed=True, msg=f"The command failed on {len(failed)} of {len(results)} devices: {', '.join(failed)}",
+        )
+    return summary
@@ -0,0 +1,179 @@
+# coding: utf-8 -*-
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""Console session multiplexer for the flightctl_console connection plugin.
+
+The multiplexer is a persistent daemon (see ``persistent.py``) that owns the device
+console WebSocket.  Every Ansible fork that targets the same device connects to the
+daemon's UNIX socket instead of opening its own WebSocket, and each WebSocket message
+is relayed verbatim as one frame in either direction.  Clients are served one at a
+time, which matches how Ansible runs tasks against a single host, and device output
+that arrives while no client is attached is dropped.
+
+Sending an empty frame asks the daemon to close the WebSocket and exit.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import socket
+import threading
+import time
+from typing import Any, Optional
+
+try:
+    from websockets.exceptions import ConnectionClosed, ConnectionClosedError
+except ImportError as imp_exc:
+    WEBSOCKETS_IMPORT_ERROR = imp_exc
+else:
+    WEBSOCKETS_IMPORT_ERROR = None
+
+from .persistent import connect, recv_frame, send_frame
+
+# How often an idle daemon checks whether it should exit.
+_POLL_INTERVAL = 1.0
+
+# How long a client waits for the daemon to stop after asking it to.
+_SHUTDOWN_TIMEOUT = 10.0
+
+
+class MuxClient:
+    """A WebSocket stand-in that talks to the multiplexer daemon.
+
+    Only the subset of the ``websockets`` connection API used by the connection
+    plugin is provided.  A lost daemon is reported as ``ConnectionClosedError`` so that
+    callers can handle it exactly like a dropped WebSocket.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._sock = connect(path)
+
+    def send(self, message: bytes) -> None:
+        try:
+            send_frame(self._sock, message)
+        except OSError as e:
+            raise ConnectionClosedError(None, None) from e
+
+    def recv(self, timeout: Optional[float] = None) -> bytes:
+        """Receive the next message, raises TimeoutError if none arrives within ``timeout`` seconds.
+
+        The client cannot be used any more after a timeout, as part of a frame may have been read.
+        """
+        self._sock.settimeout(timeout)
+        try:
+            frame = recv_frame(self._sock)
+        except TimeoutError:
+            raise
+        except OSError as e:
+            raise ConnectionClosedError(None, None) from e
+        if frame is None:
+            raise ConnectionClosedError(None, None)
+        return frame
+
+    def shutdown(self) -> None:
+        """Ask the daemon to close the device session and wait for it to stop listening."""
+        self._sock.settimeout(_SHUTDOWN_TIMEOUT)
+        try:
+            send_frame(self._sock, b"")
+            while recv_frame(self._sock) is not None:
+                pass
+        except OSError:
+            pass
+        self.close()
+
+    def close(self) -> None:
+        self._sock.close()
+
+
+class _Relay:
+    """Relays WebSocket messages to whichever client is currently attached."""
+
+    def __init__(self, ws: Any) -> None:
+        self.ws = ws
+        self.closed = threading.Event()
+        self._lock = threading.Lock()
+        self._client: Optional[socket.socket] = None
+
+    def attach(self, client: Optional[socket.socket]) -> None:
+        with self._lock:
+            self._client = client
+
+    def forward_messages(self) -> None:
+        """Forward messages from the device, output arriving while detached is dropped."""
+        try:
+            while True:
+                message = self.ws.recv()
+                with self._lock:
+                    if self._client is None:
+                        continue
+                    try:
+                        send_frame(self._client, message)
+                    except OSError:
+                        self._client = None
+        except ConnectionClosed:
+            pass
+        finally:
+            self.closed.set()
+            with self._lock:
+                if self._client is not None:
+                    try:
+                        self._client.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+
+
+def serve(listener: socket.socket, ws: Any, idle_timeout: float) -> None:
+    """Relay clients to ``ws`` until the daemon has been idle for ``idle_timeout`` seconds.
+
+    The daemon also exits once the device closes the WebSocket, or when a client asks
+    for it with an empty frame.
+    """
+    relay = _Relay(ws)
+    threading.Thread(target=relay.forward_messages, daemon=True).start()
+
+    listener.settimeout(min(idle_timeout, _POLL_INTERVAL))
+    idle_since = time.monotonic()
+    try:
+        while not relay.closed.is_set():
+            try:
+                client, _addr = listener.accept()
+            except socket.timeout:
+                if time.monotonic() - idle_since >= idle_timeout:
+                    return
+                continue
+
+            client.settimeout(None)
+            relay.attach(client)
+            try:
+                if not _forward_client_frames(client, ws):
+                    # Stop accepting before the client is released, so that it cannot
+                    # reattach to this daemon while it is shutting down.
+                    listener.close()
+                    return
+            finally:
+                relay.attach(None)
+                client.close()
+            idle_since = time.monotonic()
+    finally:
+        try:
+            ws.close()
+        except Exception:
+            pass
+
+
+def _forward_client_frames(client: socket.socket, ws: Any) -> bool:
+    """Send client frames to the device, returns False once the daemon should exit."""
+    try:
+        while True:
+            frame = recv_frame(client)
+            if frame is None:
+                return True
+            if not frame:
+                return False
+            ws.send(frame)
+    except ConnectionClosed:
+        return False
+    except OSError:
+        return True
@@ -0,0 +1,126 @@
+# coding: utf-8 -*-
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""Traffic and latency counters for device console sessions."""
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import json
+import time
+from typing import Any, Dict, Optional
+
+from .console import STD_ERR_CHANNEL, STD_IN_CHANNEL, STD_OUT_CHANNEL, STREAM_ERR_CHANNEL
+
+CHANNEL_NAMES = {
+    STD_IN_CHANNEL: "stdin",
+    STD_OUT_CHANNEL: "stdout",
+    STD_ERR_CHANNEL: "stderr",
+    STREAM_ERR_CHANNEL: "error",
+}
+
+
+class SessionStats:
+    """Counters describing the traffic and latency of one console session.
+
+    Bytes and frames are counted per channel as messages before compression, time to
+    first byte is measured from the end of sending a command to its first output, and
+    transfers record the file bytes moved by put_file and fetch_file.
+    """
+
+    def __init__(self, device: Optional[str] = None) -> None:
+        self.device = device
+        self.started = time.time()
+        self._opened = time.monotonic()
+        self.bytes: Dict[str, Dict[str, int]] = {"sent": {}, "received": {}}
+        self.frames: Dict[str, Dict[str, int]] = {"sent": {}, "received": {}}
+        self.commands: Dict[str, int] = {}
+        self.command_seconds = 0.0
+        self.command_seconds_max = 0.0
+        self.first_byte_seconds = 0.0
+        self.first_byte_seconds_max = 0.0
+        self.first_byte_count = 0
+        self.transfers: Dict[str, Dict[str, float]] = {}
+
+    def count_frame(self, direction: str, message: bytes) -> None:
+        """Count a message ``sent`` or ``received``, the first byte names its channel."""
+        channel = CHANNEL_NAMES.get(message[0], str(message[0])) if message else "unknown"
+        self.bytes[direction][channel] = self.bytes[direction].get(channel, 0) + len(message)
+        self.frames[direction][channel] = self.frames[direction].get(channel, 0) + 1
+
+    def count_command(self, kind: str, seconds: float, first_byte: Optional[float]) -> None:
+        """Count a completed command of ``kind`` (exec, put or fetch)."""
+        self.commands[kind] = self.commands.get(kind, 0) + 1
+        self.command_seconds += seconds
+        self.command_seconds_max = max(self.command_seconds_max, seconds)
+        if first_byte is not None:
+            self.first_byte_count += 1
+            self.first_byte_seconds += first_byte
+            self.first_byte_seconds_max = max(self.first_byte_seconds_max, first_byte)
+
+    def count_transfer(self, kind: str, size: int, seconds: float) -> None:
+        """Count a file transfer of ``kind`` (put or fetch)."""
+        transfer = self.transfers.setdefault(kind, {"files": 0, "bytes": 0, "seconds": 0.0})
+        transfer["files"] += 1
+        transfer["bytes"] += size
+        transfer["seconds"] += seconds
+
+    def total_bytes(self, direction: str) -> int:
+        return sum(self.bytes[direction].values())
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Summarize the counters as a JSON serializable dict."""
+        command_count = sum(self.commands.values())
+        return {
+            "device": self.device,
+            "started": self.started,
+            "duration": round(time.monotonic() - self._opened, 6),
+            "bytes": self.bytes,
+            "frames": self.frames,
+            "commands": self.commands,
+            "command_seconds": round(self.command_seconds, 6),
+            "command_seconds_avg": round(self.command_seconds / command_count, 6) if command_count else None,
+            "command_seconds_max": round(self.command_seconds_max, 6),
+            "first_byte_seconds_avg": (
+                round(self.first_byte_seconds / self.first_byte_count, 6) if self.first_byte_count else None
+            ),
+            "first_byte_seconds_max": round(self.first_byte_seconds_max, 6),
+            "transfers": {
+                kind: dict(
+                    transfer,
+                    seconds=round(transfer["seconds"], 6),
+                    bytes_per_second=round(transfer["bytes"] / transfer["seconds"]) if transfer["seconds"] else None,
+                )
+                for kind, transfer in self.transfers.items()
+            },
+        }
+
+    def summary(self) -> str:
+        """Describe the counters on a single line."""
+        stats = self.as_dict()
+        parts = [
+            f"{sum(self.commands.values())} commands in {stats['command_seconds']:.3f}s "
+            f"(max {stats['command_seconds_max']:.3f}s)",
+        ]
+        if stats["first_byte_seconds_avg"] is not None:
+            parts.append(
+                f"first byte avg {stats['first_byte_seconds_avg'] * 1000:.1f}ms "
+                f"max {stats['first_byte_seconds_max'] * 1000:.1f}ms"
+            )
+        for direction in ("sent", "received"):
+            channels = ", ".join(
+                f"{channel} {size}B/{self.frames[direction][channel]}" for channel, size in sorted(self.bytes[direction].items())
+            )
+            parts.append(f"{direction} {self.total_bytes(direction)}B ({channels or 'nothing'})")
+        for kind, transfer in sorted(stats["transfers"].items()):
+            rate = transfer["bytes_per_second"]
+            parts.append(f"{kind} {transfer['bytes']}B in {transfer['files']} files at {rate if rate is not None else 'n/a'}B/s")
+        return "; ".join(parts)
+
+    def append_to(self, path: str) -> None:
+        """Append the counters to a JSON lines file."""
+        line = json.dumps(self.as_dict(), sort_keys=True) + "\n"
+        with open(path, "a") as stats_file:
+            stats_file.write(line)
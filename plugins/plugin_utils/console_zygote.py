@@ -0,0 +1,159 @@
+# coding: utf-8 -*-
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""Python exec server run on the device by the flightctl_console connection plugin.
+
+This file is sent to the device and run by its Python interpreter, it must only use
+the standard library and stay compatible with the oldest Python a device may have.
+
+The server takes over the stdin of the console shell and answers requests until it
+is asked to exit, at which point the shell reads its stdin again.  Each request is a
+line of base64 encoded JSON, and each response is base64 encoded JSON followed by the
+``marker`` of its request and a newline.  The server exits on a request it cannot
+read, since it has no marker to answer it with.
+
+Requests with ``argv`` run Python code in a child forked from the server, which has
+the modules used by Ansible modules imported already: the script ``argv[0]``, or the
+code read from stdin when ``argv`` is empty, as pipelining does.  Requests with
+``cmd`` run a shell command in a new shell, from the working directory and with the
+environment of the server, which do not change between requests.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import base64
+import json
+import os
+import runpy
+import subprocess
+import sys
+import tempfile
+import traceback
+
+READY_LINE = b"__ANSIBLE_ZYGOTE__ ready"
+
+# Imported once by the server, instead of by every module run
+PRELOAD = (
+    "datetime", "errno", "grp", "hashlib", "locale", "platform", "pwd", "re", "select",
+    "shlex", "shutil", "signal", "stat", "syslog", "time", "types", "zipfile", "zipimport",
+)
+
+
+def _exit_code(code):
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _run_python(argv, env, stdin):
+    """Run Python code in a forked child, returns its exit status, stdout and stderr."""
+    files = [tempfile.TemporaryFile() for _fd in range(3)]
+    files[0].write(stdin)
+    files[0].seek(0)
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    pid = os.fork()
+    if pid == 0:
+        rc = 1
+        try:
+            for fd, f in enumerate(files):
+                os.dup2(f.fileno(), fd)
+            os.environ.update(env)
+            if argv:
+                sys.argv = list(argv)
+                runpy.run_path(argv[0], run_name="__main__")
+            else:
+                sys.argv = [""]
+                code = compile(sys.stdin.buffer.read(), "<stdin>", "exec")
+                exec(code, {"__name__": "__main__"})
+            rc = 0
+        except SystemExit as e:
+            rc = _exit_code(e.code)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(rc)
+
+    _pid, status = os.waitpid(pid, 0)
+    rc = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    outputs = []
+    for f in files[1:]:
+        f.seek(0)
+        outputs.append(f.read())
+    for f in files:
+        f.close()
+    return rc, outputs[0], outputs[1]
+
+
+def _run_shell(cmd, stdin):
+    proc = subprocess.Popen(cmd, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = proc.communicate(stdin)
+    return proc.returncode, stdout, stderr
+
+
+def _log(message):
+    try:
+        import syslog
+        syslog.openlog("ansible-console")
+        syslog.syslog(message)
+    except Exception:
+        pass
+
+
+def handle(request):
+    """Run a request, returns the response."""
+    if request.get("log"):
+        _log(request["log"])
+    stdin = base64.b64decode(request.get("stdin", ""))
+    if "argv" in request:
+        rc, stdout, stderr = _run_python(request["argv"], request.get("env", {}), stdin)
+    else:
+        rc, stdout, stderr = _run_shell(request["cmd"], stdin)
+    return {
+        "rc": rc,
+        "stdout": base64.b64encode(stdout).decode(),
+        "stderr": base64.b64encode(stderr).decode(),
+    }
+
+
+def serve(stdin, stdout):
+    """Answer requests read from ``stdin`` until asked to exit or stdin closes."""
+    for name in PRELOAD:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+
+    stdout.write(READY_LINE + b"\n")
+    stdout.flush()
+    for line in iter(stdin.readline, b""):
+        try:
+            request = json.loads(base64.b64decode(line).decode())
+            if request.get("exit"):
+                return
+            marker = request["marker"]
+        except Exception:
+            # A request that cannot be read cannot be answered either, without its marker.
+            # Exiting hands stdin back to the shell, which tells the client.
+            return
+        try:
+            response = handle(request)
+        except Exception:
+            response = {"rc": 1, "stdout": "", "stderr": base64.b64encode(traceback.format_exc().encode()).decode()}
+        stdout.write(base64.b64encode(json.dumps(response).encode()) + marker.encode() + b"\n")
+        stdout.flush()
+
+
+if __name__ == "__main__":
+    serve(sys.stdin.buffer, sys.stdout.buffer)
@@ -0,0 +1,217 @@
+# coding: utf-8 -*-
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""Helpers for controller-side persistent daemons.
+
+A persistent daemon is a detached process listening on a UNIX socket in a control
+directory, similar to the control master used by SSH ControlPersist.  Ansible forks
+connect to the socket to reuse state that is expensive to build, and the daemon exits
+on its own once it has been idle for long enough.
+
+Messages exchanged over the socket are length-prefixed frames.
+
+The daemon reports its start-up on a pipe: ``ok`` followed by a description of the
+state it built, or ``error`` followed by the pickled exception of ``setup`` so that the
+caller can handle it like it would have had ``setup`` run in its own process.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import fcntl
+import hashlib
+import os
+import pickle
+import select
+import socket
+import struct
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+_FRAME_HEADER = struct.Struct("!I")
+
+DEFAULT_CONTROL_PATH_DIR = "~/.ansible/cp"
+
+_STATUS_OK = b"ok"
+_STATUS_ERROR = b"error"
+
+
+def control_path(directory: str, prefix: str, *key_parts: str) -> str:
+    """Return the UNIX socket path for a daemon identified by ``key_parts``."""
+    directory = os.path.expanduser(directory or DEFAULT_CONTROL_PATH_DIR)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    digest = hashlib.sha256("\0".join(key_parts).encode()).hexdigest()[:20]
+    return os.path.join(directory, f"{prefix}-{digest}")
+
+
+def send_frame(sock: socket.socket, payload: bytes) -> None:
+    """Write a single length-prefixed frame."""
+    sock.sendall(_FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def recv_frame(sock: socket.socket) -> Optional[bytes]:
+    """Read a single length-prefixed frame, returns None once the peer has gone away."""
+    header = _recv_exact(sock, _FRAME_HEADER.size)
+    if header is None:
+        return None
+    (length,) = _FRAME_HEADER.unpack(header)
+    return _recv_exact(sock, length)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+def connect(path: str) -> socket.socket:
+    """Connect to the daemon listening on ``path``."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+@contextmanager
+def spawn_lock(path: str) -> Iterator[None]:
+    """Serialize daemon start-up between forks targeting the same control path."""
+    with open(f"{path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def spawn_daemon(
+    path: str,
+    setup: Callable[[], Any],
+    serve: Callable[[socket.socket, Any], None],
+    timeout: float = 60,
+    describe: Optional[Callable[[Any], str]] = None,
+) -> str:
+    """Start a detached daemon listening on the UNIX socket at ``path``.
+
+    ``setup`` runs inside the daemon before it starts listening, and any exception it
+    raises is raised again in the caller, or as a RuntimeError when it cannot be pickled.
+    ``serve`` is then called with the listening socket and the value returned by
+    ``setup``; the daemon exits and removes its socket once ``serve`` returns.
+
+    The daemon has no access to the display of Ansible, its standard streams and the
+    queue of the worker process are closed: ``setup`` must not log anything, it can
+    return what should be logged through ``describe`` instead.
+
+    Args:
+        path (str): The UNIX socket path the daemon listens on.
+        setup (Callable): Builds the state the daemon keeps alive.
+        serve (Callable): Accepts and handles clients until the daemon should exit.
+        timeout (float): Seconds to wait for ``setup`` to complete.
+        describe (Callable): Describes the state built by ``setup``, in the daemon.
+
+    Returns:
+        str: The description of the state, empty without ``describe``.
+
+    Raises:
+        RuntimeError: If the daemon failed to start.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            _run_daemon(path, setup, serve, describe, write_fd)
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    os.waitpid(pid, 0)
+    try:
+        status = _read_status(read_fd, timeout)
+    finally:
+        os.close(read_fd)
+
+    result, _sep, payload = status.partition(b"\n")
+    if result == _STATUS_OK:
+        return payload.decode(errors="replace")
+    if result == _STATUS_ERROR:
+        raise pickle.loads(payload)
+    raise RuntimeError(status.decode(errors="replace") or "persistent daemon exited unexpectedly")
+
+
+def _read_status(fd: int, timeout: float) -> bytes:
+    status = b""
+    while True:
+        ready, _w, _x = select.select([fd], [], [], timeout)
+        if not ready:
+            return b"timed out waiting for the persistent daemon to start"
+        chunk = os.read(fd, 4096)
+        if not chunk:
+            return status
+        status += chunk
+
+
+def _write_status(fd: int, result: bytes, payload: bytes) -> None:
+    data = memoryview(result + b"\n" + payload)
+    while data:
+        data = data[os.write(fd, data):]
+    os.close(fd)
+
+
+def _pickle_exception(e: Exception) -> bytes:
+    """Pickle ``e``, or a RuntimeError with its message if it does not survive pickling."""
+    try:
+        payload = pickle.dumps(e)
+        pickle.loads(payload)
+        return payload
+    except Exception:
+        return pickle.dumps(RuntimeError(str(e) or e.__class__.__name__))
+
+
+def _run_daemon(path, setup, serve, describe, status_fd) -> None:
+    os.setsid()
+    if os.fork() != 0:
+        return
+
+    # Detach from the worker process: standard streams and any descriptor inherited
+    # from Ansible (result queues, pipes) must not be held open by the daemon.
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
+    os.closerange(3, status_fd)
+    os.closerange(status_fd + 1, os.sysconf("SC_OPEN_MAX"))
+
+    try:
+        state = setup()
+        description = describe(state) if describe else ""
+        if os.path.exists(path):
+            os.unlink(path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        os.chmod(path, 0o600)
+        listener.listen(8)
+        inode = os.stat(path).st_ino
+    except Exception as e:
+        _write_status(status_fd, _STATUS_ERROR, _pickle_exception(e))
+        return
+
+    _write_status(status_fd, _STATUS_OK, description.encode())
+    try:
+        serve(listener, state)
+    finally:
+        listener.close()
+        # A replacement daemon may already own the path once this one stopped listening
+        try:
+            if os.stat(path).st_ino == inode:
+                os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,209 @@
+# coding: utf-8 -*-
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""Benchmarks of the flightctl_console connection plugin against a local fake console.
+
+Measures the time to open a console session, the latency of exec_command, the
+throughput of put_file and fetch_file in each transfer mode, and the cost of
+recovering a session dropped by the device.  Each benchmark runs once per link
+profile, run from the root of the collection with::
+
+    python -m tests.benchmarks.bench_console --profile lan=0,0 --profile wan=0.05,1000000
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+from ansible.playbook.play_context import PlayContext
+
+from plugins.connection.flightctl_console import Connection
+
+from .fake_console import FakeConsoleServer
+
+DEFAULT_PROFILES = ["lan=0,0", "wan=0.05,1000000"]
+
+
+def make_connection(server: FakeConsoleServer, **options: Any) -> Connection:
+    """Build a connection to ``server``, with the plugin defaults for unset options."""
+    conn = Connection(PlayContext(), None)
+    conn_options = {
+        "flightctl_device_name": "bench-device",
+        "flightctl_host": server.host_url,
+        "flightctl_token": "bench-token",
+        "flightctl_validate_certs": False,
+        "flightctl_ping_interval": 20,
+        "flightctl_ping_timeout": 20,
+        "flightctl_reconnect_retries": 3,
+        # No backoff, so that the reconnect benchmark only measures the reconnect itself
+        "flightctl_reconnect_backoff": 0,
+    }
+    conn_options.update(options)
+    conn._options = conn_options
+    conn.get_option = conn_options.get
+    return conn
+
+
+def _timed(func, *args) -> float:
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+
+def _latency_summary(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": round(statistics.median(samples) * 1000, 2),
+        "p95_ms": round(samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1000, 2),
+        "max_ms": round(samples[-1] * 1000, 2),
+    }
+
+
+def bench_connect(server: FakeConsoleServer, args: argparse.Namespace) -> Dict[str, Any]:
+    """Open and close a console session, including the first command run over it."""
+    samples = []
+    for _ in range(args.connects):
+        conn = make_connection(server, flightctl_audit_log=args.audit_log)
+        samples.append(_timed(conn.exec_command, "true"))
+        conn.close()
+    return _latency_summary(samples)
+
+
+def bench_exec(server: FakeConsoleServer, args: argparse.Namespace) -> Dict[str, Any]:
+    """Run short commands over an open session."""
+    conn = make_connection(server, flightctl_audit_log=args.audit_log)
+    conn.exec_command("true")
+    try:
+        return _latency_summary([_timed(conn.exec_command, "echo ok") for _ in range(args.execs)])
+    finally:
+        conn.close()
+
+
+def bench_transfers(server: FakeConsoleServer, args: argparse.Namespace, workdir: str) -> Dict[str, Any]:
+    """Upload and download a file in each transfer mode, and download text with compression."""
+    local = os.path.join(workdir, "local.bin")
+    with open(local, "wb") as f:
+        f.write(os.urandom(args.size))
+    text = os.path.join(workdir, "local.log")
+    with open(text, "w") as f:
+        line = 0
+        while f.tell() < args.size:
+            f.write(f"Oct 19 12:00:{line % 60:02d} bench-device app[4242]: request {line} handled status=200\n")
+            line += 1
+
+    cases: List[Tuple[str, str, Dict[str, str]]] = [
+        ("put", "base64", {}),
+        ("put", "binary", {}),
+        ("fetch", "base64", {}),
+        ("fetch", "binary", {}),
+        ("fetch", "binary", {"flightctl_fetch_compression": "gzip"}),
+    ]
+    results = {}
+    for kind, mode, extra in cases:
+        conn = make_connection(server, flightctl_audit_log=args.audit_log, flightctl_transfer_mode=mode, **extra)
+        conn.exec_command("true")
+        source = text if extra else local
+        remote = os.path.join(workdir, f"remote-{kind}-{mode}")
+        if kind == "fetch":
+            conn.put_file(source, remote)
+        sent, received = conn._stats.total_bytes("sent"), conn._stats.total_bytes("received")
+
+        if kind == "put":
+            seconds = _timed(conn.put_file, source, remote)
+        else:
+            seconds = _timed(conn.fetch_file, remote, os.path.join(workdir, "fetched"))
+        wire = conn._stats.total_bytes("sent") - sent + conn._stats.total_bytes("received") - received
+        conn.close()
+
+        size = os.path.getsize(source)
+        name = f"{kind} {mode}" + (" gzip text" if extra else "")
+        results[name] = {
+            "bytes": size,
+            "seconds": round(seconds, 4),
+            "mb_per_second": round(size / seconds / 1e6, 2),
+            "message_bytes": wire,
+        }
+    return results
+
+
+def bench_reconnect(server: FakeConsoleServer, args: argparse.Namespace) -> Dict[str, Any]:
+    """Run a command right after the device dropped the session, which reconnects first."""
+    conn = make_connection(server, flightctl_audit_log=args.audit_log)
+    conn.exec_command("true")
+    samples = []
+    try:
+        for _ in range(args.connects):
+            server.drop_sessions()
+            # Let the client see the close frame, as it would between two tasks
+            time.sleep(0.05 + 2 * server.latency)
+            samples.append(_timed(conn.exec_command, "echo ok"))
+    finally:
+        conn.close()
+    return _latency_summary(samples)
+
+
+def run_profile(name: str, latency: float, bandwidth: float, args: argparse.Namespace) -> Dict[str, Any]:
+    with FakeConsoleServer(latency, bandwidth) as server, tempfile.TemporaryDirectory() as workdir:
+        return {
+            "profile": name,
+            "latency": latency,
+            "bandwidth": bandwidth,
+            "connect": bench_connect(server, args),
+            "exec": bench_exec(server, args),
+            "transfers": bench_transfers(server, args, workdir),
+            "reconnect": bench_reconnect(server, args),
+        }
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    bandwidth = f"{result['bandwidth'] / 1e6:g}MB/s" if result["bandwidth"] else "unlimited"
+    print(f"== {result['profile']}: latency {result['latency'] * 1000:g}ms, bandwidth {bandwidth}")
+    for bench in ("connect", "exec", "reconnect"):
+        stats = result[bench]
+        print(f"  {bench:<24} p50 {stats['p50_ms']:>9.2f}ms  p95 {stats['p95_ms']:>9.2f}ms  (n={stats['count']})")
+    for name, stats in result["transfers"].items():
+        print(
+            f"  {name:<24} {stats['mb_per_second']:>8.2f}MB/s  {stats['seconds']:>8.3f}s  "
+            f"{stats['message_bytes']} message bytes for {stats['bytes']}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument(
+        "--profile", action="append", metavar="NAME=LATENCY,BANDWIDTH",
+        help="link profile, one way latency in seconds and bytes per second (0 for unlimited), "
+             f"may be repeated (default: {' '.join(DEFAULT_PROFILES)})",
+    )
+    parser.add_argument("--execs", type=int, default=50, help="commands run for the exec benchmark")
+    parser.add_argument("--connects", type=int, default=5, help="sessions opened for the connect and reconnect benchmarks")
+    parser.add_argument("--size", type=int, default=2 * 1024 * 1024, help="size of the transferred files in bytes")
+    parser.add_argument("--audit-log", default="off", choices=["command", "session", "off"])
+    parser.add_argument("--json", metavar="PATH", help="also write the results to a JSON file")
+    args = parser.parse_args()
+
+    results = []
+    for profile in args.profile or DEFAULT_PROFILES:
+        name, _sep, link = profile.partition("=")
+        latency, bandwidth = (float(value) for value in link.split(","))
+        result = run_profile(name, latency, bandwidth, args)
+        print_report(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# coding: utf-8 -*-
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""Benchmarks of the import time of each module of the collection.
+
+Imports every module under plugins/modules in a fresh interpreter, which is what
+each task pays before the module runs, and reports the median time along with the
+number of flightctl client modules that were loaded.  Run from the root of the
+collection with::
+
+    python -m tests.benchmarks.bench_import --repeat 5 flightctl_resource flightctl_resource_info
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+MODULES_DIR = os.path.join("plugins", "modules")
+
+# Run in the child interpreter, prints the import time in seconds and the loaded client modules
+IMPORT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import plugins.modules.{name}
+elapsed = time.perf_counter() - started
+client = [m for m in sys.modules if m == "flightctl" or m.startswith("flightctl.")]
+print(json.dumps({{"seconds": elapsed, "client_modules": len(client)}}))
+"""
+
+
+def module_names() -> List[str]:
+    return sorted(
+        name[:-3] for name in os.listdir(MODULES_DIR)
+        if name.endswith(".py") and not name.startswith("_")
+    )
+
+
+def bench_module(name: str, repeat: int) -> Dict[str, Any]:
+    """Import ``name`` in ``repeat`` fresh interpreters."""
+    samples = []
+    client_modules = 0
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT.format(name=name)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output)
+        samples.append(result["seconds"])
+        client_modules = result["client_modules"]
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "min_ms": round(min(samples) * 1000, 1),
+        "client_modules": client_modules,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("modules", nargs="*", help="modules to import (default: every module)")
+    parser.add_argument("--repeat", type=int, default=5, help="imports per module, the median is reported")
+    parser.add_argument("--json", metavar="PATH", help="also write the results to a JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.modules or module_names():
+        results[name] = stats = bench_module(name, args.repeat)
+        print(
+            f"  {name:<40} median {stats['median_ms']:>8.1f}ms  min {stats['min_ms']:>8.1f}ms  "
+            f"{stats['client_modules']:>4} client modules"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# coding: utf-8 -*-
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""Benchmarks of get_patch against the recursion it replaced, on large fleet specs.
+
+Times computing the patch of a fleet with many applications and configuration
+items for a few typical edits, and the work FlightctlAPIModule.update does to find
+out whether the patch changes anything: the legacy path applies the patch to a copy
+with json_patch and compares it with diff_dicts, get_patch_and_diff does both in one
+pass.  The peak memory of the latter and the size of each patch, as it is sent to
+the server, are reported too.  Run from the root of the collection with::
+
+    python -m tests.benchmarks.bench_patch --applications 500 --configs 200
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import argparse
+import copy
+import json
+import statistics
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+from plugins.module_utils.utils import diff_dicts, get_patch, get_patch_and_diff, json_patch
+
+
+def legacy_get_patch(old: Dict[str, Any], new: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """get_patch as it was before lists were diffed, which replaces any list that changed."""
+    patch = []
+
+    def recursive_diff(old: Dict[str, Any], new: Dict[str, Any], path: str):
+        for key in new.keys() - old.keys():
+            patch.append({"op": "add", "path": f"{path}/{key}", "value": new[key]})
+
+        for key in old.keys() & new.keys():
+            old_value = old[key]
+            new_value = new[key]
+            if isinstance(old_value, dict) and isinstance(new_value, dict):
+                recursive_diff(old_value, new_value, f"{path}/{key}")
+            elif old_value != new_value:
+                patch.append({"op": "replace", "path": f"{path}/{key}", "value": new_value})
+
+    recursive_diff(old, new, '')
+    return patch
+
+
+def make_fleet(applications: int, configs: int) -> Dict[str, Any]:
+    """A fleet as returned by the server, with a template of ``applications`` and ``configs``."""
+    return {
+        "apiVersion": "flightctl.io/v1beta1",
+        "kind": "Fleet",
+        "metadata": {"name": "bench-fleet", "labels": {"env": "prod"}, "resourceVersion": "42"},
+        "spec": {
+            "selector": {"matchLabels": {"fleet": "bench-fleet"}},
+            "template": {
+                "metadata": {"labels": {"fleet": "bench-fleet"}},
+                "spec": {
+                    "os": {"image": "quay.io/example/os:1.0"},
+                    "applications": [
+                        {
+                            "name": f"app-{i}",
+                            "image": f"quay.io/example/app-{i}:1.0",
+                            "appType": "compose",
+                            "envVars": {f"VAR_{j}": f"value-{i}-{j}" for j in range(10)},
+                        }
+                        for i in range(applications)
+                    ],
+                    "config": [
+                        {
+                            "name": f"config-{i}",
+                            "inline": [
+                                {"path": f"/etc/example/{i}/file-{j}.conf", "content": "key=value\n" * 20}
+                                for j in range(3)
+                            ],
+                        }
+                        for i in range(configs)
+                    ],
+                },
+            },
+        },
+        "status": {"conditions": [{"type": "Valid", "status": "True"}]},
+    }
+
+
+def edits() -> Dict[str, Callable[[Dict[str, Any]], None]]:
+    """Edits, by name, that turn a copy of the existing fleet into a new definition."""
+    def template(definition):
+        return definition["spec"]["template"]["spec"]
+
+    def change_image(definition):
+        template(definition)["applications"][len(template(definition)["applications"]) // 2]["image"] += "-patched"
+
+    def append_application(definition):
+        template(definition)["applications"].append({"name": "app-new", "image": "quay.io/example/new:1.0"})
+
+    def drop_config(definition):
+        template(definition)["config"].pop()
+
+    return {
+        "unchanged": lambda definition: None,
+        "change-one-image": change_image,
+        "append-application": append_application,
+        "drop-last-config": drop_config,
+    }
+
+
+def _median_seconds(func: Callable[[], Any], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def _peak_kb(func: Callable[[], Any]) -> float:
+    tracemalloc.start()
+    try:
+        func()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def legacy_update(existing: Dict[str, Any], definition: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """What FlightctlAPIModule.update did to find the patch and whether it changes anything."""
+    patch = legacy_get_patch(existing, definition)
+    patched, _error = json_patch(existing, patch)
+    return patch, diff_dicts(existing, patched)[1]
+
+
+def bench_edit(existing: Dict[str, Any], definition: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    result = {}
+    for name, differ, update in (
+        ("legacy", legacy_get_patch, legacy_update),
+        ("get_patch", get_patch, get_patch_and_diff),
+    ):
+        patch = differ(existing, definition)
+        patched, error = json_patch(existing, patch)
+        if error or patched["spec"] != dict(existing["spec"], **definition["spec"]):
+            raise AssertionError(f"{name} produced a wrong patch: {error}")
+        result[name] = {
+            "diff_ms": round(_median_seconds(lambda: differ(existing, definition), repeat) * 1000, 3),
+            "update_ms": round(_median_seconds(lambda: update(existing, definition), repeat) * 1000, 3),
+            "update_peak_kb": _peak_kb(lambda: update(existing, definition)),
+            "operations": len(patch),
+            "patch_bytes": len(json.dumps(patch)),
+        }
+    return result
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    for edit, result in results.items():
+        print(f"== {edit}")
+        for name, stats in result.items():
+            print(
+                f"  {name:<10} diff {stats['diff_ms']:>8.3f}ms  update {stats['update_ms']:>8.3f}ms "
+                f"{stats['update_peak_kb']:>9.1f}kB peak  {stats['operations']:>4} ops  {stats['patch_bytes']:>9} patch bytes"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--applications", type=int, default=500, help="applications in the fleet template")
+    parser.add_argument("--configs", type=int, default=200, help="configuration items in the fleet template")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per measurement, the median is reported")
+    parser.add_argument("--json", metavar="PATH", help="also write the results to a JSON file")
+    args = parser.parse_args()
+
+    existing = make_fleet(args.applications, args.configs)
+    results = {}
+    for edit, apply_edit in edits().items():
+        definition = {key: copy.deepcopy(existing[key]) for key in ("apiVersion", "kind", "metadata", "spec")}
+        apply_edit(definition)
+        results[edit] = bench_edit(existing, definition, args.repeat)
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
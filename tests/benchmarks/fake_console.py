@@ -0,0 +1,273 @@
+# coding: utf-8 -*-
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""A local stand-in for the device console endpoint of the Flight Control API.
+
+The server speaks the v5.channel.k8s.io WebSocket subprotocol over TLS, with a
+self-signed certificate, and runs the commands of each session in its own ``/bin/sh``
+subprocess on the local machine.  Every message crosses a simulated link in each
+direction, which can add latency and limit bandwidth, so that the connection plugin
+can be measured against the conditions of real device links.
+
+Run it standalone to point playbooks at it::
+
+    python -m tests.benchmarks.fake_console --port 8443 --latency 0.05 --bandwidth 1000000
+
+and use ``flightctl_host: https://127.0.0.1:8443`` with ``flightctl_validate_certs: false``.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import argparse
+import datetime
+import heapq
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.server import ServerConnection, serve
+
+SUBPROTOCOL = "v5.channel.k8s.io"
+
+STD_IN_CHANNEL = 0
+STD_OUT_CHANNEL = 1
+STD_ERR_CHANNEL = 2
+
+# Round trips of opening a session that do not go through the simulated link: the TCP
+# handshake, the TLS 1.3 handshake and the HTTP upgrade request
+_HANDSHAKE_ROUND_TRIPS = 3
+
+# Stand-in for the journal logger the connection plugin calls on the device
+_SYSTEMD_CAT = "#!/bin/sh\ncat > /dev/null\n"
+
+
+class _Link:
+    """One direction of a simulated network link.
+
+    A message is delivered once the previous messages have been transmitted at
+    ``bandwidth`` bytes per second, plus ``latency`` seconds, without holding back
+    the messages sent after it.
+    """
+
+    def __init__(self, deliver: Callable[[bytes], None], latency: float = 0.0, bandwidth: float = 0.0) -> None:
+        self._deliver = deliver
+        self._latency = latency
+        self._bandwidth = bandwidth
+        self._queue: List[Tuple[float, int, Optional[bytes]]] = []
+        self._sequence = 0
+        self._free_at = 0.0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def send(self, data: Optional[bytes]) -> None:
+        """Queue ``data`` for delivery, None stops the link once the queue has drained."""
+        with self._cond:
+            now = time.monotonic()
+            if data is not None and self._bandwidth:
+                self._free_at = max(self._free_at, now) + len(data) / self._bandwidth
+            else:
+                self._free_at = max(self._free_at, now)
+            self._sequence += 1
+            heapq.heappush(self._queue, (self._free_at + self._latency, self._sequence, data))
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    self._cond.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                _deliver_at, _sequence, data = heapq.heappop(self._queue)
+            if data is None:
+                return
+            try:
+                self._deliver(data)
+            except (OSError, ConnectionClosed):
+                return
+
+
+class FakeConsoleServer:
+    """Console endpoint running each session in a local shell behind a simulated link.
+
+    Use it as a context manager, ``host_url`` is the value for ``flightctl_host``.
+
+    Args:
+        latency: One way delay added to every message, in seconds.
+        bandwidth: Bytes per second allowed in each direction, 0 for no limit.
+        port: Port to listen on, 0 picks a free one.
+    """
+
+    def __init__(self, latency: float = 0.0, bandwidth: float = 0.0, port: int = 0) -> None:
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.sessions = 0
+        self._port = port
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+        self._tmpdir: Optional[str] = None
+        self._env = dict(os.environ)
+        self._active: List[ServerConnection] = []
+        self._lock = threading.Lock()
+
+    @property
+    def host_url(self) -> str:
+        return f"https://127.0.0.1:{self._server.socket.getsockname()[1]}"
+
+    def __enter__(self) -> "FakeConsoleServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        self._tmpdir = tempfile.mkdtemp(prefix="fake-console-")
+        bin_dir = os.path.join(self._tmpdir, "bin")
+        os.mkdir(bin_dir)
+        systemd_cat = os.path.join(bin_dir, "systemd-cat")
+        with open(systemd_cat, "w") as f:
+            f.write(_SYSTEMD_CAT)
+        os.chmod(systemd_cat, 0o755)
+        self._env["PATH"] = f"{bin_dir}{os.pathsep}{self._env.get('PATH', os.defpath)}"
+
+        self._server = serve(
+            self._handler,
+            "127.0.0.1",
+            self._port,
+            ssl=self._ssl_context(),
+            process_request=self._delay_handshake,
+            subprotocols=[SUBPROTOCOL],
+            max_size=None,
+        )
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self.drop_sessions()
+            self._server.shutdown()
+            self._thread.join()
+            self._server = None
+        if self._tmpdir:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+    def drop_sessions(self) -> None:
+        """Close every open console session, as a device that went offline would."""
+        with self._lock:
+            active = list(self._active)
+        for ws in active:
+            ws.close(1011, "device disconnected")
+
+    def _ssl_context(self) -> ssl.SSLContext:
+        """Build a server context with a freshly generated self-signed certificate."""
+        key = ec.generate_private_key(ec.SECP256R1())
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(minutes=5))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256())
+        )
+        cert_path = os.path.join(self._tmpdir, "cert.pem")
+        with open(cert_path, "wb") as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM))
+            f.write(key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            ))
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(cert_path)
+        return context
+
+    def _delay_handshake(self, ws: ServerConnection, request) -> None:
+        time.sleep(2 * self.latency * _HANDSHAKE_ROUND_TRIPS)
+
+    def _handler(self, ws: ServerConnection) -> None:
+        proc = subprocess.Popen(
+            ["/bin/sh"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0,
+            env=self._env,
+            cwd=self._tmpdir,
+        )
+        uplink = _Link(self._write_stdin(proc), self.latency, self.bandwidth)
+        downlink = _Link(ws.send, self.latency, self.bandwidth)
+        pumps = [
+            threading.Thread(target=self._pump, args=(proc.stdout, STD_OUT_CHANNEL, downlink), daemon=True),
+            threading.Thread(target=self._pump, args=(proc.stderr, STD_ERR_CHANNEL, downlink), daemon=True),
+        ]
+        for pump in pumps:
+            pump.start()
+
+        with self._lock:
+            self.sessions += 1
+            self._active.append(ws)
+        try:
+            for message in ws:
+                if isinstance(message, bytes) and message[:1] == bytes([STD_IN_CHANNEL]):
+                    uplink.send(message[1:])
+        except ConnectionClosed:
+            pass
+        finally:
+            with self._lock:
+                self._active.remove(ws)
+            uplink.send(None)
+            downlink.send(None)
+            proc.kill()
+            proc.wait()
+
+    @staticmethod
+    def _write_stdin(proc: subprocess.Popen) -> Callable[[bytes], None]:
+        def write(data: bytes) -> None:
+            proc.stdin.write(data)
+            proc.stdin.flush()
+        return write
+
+    @staticmethod
+    def _pump(stream, channel: int, link: _Link) -> None:
+        while True:
+            data = stream.read(64 * 1024)
+            if not data:
+                return
+            link.send(bytes([channel]) + data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--latency", type=float, default=0.0, help="one way delay in seconds")
+    parser.add_argument("--bandwidth", type=float, default=0.0, help="bytes per second in each direction, 0 for no limit")
+    args = parser.parse_args()
+
+    with FakeConsoleServer(args.latency, args.bandwidth, args.port) as server:
+        print(f"Serving device consoles on {server.host_url}, use flightctl_validate_certs: false")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -7,13 +7,33 @@ from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
 import base64
+import gzip
+import hashlib
+import json
+import os
+import ssl
+import threading
+import time
 import pytest
 from unittest.mock import MagicMock
 
 from ansible.errors import AnsibleConnectionFailure
 
-from websockets.exceptions import ConnectionClosedError
-from plugins.connection.flightctl_console import Connection, CMD_END_MARKER, PUT_FILE_MARKER, CommandType
+from websockets.datastructures import Headers
+from websockets.exceptions import ConnectionClosedError, InvalidStatus
+from websockets.http11 import Response
+from plugins.connection.flightctl_console import (
+    Connection,
+    CMD_END_MARKER,
+    PUT_CHUNK_SIZE,
+    PUT_FILE_MARKER,
+    STD_IN_CHANNEL,
+    STDIN_READY_MARKER,
+    ZYGOTE_EXITED_LINE,
+    CommandType,
+    _python_request,
+)
+from plugins.plugin_utils.console_zygote import READY_LINE
 
 
 class MockConfigLoader:
@@ -29,6 +49,8 @@ def mock_conn():
     """Return a mocked connection object."""
     conn = Connection(MagicMock(), MagicMock(), MagicMock())
     conn._display = MagicMock()
+    # Use the fixed marker so canned device output can end commands
+    conn._new_marker = lambda: CMD_END_MARKER
     return conn
 
 
@@ -176,6 +198,27 @@ def test_build_command__fetch_file(mock_conn):
     assert result.count("\n") >= 2
 
 
+def test_build_command__audit_log_off(mock_conn):
+    """Test that no journal logging is added when the audit log is off."""
+    mock_conn.audit_log = 'off'
+    result = mock_conn._build_command("ls -la", CommandType.EXEC)
+
+    assert "systemd-cat" not in result
+    assert result == f"ls -la\necho {CMD_END_MARKER}\n"
+
+
+def test_build_command__audit_log_session(mock_conn):
+    """Test that a session is logged only with the first command sent over it."""
+    mock_conn.audit_log = 'session'
+    mock_conn._session_log_pending = True
+
+    first = mock_conn._build_command("ls -la", CommandType.EXEC)
+    second = mock_conn._build_command("ls -la", CommandType.EXEC)
+
+    assert "echo console_session | systemd-cat -t ansible-console" in first
+    assert "systemd-cat" not in second
+
+
 def test_send_command__success(mock_conn):
     """Test the _send_command method."""
     mock_ws = MagicMock()
@@ -197,6 +240,42 @@ def test_send_command__success(mock_conn):
     assert mock_ws.recv.call_count == 3
 
 
+def test_new_marker__unique():
+    """Test that every command gets its own end marker."""
+    markers = {Connection._new_marker() for _ in range(100)}
+
+    assert len(markers) == 100
+    assert all(m.startswith(CMD_END_MARKER) and m != CMD_END_MARKER for m in markers)
+
+
+def test_send_command__marker_split_across_messages(mock_conn):
+    """Test that an end marker split over several messages ends the command."""
+    mock_conn._new_marker = lambda: "__END_1234__"
+    mock_conn._ws = MagicMock()
+    mock_conn._ws.recv.side_effect = [b'\x01output\n__EN', b'\x01D_12', b'\x0134__\n', b'\x01never read']
+
+    stdout, stderr = mock_conn._send_command_raw("test command", CommandType.EXEC)
+
+    assert stdout == b"output\n"
+    assert stderr == b""
+    assert mock_conn._ws.recv.call_count == 3
+    assert mock_conn._ws.send.call_args[0][0].endswith(b"echo __END_1234__\n")
+
+
+def test_send_command__output_contains_fixed_marker(mock_conn):
+    """Test that output containing the fixed marker text neither ends nor loses any of it."""
+    mock_conn._new_marker = lambda: f"{CMD_END_MARKER}abcd"
+    mock_conn._ws = MagicMock()
+    mock_conn._ws.recv.side_effect = [
+        b'\x01' + f'before {CMD_END_MARKER} after\n'.encode(),
+        b'\x01' + f'{CMD_END_MARKER}abcd\n'.encode(),
+    ]
+
+    stdout, _stderr = mock_conn._send_command_raw("cat file", CommandType.FETCH)
+
+    assert stdout == f'before {CMD_END_MARKER} after\n'.encode()
+
+
 def test_send_command__stream_error(mock_conn):
     """Test that _send_command raises an exception with the proper message when a stream error occurs."""
     mock_ws = MagicMock()
@@ -268,6 +347,7 @@ def test_exec_command__failure(mock_conn):
 
 def test_put_file__success(mock_conn, tmp_path):
     """Test that put_file reads the file and sends the appropriate command."""
+    mock_conn._ws = MagicMock()
     test_file_content = "test content"
     test_file = tmp_path / "testfile"
     test_file.write_text(test_file_content)
@@ -307,6 +387,7 @@ def test_put_file__failure(mock_conn, tmp_path):
 
 def test_fetch_file__success(mock_conn, tmp_path):
     """Test that fetch_file gets the file and saves it properly."""
+    mock_conn._ws = MagicMock()
     test_content = "test remote content"
     encoded_content = base64.b64encode(test_content.encode()).decode()
     send_command_mock = MagicMock(return_value=(encoded_content, ""))
@@ -368,6 +449,170 @@ def test_fetch_file__decode_error(mock_conn, monkeypatch):
     assert "Invalid base64-encoded string" in str(exc_info.value.__cause__)
 
 
+@pytest.mark.parametrize("transfer_mode", ["base64", "binary"])
+def test_fetch_file__gzip(mock_conn, tmp_path, transfer_mode):
+    """Test that fetch_file decompresses a file compressed on the device."""
+    content = b"Oct 19 12:00:00 device kernel: line\n" * 5000
+    compressed = gzip.compress(content)
+    if transfer_mode == 'base64':
+        compressed = base64.encodebytes(compressed)
+    mock_conn._ws = MagicMock()
+    mock_conn._ws.recv.side_effect = [
+        b'\x01' + b'0\n' + compressed[:100],
+        b'\x01' + compressed[100:] + f'{CMD_END_MARKER}\n'.encode(),
+    ]
+    mock_conn.transfer_mode = transfer_mode
+    mock_conn.fetch_compression = 'gzip'
+    out_file = tmp_path / "fetched"
+
+    mock_conn.fetch_file("/var/log/messages", str(out_file))
+
+    assert out_file.read_bytes() == content
+    sent = mock_conn._ws.send.call_args[0][0].decode()
+    assert "gzip -c '/var/log/messages'" in sent
+    assert ("| base64" in sent) == (transfer_mode == 'base64')
+
+
+def test_fetch_file__gzip_missing(mock_conn, tmp_path):
+    """Test that fetch_file falls back to an uncompressed download without gzip on the device."""
+    content = b"plain content"
+    mock_conn._ws = MagicMock()
+    mock_conn._ws.recv.side_effect = [
+        b'\x01' + f'-2\n{CMD_END_MARKER}\n'.encode(),
+        b'\x01' + base64.b64encode(content) + f'\n{CMD_END_MARKER}\n'.encode(),
+    ]
+    mock_conn.fetch_compression = 'gzip'
+    out_file = tmp_path / "fetched"
+
+    mock_conn.fetch_file("/remote/file", str(out_file))
+
+    assert out_file.read_bytes() == content
+    assert mock_conn._ws.send.call_count == 2
+
+
+def test_fetch_file__gzip_truncated(mock_conn, tmp_path):
+    """Test that a truncated compressed download fails instead of writing a partial file silently."""
+    compressed = gzip.compress(b"x" * 100000)
+    mock_conn._ws = MagicMock()
+    mock_conn._ws.recv.side_effect = [b'\x01' + b'0\n' + compressed[:-8] + f'{CMD_END_MARKER}\n'.encode()]
+    mock_conn.transfer_mode = 'binary'
+    mock_conn.fetch_compression = 'gzip'
+
+    with pytest.raises(AnsibleConnectionFailure, match="fetch_file failed"):
+        mock_conn.fetch_file("/remote/file", str(tmp_path / "fetched"))
+
+
+def test_put_file__binary(mock_conn, tmp_path):
+    """Test that put_file sends raw bytes after the receiving command in binary mode."""
+    content = bytes(range(256)) * 300
+    test_file = tmp_path / "testfile"
+    test_file.write_bytes(content)
+    mock_ws = MagicMock()
+    responses = iter([
+        b'\x01' + f'{STDIN_READY_MARKER}\n'.encode(),
+        b'\x01' + f'{PUT_FILE_MARKER}\n{CMD_END_MARKER}\n'.encode(),
+    ])
+    sent_before_recv = []
+
+    def recv(timeout=None):
+        sent_before_recv.append(mock_ws.send.call_count)
+        return next(responses)
+
+    mock_ws.recv.side_effect = recv
+    mock_conn._ws = mock_ws
+    mock_conn.transfer_mode = 'binary'
+
+    mock_conn.put_file(str(test_file), "/remote/file")
+
+    messages = [c.args[0] for c in mock_ws.send.call_args_list]
+    # The payload waits for the command to announce that it is reading stdin
+    assert sent_before_recv[0] == 1
+    assert all(m[0] == STD_IN_CHANNEL for m in messages)
+    assert f"echo {STDIN_READY_MARKER}\n" in messages[0].decode()
+    assert f"head -c {len(content)} > '/remote/file'" in messages[0].decode()
+    assert CMD_END_MARKER not in messages[0].decode()
+    assert b"".join(m[1:] for m in messages[1:-1]) == content
+    assert messages[-1] == bytes([STD_IN_CHANNEL]) + f"\necho {CMD_END_MARKER}\n".encode()
+
+
+def test_put_archive(mock_conn, tmp_path):
+    """Test that put_archive uploads the archive next to its destination and unpacks it there."""
+    archive = tmp_path / "bundle.tar.gz"
+    archive.write_bytes(b"archive")
+    mock_conn._ws = MagicMock()
+    mock_conn._ws.recv.side_effect = [
+        b'\x01' + f'{PUT_FILE_MARKER}\n{CMD_END_MARKER}\n'.encode(),
+        b'\x01' + f'{PUT_FILE_MARKER}\n{CMD_END_MARKER}\n'.encode(),
+    ]
+
+    mock_conn.put_archive(str(archive), "/etc/app")
+
+    upload, unpack = [c.args[0].decode() for c in mock_conn._ws.send.call_args_list]
+    archive_path = upload.split("> '", 1)[1].split("'", 1)[0]
+    assert archive_path.startswith("/etc/app/.ansible-archive-")
+    assert base64.b64encode(b"archive").decode() in upload
+    assert f"tar -xzf '{archive_path}' -C '/etc/app'" in unpack
+    assert f"rm -f '{archive_path}'" in unpack
+
+
+def test_put_archive__unpack_failure(mock_conn, tmp_path):
+    """Test that put_archive fails when the archive could not be unpacked."""
+    archive = tmp_path / "bundle.tar.gz"
+    archive.write_bytes(b"archive")
+    mock_conn._ws = MagicMock()
+    mock_conn._ws.recv.side_effect = [
+        b'\x01' + f'{PUT_FILE_MARKER}\n{CMD_END_MARKER}\n'.encode(),
+        b'\x02tar: invalid magic',
+        b'\x01' + f'{CMD_END_MARKER}\n'.encode(),
+    ]
+
+    with pytest.raises(AnsibleConnectionFailure, match="put_archive failed") as exc_info:
+        mock_conn.put_archive(str(archive), "/etc/app")
+    assert "tar: invalid magic" in str(exc_info.value.__cause__)
+
+
+def test_put_file__binary_failure(mock_conn, tmp_path):
+    """Test that a binary put_file fails when the device did not write the file."""
+    test_file = tmp_path / "testfile"
+    test_file.write_bytes(b"content")
+    mock_conn._ws = MagicMock()
+    mock_conn._ws.recv.side_effect = [
+        b'\x01' + f'{STDIN_READY_MARKER}\n'.encode(),
+        b'\x02Permission denied',
+        b'\x01' + f'{CMD_END_MARKER}\n'.encode(),
+    ]
+    mock_conn.transfer_mode = 'binary'
+
+    with pytest.raises(AnsibleConnectionFailure, match="put_file failed"):
+        mock_conn.put_file(str(test_file), "/remote/file")
+
+
+def test_fetch_file__binary(mock_conn, tmp_path):
+    """Test that fetch_file reads the length header and raw bytes in binary mode."""
+    content = b"\x00\xffbinary\ndata\n"
+    mock_conn._ws = MagicMock()
+    mock_conn._ws.recv.side_effect = [
+        b'\x01' + f'{len(content)}\n'.encode() + content[:5],
+        b'\x01' + content[5:] + f'{CMD_END_MARKER}\n'.encode(),
+    ]
+    mock_conn.transfer_mode = 'binary'
+    out_file = tmp_path / "fetched"
+
+    mock_conn.fetch_file("/remote/file", str(out_file))
+
+    assert out_file.read_bytes() == content
+
+
+def test_fetch_file__binary_not_found(mock_conn, tmp_path):
+    """Test that a missing remote file is reported in binary mode."""
+    mock_conn._ws = MagicMock()
+    mock_conn._ws.recv.side_effect = [b'\x01' + f'-1\n{CMD_END_MARKER}\n'.encode()]
+    mock_conn.transfer_mode = 'binary'
+
+    with pytest.raises(AnsibleConnectionFailure, match="fetch_file failed"):
+        mock_conn.fetch_file("/remote/file", str(tmp_path / "fetched"))
+
+
 def test_reset(mock_conn):
     """Test that reset method calls close and then connect."""
     mock_conn._ws = MagicMock()
@@ -389,3 +634,532 @@ def test_close(mock_conn):
 
     assert mock_ws.close.called
     assert mock_conn._ws is None
+
+
+def test_connect__persistent(mock_conn):
+    """Test that _connect attaches to a persistent session when enabled."""
+    set_options(mock_conn, {
+        'flightctl_device_name': 'test-device',
+        'flightctl_host': 'test-host',
+        'flightctl_persist_timeout': 60,
+    })
+    mux_client = MagicMock()
+    mock_conn._connect_persistent = MagicMock(return_value=mux_client)
+    mock_conn._open_websocket = MagicMock()
+
+    mock_conn._connect()
+
+    mock_conn._connect_persistent.assert_called_once()
+    mock_conn._open_websocket.assert_not_called()
+    assert mock_conn._ws is mux_client
+
+
+class ParentOnlyDisplay:
+    """A display that fails like the display of a worker does once the daemon closed its queue."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.messages = []
+
+    def vvv(self, msg, host=None):
+        if os.getpid() != self.pid:
+            raise BrokenPipeError("display used by the persistent session daemon")
+        self.messages.append(msg)
+
+    warning = vvv
+
+
+class ClosingWebSocket:
+    """A WebSocket the device closes once the session is shut down."""
+
+    def __init__(self):
+        self.protocol = MagicMock(extensions=[])
+        self.closed = threading.Event()
+
+    def send(self, message):
+        pass
+
+    def recv(self):
+        self.closed.wait()
+        raise ConnectionClosedError(None, None)
+
+    def close(self):
+        self.closed.set()
+
+
+def test_connect__persistent_logs_in_parent(mock_conn, monkeypatch, tmp_path):
+    """Test that starting a persistent session at -vvv only logs from the Ansible worker."""
+    from plugins.connection import flightctl_console
+
+    monkeypatch.setattr(flightctl_console, 'connect', lambda *args, **kwargs: ClosingWebSocket())
+    mock_conn._display = ParentOnlyDisplay()
+    set_options(mock_conn, {
+        'flightctl_device_name': 'test-device',
+        'flightctl_host': 'test-host',
+        'flightctl_persist_timeout': 5,
+        'flightctl_control_path_dir': str(tmp_path),
+    })
+
+    mock_conn._connect()
+    mock_conn._ws.shutdown()
+
+    assert "Negotiated WebSocket extensions: none" in mock_conn._display.messages
+
+
+def test_connect__persistent_auth_error_not_retried(mock_conn, monkeypatch, tmp_path):
+    """Test that the status of a rejected handshake in the daemon reaches _connect."""
+    from plugins.connection import flightctl_console
+
+    def reject(*args, **kwargs):
+        raise InvalidStatus(Response(401, 'Unauthorized', Headers(), b''))
+
+    monkeypatch.setattr(flightctl_console, 'connect', reject)
+    set_options(mock_conn, {
+        'flightctl_device_name': 'test-device',
+        'flightctl_host': 'test-host',
+        'flightctl_persist_timeout': 5,
+        'flightctl_control_path_dir': str(tmp_path),
+    })
+
+    with pytest.raises(AnsibleConnectionFailure, match="HTTP 401") as excinfo:
+        mock_conn._connect()
+    assert not isinstance(excinfo.value, flightctl_console._SessionLost)
+
+
+def test_reset__persistent_shuts_down_session(mock_conn, monkeypatch):
+    """Test that reset tears down a persistent session before reconnecting."""
+    from plugins.plugin_utils import console_mux
+
+    mux_client = MagicMock(spec=console_mux.MuxClient)
+    mock_conn._ws = mux_client
+    mock_conn._connect = MagicMock(return_value=mock_conn)
+
+    mock_conn.reset()
+
+    mux_client.shutdown.assert_called_once()
+    mock_conn._connect.assert_called_once()
+
+
+def test_build_ssl_context__cached(mock_conn, monkeypatch):
+    """Test that SSL contexts are built once per certificate settings."""
+    from plugins.plugin_utils import console
+
+    monkeypatch.setattr(console, '_SSL_CONTEXTS', {})
+    mock_conn.validate_certs = True
+
+    first = mock_conn._build_ssl_context()
+    second = mock_conn._build_ssl_context()
+
+    assert first is second
+    assert first.verify_mode == ssl.CERT_REQUIRED
+
+
+def test_build_ssl_context__unverified(mock_conn, monkeypatch):
+    """Test that an unverified context is distinct from the verified one."""
+    from plugins.plugin_utils import console
+
+    monkeypatch.setattr(console, '_SSL_CONTEXTS', {})
+    mock_conn.validate_certs = True
+    verified = mock_conn._build_ssl_context()
+    mock_conn.validate_certs = False
+    unverified = mock_conn._build_ssl_context()
+
+    assert unverified is not verified
+    assert unverified.verify_mode == ssl.CERT_NONE
+    assert unverified.check_hostname is False
+
+
+@pytest.mark.parametrize("validate_certs", [True, False])
+def test_build_ssl_context__default_settings(mock_conn, monkeypatch, validate_certs):
+    """Test that the contexts keep the settings of ssl.create_default_context, like the verify flags."""
+    from plugins.plugin_utils import console
+
+    monkeypatch.setattr(console, '_SSL_CONTEXTS', {})
+    # Like the default context of Python 3.13
+    default = ssl.create_default_context()
+    default.verify_flags |= ssl.VERIFY_X509_STRICT
+    monkeypatch.setattr(console, '_default_context', lambda: default)
+    mock_conn.validate_certs = validate_certs
+
+    context = mock_conn._build_ssl_context()
+
+    assert context.verify_flags & ssl.VERIFY_X509_STRICT
+    assert context.options == default.options
+
+
+def test_ssl_context__offers_remembered_session(monkeypatch):
+    """Test that a remembered TLS session is offered when reconnecting to the same host."""
+    from plugins.plugin_utils.console import ResumableSSLContext
+
+    context = ResumableSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    session = object()
+    context.sessions['api.example.com'] = session
+
+    calls = []
+
+    def fake_wrap_socket(self, sock, *args, **kwargs):
+        calls.append(kwargs)
+        return MagicMock(session=None)
+
+    monkeypatch.setattr(ssl.SSLContext, 'wrap_socket', fake_wrap_socket)
+    context.wrap_socket(MagicMock(), server_hostname='api.example.com')
+
+    assert calls[0]['session'] is session
+
+
+@pytest.mark.parametrize("option, expected", [
+    (None, 'deflate'),
+    ('deflate', 'deflate'),
+    ('none', None),
+])
+def test_open_websocket__compression(mock_conn, monkeypatch, option, expected):
+    """Test that the compression option is passed to the WebSocket client."""
+    from plugins.connection import flightctl_console
+
+    mock_connect = MagicMock()
+    mock_connect.return_value.protocol.extensions = []
+    monkeypatch.setattr(flightctl_console, 'connect', mock_connect)
+    set_options(mock_conn, {
+        'flightctl_device_name': 'test-device',
+        'flightctl_host': 'test-host',
+        'flightctl_compression': option,
+    })
+
+    mock_conn._connect()
+
+    assert mock_connect.call_args.kwargs['compression'] == expected
+
+
+def test_open_websocket__keepalive(mock_conn, monkeypatch):
+    """Test that keepalive pings are configured, and disabled with 0."""
+    from plugins.connection import flightctl_console
+
+    mock_connect = MagicMock()
+    mock_connect.return_value.protocol.extensions = []
+    monkeypatch.setattr(flightctl_console, 'connect', mock_connect)
+    set_options(mock_conn, {
+        'flightctl_device_name': 'test-device',
+        'flightctl_host': 'test-host',
+        'flightctl_ping_interval': 5,
+        'flightctl_ping_timeout': 0,
+    })
+
+    mock_conn._connect()
+
+    assert mock_connect.call_args.kwargs['ping_interval'] == 5
+    assert mock_connect.call_args.kwargs['ping_timeout'] is None
+
+
+def test_send_command__timeout_reaps_session(mock_conn):
+    """Test that a command that does not complete in time closes the session."""
+    mock_ws = MagicMock()
+    mock_ws.recv.side_effect = [b'\x01partial output', TimeoutError()]
+    mock_conn._ws = mock_ws
+    mock_conn.command_timeout = 5
+
+    with pytest.raises(AnsibleConnectionFailure, match="did not complete within 5 seconds"):
+        mock_conn._send_command("sleep 100", CommandType.EXEC)
+
+    assert 0 < mock_ws.recv.call_args.kwargs['timeout'] <= 5
+    assert mock_ws.close.called
+    assert mock_conn._ws is None
+
+
+def test_exec_command__replaces_idle_session(mock_conn):
+    """Test that a session idle for longer than the idle timeout is replaced."""
+    old_ws = MagicMock()
+    mock_conn._ws = old_ws
+    mock_conn.idle_timeout = 10
+    mock_conn._last_used = time.monotonic() - 60
+    mock_conn._connect = MagicMock()
+    mock_conn._send_command = MagicMock(return_value=("", ""))
+
+    mock_conn.exec_command("true")
+
+    assert old_ws.close.called
+    mock_conn._connect.assert_called_once()
+
+
+@pytest.mark.parametrize("cmd, expected", [
+    (
+        "/bin/sh -c '/usr/bin/python3 /root/.ansible/tmp/ansible-tmp-1/AnsiballZ_ping.py && sleep 0'",
+        {"interpreter": "/usr/bin/python3", "argv": ["/root/.ansible/tmp/ansible-tmp-1/AnsiballZ_ping.py"], "env": {}},
+    ),
+    (
+        "/bin/sh -c 'LANG=C LC_ALL=C /usr/libexec/platform-python && sleep 0'",
+        {"interpreter": "/usr/libexec/platform-python", "argv": [], "env": {"LANG": "C", "LC_ALL": "C"}},
+    ),
+    ("/bin/sh -c 'echo ~ && sleep 0'", None),
+    ("/bin/sh -c '/usr/bin/python3 -c \"import sys\" && sleep 0'", None),
+    ("/usr/bin/python3 /tmp/a.py; rm -f /tmp/a.py", None),
+    ("/usr/bin/python3 '/tmp/a.py' > /tmp/out", None),
+    ("/bin/sh -c 'unterminated", None),
+])
+def test_python_request(cmd, expected):
+    """Test that only commands running a Python interpreter alone are sent to the exec server."""
+    assert _python_request(cmd) == expected
+
+
+def zygote_response(rc, stdout=b"", stderr=b""):
+    response = {"rc": rc, "stdout": base64.b64encode(stdout).decode(), "stderr": base64.b64encode(stderr).decode()}
+    return b'\x01' + base64.b64encode(json.dumps(response).encode()) + f'{CMD_END_MARKER}\n'.encode()
+
+
+def sent_requests(ws):
+    """Decode the requests sent to the exec server, skipping the command starting it."""
+    sent = b"".join(call.args[0][1:] for call in ws.send.call_args_list[1:])
+    return [json.loads(base64.b64decode(line)) for line in sent.splitlines()]
+
+
+def test_exec_command__python_mode(mock_conn):
+    """Test that modules run by the exec server, which is started once per session."""
+    mock_conn._ws = MagicMock()
+    mock_conn._ws.recv.side_effect = [
+        b'\x01' + READY_LINE + b'\n',
+        zygote_response(0, b'{"ping": "pong"}'),
+        zygote_response(0, b'{"ping": "again"}'),
+    ]
+    set_options(mock_conn, {"flightctl_exec_mode": "python"})
+    mock_conn.exec_mode = 'python'
+    mock_conn._zygote_unavailable = set()
+
+    module = "/bin/sh -c '/usr/bin/python3 && sleep 0'"
+    rc, stdout, _stderr = mock_conn.exec_command(module, in_data=b"print(1)")
+    rc2, stdout2, _stderr2 = mock_conn.exec_command(module, in_data=b"print(2)")
+
+    assert (rc, stdout) == (0, b'{"ping": "pong"}')
+    assert (rc2, stdout2) == (0, b'{"ping": "again"}')
+    assert mock_conn._zygote == "/usr/bin/python3"
+    start = mock_conn._ws.send.call_args_list[0].args[0]
+    assert b"\n/usr/bin/python3 -u -c " in start
+    requests = sent_requests(mock_conn._ws)
+    assert [request["argv"] for request in requests] == [[], []]
+    assert base64.b64decode(requests[0]["stdin"]) == b"print(1)"
+
+
+def test_exec_command__python_mode_server_exited(mock_conn):
+    """Test that a request the exec server exits on fails instead of waiting for its answer."""
+    mock_conn._ws = MagicMock()
+    mock_conn._ws.recv.side_effect = [
+        b'\x01' + READY_LINE + b'\n',
+        b'\x01' + ZYGOTE_EXITED_LINE + b'\n',
+    ]
+    set_options(mock_conn, {"flightctl_exec_mode": "python"})
+    mock_conn.exec_mode = 'python'
+    mock_conn._zygote_unavailable = set()
+
+    with pytest.raises(AnsibleConnectionFailure) as e:
+        mock_conn.exec_command("/bin/sh -c '/usr/bin/python3 && sleep 0'", in_data=b"print(1)")
+
+    assert "exited without answering" in str(e.value.__cause__)
+    assert mock_conn._zygote is None
+
+
+def test_exec_command__python_mode_shell_commands(mock_conn):
+    """Test that other commands run in the console shell, like they do before any module ran."""
+    mock_conn._ws = MagicMock()
+    mock_conn._ws.recv.side_effect = [
+        b'\x01' + ZYGOTE_EXITED_LINE + b'\n',
+        b'\x02ls: /nope: No such file\n',
+        b'\x01' + f'{CMD_END_MARKER}\n'.encode(),
+    ]
+    set_options(mock_conn, {"flightctl_exec_mode": "python"})
+    mock_conn.exec_mode = 'python'
+    mock_conn._zygote = "/usr/bin/python3"
+    mock_conn._zygote_unavailable = set()
+
+    result = mock_conn.exec_command("cd /tmp && ls /nope")
+
+    assert result == (0, b"", b"ls: /nope: No such file")
+    assert mock_conn._zygote is None
+    sent = [call.args[0][1:] for call in mock_conn._ws.send.call_args_list]
+    assert json.loads(base64.b64decode(sent[0])) == {"exit": True}
+    assert b"cd /tmp && ls /nope\n" in sent[1]
+
+
+def test_exec_command__python_mode_unavailable(mock_conn):
+    """Test that commands run from the shell when the exec server cannot be started."""
+    mock_conn._ws = MagicMock()
+    mock_conn._ws.recv.side_effect = [
+        b'\x02sh: /usr/bin/python3: not found\n',
+        b'\x01' + ZYGOTE_EXITED_LINE + b'\n',
+        b'\x01' + f'{STDIN_READY_MARKER}\n'.encode(),
+        b'\x01' + f'{{"ping": "pong"}}\n{CMD_END_MARKER}\n'.encode(),
+    ]
+    set_options(mock_conn, {"flightctl_exec_mode": "python"})
+    mock_conn.exec_mode = 'python'
+    mock_conn._zygote_unavailable = set()
+
+    rc, stdout, _stderr = mock_conn.exec_command("/bin/sh -c '/usr/bin/python3 && sleep 0'", in_data=b"print(1)")
+
+    assert (rc, stdout) == (0, b'{"ping": "pong"}')
+    assert mock_conn._zygote is None
+    assert mock_conn._zygote_unavailable == {"/usr/bin/python3"}
+    sent = [call.args[0] for call in mock_conn._ws.send.call_args_list]
+    assert b"head -c 8 | (/bin/sh -c '/usr/bin/python3 && sleep 0'; cat > /dev/null)" in sent[1]
+    assert sent[2] == bytes([STD_IN_CHANNEL]) + b"print(1)"
+
+
+def test_send_command__stops_exec_server(mock_conn):
+    """Test that the exec server hands stdin back to the shell before a shell command."""
+    mock_conn._ws = MagicMock()
+    mock_conn._ws.recv.side_effect = [
+        b'\x01' + ZYGOTE_EXITED_LINE + b'\n',
+        b'\x01' + f'content\n{CMD_END_MARKER}\n'.encode(),
+    ]
+    mock_conn._zygote = "/usr/bin/python3"
+
+    stdout, _stderr = mock_conn._send_command("cat /etc/hostname", CommandType.FETCH)
+
+    assert stdout == "content"
+    assert mock_conn._zygote is None
+    exit_request = mock_conn._ws.send.call_args_list[0].args[0][1:]
+    assert json.loads(base64.b64decode(exit_request)) == {"exit": True}
+
+
+def test_exec_command__pipelining_only_in_python_mode(mock_conn):
+    """Test that input data is refused unless the exec mode enables pipelining."""
+    set_options(mock_conn, {"flightctl_exec_mode": "shell"})
+    assert not mock_conn.has_pipelining
+
+    with pytest.raises(AnsibleConnectionFailure, match="Pipelining not supported"):
+        mock_conn.exec_command("/usr/bin/python3", in_data=b"print(1)")
+
+    set_options(mock_conn, {"flightctl_exec_mode": "python"})
+    assert mock_conn.has_pipelining
+
+
+@pytest.fixture
+def reconnecting_conn(mock_conn, monkeypatch):
+    """A connection whose first session drops, reconnecting opens a working session."""
+    from plugins.connection import flightctl_console
+
+    sleep = MagicMock()
+    monkeypatch.setattr(flightctl_console.time, 'sleep', sleep)
+    mock_conn.reconnect_retries = 3
+    mock_conn.reconnect_backoff = 1
+    mock_conn.reconnect_backoff_max = 30
+    mock_conn._ws = MagicMock()
+    new_ws = MagicMock()
+
+    def connect():
+        mock_conn._ws = new_ws
+
+    mock_conn._connect = MagicMock(side_effect=connect)
+    return mock_conn, new_ws, sleep
+
+
+def test_fetch_file__retried_after_connection_lost(reconnecting_conn, tmp_path):
+    """Test that fetch_file reconnects and downloads again when the session drops."""
+    conn, new_ws, sleep = reconnecting_conn
+    conn._ws.recv.side_effect = ConnectionClosedError(None, None)
+    new_ws.recv.side_effect = [b'\x01' + base64.b64encode(b"content") + f'\n{CMD_END_MARKER}\n'.encode()]
+    out_file = tmp_path / "fetched"
+
+    conn.fetch_file("/remote/file", str(out_file))
+
+    assert out_file.read_bytes() == b"content"
+    conn._connect.assert_called_once()
+    sleep.assert_called_once_with(1)
+
+
+def test_put_file__connects_when_not_connected(mock_conn, tmp_path):
+    """Test that put_file opens a session when there is none, like the other transfers."""
+    test_file = tmp_path / "testfile"
+    test_file.write_text("content")
+    mock_conn._send_command = MagicMock(return_value=("", ""))
+
+    def connect():
+        mock_conn._ws = MagicMock()
+
+    mock_conn._connect = MagicMock(side_effect=connect)
+
+    mock_conn.put_file(str(test_file), "/remote/file")
+
+    mock_conn._connect.assert_called_once()
+    mock_conn._send_command.assert_called_once()
+
+
+def test_exec_command__not_retried_once_sent(reconnecting_conn):
+    """Test that a command that may have run on the device is not run again."""
+    conn, _new_ws, _sleep = reconnecting_conn
+    conn._ws.recv.side_effect = ConnectionClosedError(None, None)
+
+    with pytest.raises(AnsibleConnectionFailure, match="exec_command failed"):
+        conn.exec_command("touch /tmp/file")
+
+    conn._connect.assert_not_called()
+
+
+def test_exec_command__retried_when_not_sent(reconnecting_conn):
+    """Test that a command that could not be sent is sent again on a new session."""
+    conn, new_ws, _sleep = reconnecting_conn
+    conn._ws.send.side_effect = ConnectionClosedError(None, None)
+    new_ws.recv.side_effect = [b'\x01' + f'output\n{CMD_END_MARKER}\n'.encode()]
+
+    rc, stdout, _stderr = conn.exec_command("echo output")
+
+    assert stdout == b"output"
+    conn._connect.assert_called_once()
+
+
+def test_with_reconnect__bounded_backoff(reconnecting_conn):
+    """Test that the backoff doubles up to its maximum and attempts are bounded."""
+    from plugins.connection.flightctl_console import _SessionLost
+
+    conn, _new_ws, sleep = reconnecting_conn
+    conn.reconnect_retries = 5
+    conn.reconnect_backoff_max = 3
+    operation = MagicMock(side_effect=_SessionLost("lost"))
+
+    with pytest.raises(_SessionLost):
+        conn._with_reconnect(operation, resend=True)
+
+    assert operation.call_count == 6
+    assert [c.args[0] for c in sleep.call_args_list] == [1, 2, 3, 3, 3]
+
+
+@pytest.mark.parametrize("reconnect_retries, chunked", [(3, True), (0, False)])
+def test_upload_file__chunked_only_when_resumable(mock_conn, reconnect_retries, chunked):
+    """Test that large uploads are only sent in chunks when they can resume after a reconnect."""
+    mock_conn.reconnect_retries = reconnect_retries
+    mock_conn.transfer_mode = 'binary'
+    mock_conn._put_file_chunked = MagicMock()
+    mock_conn._put_file_binary = MagicMock()
+    content = b"x" * (PUT_CHUNK_SIZE + 1)
+
+    mock_conn._upload_file(content, "/remote/file")
+
+    assert mock_conn._put_file_chunked.called is chunked
+    assert mock_conn._put_file_binary.called is not chunked
+
+
+@pytest.mark.parametrize("digest_matches, expected", [(True, PUT_CHUNK_SIZE), (False, 0)])
+def test_verified_offset(mock_conn, digest_matches, expected):
+    """Test that a partial upload resumes from the last chunk boundary that matches."""
+    content = b"x" * (PUT_CHUNK_SIZE * 2)
+    digest = hashlib.sha256(content[:PUT_CHUNK_SIZE]).hexdigest() if digest_matches else "0" * 64
+    mock_conn._send_command = MagicMock(side_effect=[(str(PUT_CHUNK_SIZE + 10), ""), (f"{digest}  -", "")])
+
+    assert mock_conn._verified_offset("/remote/file.part", content) == expected
+    assert f"seek={PUT_CHUNK_SIZE}" in mock_conn._send_command.call_args.args[0]
+
+
+def test_close__writes_session_stats(mock_conn, tmp_path):
+    """Test that the session statistics are recorded and written when it is closed."""
+    from plugins.plugin_utils.console_stats import SessionStats
+
+    stats_file = tmp_path / "stats.jsonl"
+    mock_conn.stats_file = str(stats_file)
+    mock_conn._stats = SessionStats("test-device")
+    mock_conn._ws = MagicMock()
+    mock_conn._ws.recv.side_effect = [b'\x01' + f'out\n{CMD_END_MARKER}\n'.encode()]
+
+    mock_conn._send_command("echo out", CommandType.EXEC)
+    mock_conn.close()
+
+    stats = json.loads(stats_file.read_text())
+    assert stats["commands"] == {"exec": 1}
+    assert stats["frames"] == {"sent": {"stdin": 1}, "received": {"stdout": 1}}
+    assert stats["first_byte_seconds_avg"] is not None
+    assert mock_conn._stats is None
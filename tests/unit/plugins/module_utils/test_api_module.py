@@ -12,7 +12,7 @@ from plugins.module_utils.constants import ResourceType
 from plugins.module_utils.exceptions import FlightctlException
 from plugins.module_utils.options import ApprovalOptions
 
-from flightctl.exceptions import ApiException, NotFoundException
+from flightctl.exceptions import ApiException, BadRequestException, ConflictException, NotFoundException
 from flightctl.models.auth_provider import AuthProvider
 from flightctl.models.enrollment_request_approval import EnrollmentRequestApproval
 from flightctl.models.certificate_signing_request import CertificateSigningRequest
@@ -433,3 +433,238 @@ def test_delete_catalog_item(api_module):
     }):
         api_module.delete(ResourceType.CATALOG_ITEM, "my-item", "my-catalog")
         mock_api_instance.delete_catalog_item.assert_called_once()
+
+
+# --- Prefetch tests ---
+
+def test_list_by_names_chunks_and_pages(api_module):
+    def device(name):
+        item = MagicMock()
+        item.metadata.name = name
+        return item
+
+    pages = {
+        (0, None): MagicMock(items=[device("d000"), device("d001")], metadata=MagicMock(var_continue="next")),
+        (0, "next"): MagicMock(items=[device("d049")], metadata=MagicMock(var_continue=None)),
+        (1, None): MagicMock(items=[device("d050")], metadata=None),
+    }
+    selectors = []
+
+    def list_devices(**kwargs):
+        chunk = len(set(selectors) | {kwargs["field_selector"]}) - 1
+        selectors.append(kwargs["field_selector"])
+        assert kwargs["limit"] == 1000
+        return pages[(chunk, kwargs.get("var_continue"))]
+
+    mock_api_instance = MagicMock()
+    mock_api_instance.list_devices.side_effect = list_devices
+
+    with patch.dict('plugins.module_utils.constants.API_MAPPING', {
+        ResourceType.DEVICE: MagicMock(
+            api=MagicMock(return_value=mock_api_instance),
+            api_version='v1beta1',
+            list='list_devices',
+        ),
+    }):
+        names = [f"d{i:03}" for i in range(60)]
+        found = api_module.list_by_names(ResourceType.DEVICE, names)
+
+    assert sorted(found) == ["d000", "d001", "d049", "d050"]
+    assert mock_api_instance.list_devices.call_count == 3
+    assert selectors[0] == f"metadata.name in ({','.join(names[:50])})"
+    assert selectors[2] == f"metadata.name in ({','.join(names[50:])})"
+
+
+# --- Optimistic update tests ---
+
+def existing_device(resource_version, labels):
+    existing = MagicMock()
+    existing.to_dict.return_value = {
+        "apiVersion": "flightctl.io/v1beta1",
+        "kind": "Device",
+        "metadata": {"name": "device1", "resourceVersion": resource_version, "labels": labels},
+    }
+    return existing
+
+
+def test_update_optimistic_retries_conflicts(api_module):
+    mock_api_instance = MagicMock()
+    mock_api_instance.patch_device.side_effect = [ConflictException(), "patched"]
+    mock_api_instance.get_device.return_value = existing_device("8", {"env": "dev", "site": "a"})
+    definition = {"kind": "Device", "metadata": {"name": "device1", "labels": {"env": "prod"}}}
+
+    with patch.dict('plugins.module_utils.constants.API_MAPPING', {
+        ResourceType.DEVICE: MagicMock(
+            api=MagicMock(return_value=mock_api_instance),
+            api_version='v1beta1',
+            get='get_device',
+            patch='patch_device',
+            rendered=None,
+        ),
+    }):
+        changed, result = api_module.update(
+            ResourceType.DEVICE, existing_device("7", {"env": "dev"}), definition, optimistic=True,
+        )
+
+    assert (changed, result) == (True, "patched")
+    first, second = [c.args[1] for c in mock_api_instance.patch_device.call_args_list]
+    assert first[0].to_dict() == {"op": "test", "path": "/metadata/resourceVersion", "value": "7"}
+    assert second[0].to_dict() == {"op": "test", "path": "/metadata/resourceVersion", "value": "8"}
+    assert [p.to_dict()["op"] for p in second[1:]] == ["replace"]
+
+
+def failed_test_op():
+    """The error the server returns when the resourceVersion test of a patch fails."""
+    return BadRequestException(
+        status=400, reason="Bad Request",
+        body='{"code": 400, "message": "testing value /metadata/resourceVersion failed: test failed"}',
+    )
+
+
+def test_update_optimistic_retries_failed_test_op(api_module):
+    mock_api_instance = MagicMock()
+    mock_api_instance.patch_device.side_effect = [failed_test_op(), "patched"]
+    mock_api_instance.get_device.return_value = existing_device("8", {"env": "dev"})
+    definition = {"kind": "Device", "metadata": {"name": "device1", "labels": {"env": "prod"}}}
+
+    with patch.dict('plugins.module_utils.constants.API_MAPPING', {
+        ResourceType.DEVICE: MagicMock(
+            api=MagicMock(return_value=mock_api_instance),
+            api_version='v1beta1',
+            get='get_device',
+            patch='patch_device',
+            rendered=None,
+        ),
+    }):
+        changed, result = api_module.update(
+            ResourceType.DEVICE, existing_device("7", {"env": "dev"}), definition, optimistic=True,
+        )
+
+    assert (changed, result) == (True, "patched")
+    second = mock_api_instance.patch_device.call_args_list[1].args[1]
+    assert second[0].to_dict() == {"op": "test", "path": "/metadata/resourceVersion", "value": "8"}
+
+
+def test_update_optimistic_bad_request_not_retried(api_module):
+    mock_api_instance = MagicMock()
+    mock_api_instance.patch_device.side_effect = BadRequestException(status=400, reason="Bad Request", body="invalid")
+    mock_api_instance.get_device.return_value = existing_device("7", {"env": "dev"})
+    definition = {"kind": "Device", "metadata": {"name": "device1", "labels": {"env": "prod"}}}
+
+    with patch.dict('plugins.module_utils.constants.API_MAPPING', {
+        ResourceType.DEVICE: MagicMock(
+            api=MagicMock(return_value=mock_api_instance),
+            api_version='v1beta1',
+            get='get_device',
+            patch='patch_device',
+            rendered=None,
+        ),
+    }):
+        with pytest.raises(FlightctlException, match="Unable to update Device"):
+            api_module.update(ResourceType.DEVICE, existing_device("7", {"env": "dev"}), definition, optimistic=True)
+
+    assert mock_api_instance.patch_device.call_count == 1
+
+
+def test_update_optimistic_gives_up(api_module):
+    mock_api_instance = MagicMock()
+    mock_api_instance.patch_device.side_effect = ConflictException()
+    mock_api_instance.get_device.return_value = existing_device("8", {"env": "dev"})
+    definition = {"kind": "Device", "metadata": {"name": "device1", "labels": {"env": "prod"}}}
+
+    with patch.dict('plugins.module_utils.constants.API_MAPPING', {
+        ResourceType.DEVICE: MagicMock(
+            api=MagicMock(return_value=mock_api_instance),
+            api_version='v1beta1',
+            get='get_device',
+            patch='patch_device',
+            rendered=None,
+        ),
+    }):
+        with pytest.raises(FlightctlException, match="changed on every one of 3 attempts"):
+            api_module.update(ResourceType.DEVICE, existing_device("7", {"env": "dev"}), definition, optimistic=True)
+
+    assert mock_api_instance.patch_device.call_count == 3
+
+
+def test_update_optimistic_unchanged(api_module):
+    mock_api_instance = MagicMock()
+    existing = existing_device("7", {"env": "prod"})
+    definition = {"kind": "Device", "metadata": {"name": "device1", "labels": {"env": "prod"}}}
+
+    with patch.dict('plugins.module_utils.constants.API_MAPPING', {
+        ResourceType.DEVICE: MagicMock(
+            api=MagicMock(return_value=mock_api_instance),
+            api_version='v1beta1',
+            patch='patch_device',
+        ),
+    }):
+        assert api_module.update(ResourceType.DEVICE, existing, definition, optimistic=True) == (False, existing)
+
+    mock_api_instance.patch_device.assert_not_called()
+
+
+# --- Caching tests ---
+
+def test_api_instances_are_reused(api_module):
+    mock_api_cls = MagicMock()
+
+    with patch.dict('plugins.module_utils.constants.API_MAPPING', {
+        ResourceType.AUTH_PROVIDER: MagicMock(
+            api=mock_api_cls,
+            api_version='v1beta1',
+            get='get_auth_provider',
+            delete='delete_auth_provider',
+            rendered=None,
+        ),
+        ResourceType.CATALOG: MagicMock(
+            api=mock_api_cls,
+            api_version='v1alpha1',
+            delete='delete_catalog',
+        ),
+    }):
+        from plugins.module_utils.options import GetOptions
+        api_module.get(GetOptions(resource=ResourceType.AUTH_PROVIDER, name="provider"))
+        api_module.delete(ResourceType.AUTH_PROVIDER, "provider", None)
+        api_module.delete(ResourceType.CATALOG, "catalog", None)
+
+    # One instance per client
+    assert [c.args for c in mock_api_cls.call_args_list] == [(api_module.client,), (api_module.v1alpha1_client,)]
+
+
+def test_resolve_for_version_is_cached():
+    from plugins.module_utils.api_module import _resolve_for_version
+
+    assert _resolve_for_version("v1alpha1", "exceptions", "NotFoundException") is V1Alpha1NotFoundException
+    with patch('plugins.module_utils.constants.importlib.import_module') as mock_import:
+        assert _resolve_for_version("v1alpha1", "exceptions", "NotFoundException") is V1Alpha1NotFoundException
+    mock_import.assert_not_called()
+
+
+def test_clients_share_connections(api_module):
+    assert api_module.v1alpha1_client.rest_client.pool_manager is api_module.client.rest_client.pool_manager
+
+
+def test_api_mapping_resolves_classes():
+    from plugins.module_utils.constants import API_MAPPING
+    from flightctl.v1alpha1.api.catalog_api import CatalogApi
+
+    assert API_MAPPING[ResourceType.CATALOG].api is CatalogApi
+    assert API_MAPPING[ResourceType.CATALOG_ITEM].model is CatalogItem
+    assert API_MAPPING[ResourceType.AUTH_PROVIDER].model is AuthProvider
+
+
+def test_client_cache_reuses_clients(monkeypatch):
+    monkeypatch.setattr(FlightctlAPIModule, "client_cache", {})
+    modules = []
+    for token in ('token-a', 'token-b', 'token-a'):
+        set_module_args(dict(flightctl_host='https://test-flightctl-url.com/', flightctl_token=token))
+        modules.append(FlightctlAPIModule(argument_spec={}))
+    set_module_args(dict(flightctl_host='https://other-flightctl-url.com/', flightctl_token='token-a'))
+    other = FlightctlAPIModule(argument_spec={})
+
+    # Credentials are per module, connections are shared by every module of a server
+    assert modules[0].client is modules[1].client is modules[2].client
+    assert modules[0].headers != modules[1].headers
+    assert modules[1].v1alpha1_client is modules[2].v1alpha1_client
+    assert other.client is not modules[0].client
@@ -2,12 +2,17 @@ from __future__ import (absolute_import, division, print_function)
 
 __metaclass__ = type
 
+import os
+import socket
+
 import pytest
 
 from tests.unit.utils import set_module_args
 
 from plugins.module_utils.core import FlightctlModule
 
+from flightctl.configuration import Configuration
+
 
 @pytest.fixture
 def module_with_ca_file():
@@ -26,3 +31,51 @@ def test_build_url_with_valid_endpoint(module_with_ca_file):
         expected_content = f.read()
 
     assert certificate_content == expected_content
+
+
+def test_configure_connections_defaults():
+    set_module_args(dict(flightctl_host='https://test-flightctl-url.com/'))
+    client_config = Configuration()
+
+    FlightctlModule(argument_spec={}).configure_connections(client_config, min_pool_maxsize=8)
+
+    assert client_config.connection_pool_maxsize == 8
+    assert client_config.retries is None
+    assert client_config.socket_options is None
+
+
+def test_configure_connections_options():
+    set_module_args(dict(
+        flightctl_host='https://test-flightctl-url.com/',
+        flightctl_pool_maxsize=20,
+        flightctl_max_retries=4,
+        flightctl_keepalive=True,
+    ))
+    client_config = Configuration()
+
+    FlightctlModule(argument_spec={}).configure_connections(client_config, min_pool_maxsize=8)
+
+    assert client_config.connection_pool_maxsize == 20
+    assert client_config.retries.total == 4
+    assert 503 in client_config.retries.status_forcelist
+    assert "PATCH" not in client_config.retries.allowed_methods
+    assert (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in client_config.socket_options
+
+
+def test_config_cache_reuses_config_and_ca_file(monkeypatch):
+    monkeypatch.setattr(FlightctlModule, "config_cache", {})
+    modules = []
+    for _ in range(2):
+        set_module_args(dict(
+            flightctl_config_file='tests/unit/plugins/module_utils/fixtures/client_with_ca_data.yaml'
+        ))
+        modules.append(FlightctlModule(argument_spec={}))
+
+    try:
+        assert modules[0].ca_path == modules[1].ca_path
+        # One loaded config file and one CA file
+        assert len(FlightctlModule.config_cache) == 2
+    finally:
+        for key, value in FlightctlModule.config_cache.items():
+            if key[0] == "ca_data":
+                os.unlink(value)
@@ -2,12 +2,15 @@ from __future__ import (absolute_import, division, print_function)
 
 __metaclass__ = type
 
+import threading
+
 import pytest
-from unittest.mock import MagicMock
+from unittest.mock import ANY, MagicMock, patch
 
-from plugins.module_utils.constants import ResourceType
+from plugins.module_utils.constants import APPLIED_HASH_ANNOTATION, ResourceType
 from plugins.module_utils.exceptions import FlightctlException, FlightctlApiException, ValidationException
-from plugins.module_utils.runner import perform_approval
+from plugins.module_utils.runner import dependency_waves, perform_action, perform_approval, prefetch_existing, run_module, with_applied_hash
+from plugins.module_utils.utils import definition_hash
 
 from flightctl.models.enrollment_request import EnrollmentRequest
 from flightctl.models.certificate_signing_request import CertificateSigningRequest
@@ -130,3 +133,208 @@ def test_perform_approval__no_approval(mock_module):
     mock_module.params["approved"] = None
     with pytest.raises(ValidationException, match="Approved must be specified"):
         perform_approval(mock_module)
+
+
+def definition(kind, name):
+    return {"kind": kind, "apiVersion": "flightctl.io/v1beta1", "metadata": {"name": name}}
+
+
+@pytest.fixture
+def apply_module():
+    module = MagicMock()
+    module.check_mode = False
+    module.result = {"changed": False}
+    module.params = {"state": "present", "parallelism": 4}
+    return module
+
+
+def test_dependency_waves():
+    definitions = [
+        definition("Device", "d1"),
+        definition("Fleet", "f1"),
+        definition("Repository", "r1"),
+        definition("Device", "d2"),
+        definition("Unknown", "u1"),
+    ]
+
+    assert dependency_waves(definitions, "present") == [[2], [1], [0, 3], [4]]
+    assert dependency_waves(definitions, "absent") == [[4], [0, 3], [1], [2]]
+
+
+def test_run_module__parallel_results_in_input_order(apply_module):
+    definitions = [definition("Device", f"d{i}") for i in range(6)] + [definition("Repository", "r1")]
+    applied = []
+    lock = threading.Lock()
+
+    def perform_action(module, definition, prefetched=None):
+        with lock:
+            applied.append(definition["metadata"]["name"])
+        return definition["metadata"]["name"] == "d3", {"name": definition["metadata"]["name"]}
+
+    with patch("plugins.module_utils.runner.get_definitions", return_value=definitions), \
+            patch("plugins.module_utils.runner.perform_action", side_effect=perform_action):
+        run_module(apply_module)
+
+    # The repository is applied before every device
+    assert applied[0] == "r1"
+    apply_module.exit_json.assert_called_once_with(
+        changed=True,
+        results=[{"name": f"d{i}"} for i in range(6)] + [{"name": "r1"}],
+        state_hash=ANY,
+    )
+
+
+def test_run_module__parallel_failure_stops_later_waves(apply_module):
+    definitions = [definition("Fleet", "f1"), definition("Repository", "r1"), definition("Repository", "r2")]
+
+    def perform_action(module, definition, prefetched=None):
+        if definition["metadata"]["name"] != "r1":
+            raise FlightctlApiException(f"Oh No {definition['metadata']['name']}!")
+        return True, {}
+
+    with patch("plugins.module_utils.runner.get_definitions", return_value=definitions), \
+            patch("plugins.module_utils.runner.perform_action", side_effect=perform_action) as mock_perform:
+        with pytest.raises(FlightctlException, match="Failed to perform action: Oh No r2!"):
+            run_module(apply_module)
+
+    assert mock_perform.call_count == 2
+    apply_module.exit_json.assert_not_called()
+
+
+def test_run_module__check_mode_is_sequential(apply_module):
+    apply_module.check_mode = True
+    definitions = [definition("Device", "d1"), definition("Repository", "r1")]
+
+    with patch("plugins.module_utils.runner.get_definitions", return_value=definitions), \
+            patch("plugins.module_utils.runner.perform_action", return_value=(False, {})) as mock_perform, \
+            patch("plugins.module_utils.runner.apply_parallel") as mock_parallel:
+        run_module(apply_module)
+
+    mock_parallel.assert_not_called()
+    assert [c.args[1]["metadata"]["name"] for c in mock_perform.call_args_list] == ["d1", "r1"]
+
+
+@pytest.mark.parametrize("parallelism", [0, -1])
+def test_run_module__parallelism_below_one(apply_module, parallelism):
+    apply_module.params["parallelism"] = parallelism
+
+    with patch("plugins.module_utils.runner.get_definitions") as mock_definitions:
+        run_module(apply_module)
+
+    apply_module.fail_json.assert_called_once_with(msg="parallelism must be at least 1")
+    mock_definitions.assert_not_called()
+
+
+def test_prefetch_existing(apply_module):
+    existing = MagicMock()
+    apply_module.list_by_names.return_value = {"d1": existing}
+    definitions = [
+        definition("Device", "d1"),
+        definition("Device", "d2"),
+        definition("Device", "d3"),
+        definition("Device", "d3"),
+        definition("Fleet", "f1"),
+    ]
+
+    prefetched = prefetch_existing(apply_module, definitions)
+
+    # Duplicated names and single definitions of a kind are fetched one at a time
+    apply_module.list_by_names.assert_called_once_with(ResourceType.DEVICE, ["d1", "d2"], fleet_name=None, catalog_name=None)
+    assert prefetched == {(ResourceType.DEVICE, "d1"): existing, (ResourceType.DEVICE, "d2"): None}
+
+
+def test_prefetch_existing__skips_definitions_without_metadata(apply_module):
+    apply_module.list_by_names.return_value = {}
+    definitions = [definition("Device", "d1"), definition("Device", "d2"), {"kind": "Device"}]
+
+    prefetched = prefetch_existing(apply_module, definitions)
+
+    assert prefetched == {(ResourceType.DEVICE, "d1"): None, (ResourceType.DEVICE, "d2"): None}
+
+
+def test_prefetch_existing__falls_back_when_listing_fails(apply_module):
+    apply_module.list_by_names.side_effect = FlightctlApiException("field selector not supported")
+
+    assert prefetch_existing(apply_module, [definition("Device", "d1"), definition("Device", "d2")]) == {}
+
+
+def test_perform_action__uses_prefetched(apply_module):
+    prefetched = {(ResourceType.DEVICE, "d1"): None}
+    apply_module.create.return_value.to_dict.return_value = {"created": True}
+
+    changed, result = perform_action(apply_module, definition("Device", "d1"), prefetched)
+
+    assert (changed, result) == (True, {"created": True})
+    apply_module.get_one_or_many.assert_not_called()
+
+
+def test_run_module__known_state_hash_skips_the_server(apply_module):
+    definitions = [definition("Device", "d1"), definition("Device", "d2")]
+    apply_module.params["known_state_hash"] = definition_hash(definitions)
+
+    with patch("plugins.module_utils.runner.get_definitions", return_value=definitions), \
+            patch("plugins.module_utils.runner.perform_action") as mock_perform:
+        run_module(apply_module)
+
+    mock_perform.assert_not_called()
+    apply_module.list_by_names.assert_not_called()
+    apply_module.exit_json.assert_called_once_with(changed=False, state_hash=definition_hash(definitions))
+
+
+def test_run_module__stale_state_hash_applies(apply_module):
+    definitions = [definition("Device", "d1")]
+    apply_module.params["known_state_hash"] = definition_hash([definition("Device", "d2")])
+
+    with patch("plugins.module_utils.runner.get_definitions", return_value=definitions), \
+            patch("plugins.module_utils.runner.perform_action", return_value=(True, {})) as mock_perform:
+        run_module(apply_module)
+
+    mock_perform.assert_called_once()
+    apply_module.exit_json.assert_called_once_with(changed=True, result={}, state_hash=definition_hash(definitions))
+
+
+def test_perform_action__optimistic_update(apply_module):
+    apply_module.params["update_strategy"] = "optimistic"
+    apply_module.update.return_value = (True, MagicMock())
+    existing = MagicMock()
+
+    perform_action(apply_module, definition("Device", "d1"), {(ResourceType.DEVICE, "d1"): existing})
+
+    apply_module.update.assert_called_once_with(
+        ResourceType.DEVICE, existing, definition("Device", "d1"), None, optimistic=True,
+    )
+
+
+def test_with_applied_hash():
+    plain = definition("Device", "d1")
+    annotated, applied_hash = with_applied_hash(plain)
+
+    assert annotated["metadata"]["annotations"] == {APPLIED_HASH_ANNOTATION: applied_hash}
+    assert "annotations" not in plain["metadata"]
+    # Applying the annotated definition again gives the same hash
+    assert with_applied_hash(annotated) == (annotated, applied_hash)
+
+
+def test_perform_action__applied_hash_matches(apply_module):
+    apply_module.params["applied_hash_annotation"] = True
+    _annotated, applied_hash = with_applied_hash(definition("Device", "d1"))
+    existing = MagicMock()
+    existing.metadata.annotations = {APPLIED_HASH_ANNOTATION: applied_hash}
+    existing.to_dict.return_value = {"existing": True}
+
+    changed, result = perform_action(apply_module, definition("Device", "d1"), {(ResourceType.DEVICE, "d1"): existing})
+
+    assert (changed, result) == (False, {"existing": True})
+    apply_module.update.assert_not_called()
+
+
+def test_perform_action__applied_hash_differs(apply_module):
+    apply_module.params["applied_hash_annotation"] = True
+    apply_module.update.return_value = (True, MagicMock())
+    existing = MagicMock()
+    existing.metadata.annotations = {APPLIED_HASH_ANNOTATION: "stale"}
+
+    perform_action(apply_module, definition("Device", "d1"), {(ResourceType.DEVICE, "d1"): existing})
+
+    annotated, _applied_hash = with_applied_hash(definition("Device", "d1"))
+    apply_module.update.assert_called_once_with(ResourceType.DEVICE, existing, annotated, None, optimistic=False)
@@ -0,0 +1,131 @@
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import copy
+
+import pytest
+
+from plugins.module_utils.utils import diff_dicts, get_patch, get_patch_and_diff, json_patch
+
+
+def test_get_patch__escapes_keys():
+    old = {"metadata": {"annotations": {"owner": "team"}}}
+    new = {"metadata": {"annotations": {"ansible.flightctl.io/applied-hash": "abc", "a~b": "c"}}}
+
+    patch = get_patch(old, new)
+
+    assert sorted(p["path"] for p in patch) == [
+        "/metadata/annotations/ansible.flightctl.io~1applied-hash",
+        "/metadata/annotations/a~0b",
+    ]
+    patched, error = json_patch(old, patch)
+    assert error is None
+    assert patched["metadata"]["annotations"] == {"owner": "team", **new["metadata"]["annotations"]}
+
+
+def fleet(applications, labels=None):
+    return {
+        "metadata": {"name": "fleet1", "labels": labels or {"env": "prod"}, "resourceVersion": "3"},
+        "spec": {"template": {"spec": {"applications": applications, "os": {"image": "quay.io/os:1"}}}},
+    }
+
+
+def app(name, image, **extra):
+    return dict(name=name, image=image, **extra)
+
+
+APPS = "/spec/template/spec/applications"
+
+
+def test_get_patch__identical_is_empty():
+    old = fleet([app("a", "a:1"), app("b", "b:1")])
+
+    assert get_patch(old, old) == []
+    assert get_patch(old, fleet([app("a", "a:1"), app("b", "b:1")])) == []
+
+
+def test_get_patch__keeps_keys_missing_from_definition():
+    old = fleet([app("a", "a:1")])
+    new = {"metadata": {"labels": {"env": "dev"}}}
+
+    assert get_patch(old, new) == [{"op": "replace", "path": "/metadata/labels/env", "value": "dev"}]
+
+
+@pytest.mark.parametrize("new_apps, expected", [
+    pytest.param(
+        [app("a", "a:1"), app("b", "b:2")],
+        [{"op": "replace", "path": f"{APPS}/1/image", "value": "b:2"}],
+        id="changed-item",
+    ),
+    pytest.param(
+        [app("a", "a:1"), app("b", "b:1", envVars={"X": "1"})],
+        [{"op": "add", "path": f"{APPS}/1/envVars", "value": {"X": "1"}}],
+        id="added-key",
+    ),
+    pytest.param(
+        [app("a", "a:1"), {"name": "b"}],
+        [{"op": "remove", "path": f"{APPS}/1/image"}],
+        id="removed-key",
+    ),
+    pytest.param(
+        [app("a", "a:1"), app("b", "b:1"), app("c", "c:1")],
+        [{"op": "add", "path": f"{APPS}/-", "value": app("c", "c:1")}],
+        id="appended",
+    ),
+    pytest.param(
+        [app("a", "a:2")],
+        [{"op": "replace", "path": f"{APPS}/0/image", "value": "a:2"}, {"op": "remove", "path": f"{APPS}/1"}],
+        id="truncated",
+    ),
+    pytest.param(
+        [app("b", "b:1"), app("a", "a:1")],
+        [{"op": "replace", "path": APPS, "value": [app("b", "b:1"), app("a", "a:1")]}],
+        id="reordered",
+    ),
+    pytest.param(
+        [app("a", "a:1"), app("a", "a:2")],
+        [{"op": "replace", "path": APPS, "value": [app("a", "a:1"), app("a", "a:2")]}],
+        id="duplicate-names",
+    ),
+])
+def test_get_patch__named_lists(new_apps, expected):
+    old = fleet([app("a", "a:1"), app("b", "b:1")])
+    new = fleet(new_apps)
+
+    patch = get_patch(old, new)
+
+    assert patch == expected
+    patched, error = json_patch(old, patch)
+    assert error is None
+    assert patched == new
+
+
+@pytest.mark.parametrize("old_list, new_list, expected", [
+    (["a", "b"], ["a", "b", "c"], [{"op": "add", "path": "/list/-", "value": "c"}]),
+    (["a", "b"], ["a", "c"], [{"op": "replace", "path": "/list", "value": ["a", "c"]}]),
+    ([{"x": 1}], [{"x": 2}], [{"op": "replace", "path": "/list", "value": [{"x": 2}]}]),
+])
+def test_get_patch__unnamed_lists(old_list, new_list, expected):
+    assert get_patch({"list": old_list}, {"list": new_list}) == expected
+
+
+@pytest.mark.parametrize("new", [
+    pytest.param(fleet([app("a", "a:1"), app("b", "b:1")]), id="unchanged"),
+    pytest.param(fleet([app("a", "a:1"), app("b", "b:2")], labels={"env": "dev", "tier": "1"}), id="nested"),
+    pytest.param(fleet([app("a", "a:1")]), id="truncated-list"),
+    pytest.param({"metadata": {"annotations": {"note": None}}, "status": {"summary": "ok"}}, id="added-keys"),
+    pytest.param({"spec": {"template": {"spec": {"os": "flat"}}}}, id="dict-to-scalar"),
+])
+def test_get_patch_and_diff__matches_patch_and_diff_dicts(new):
+    old = fleet([app("a", "a:1"), app("b", "b:1")])
+    old["status"] = {"conditions": []}
+    pristine = copy.deepcopy(old)
+
+    patch, diff = get_patch_and_diff(old, new)
+
+    assert patch == get_patch(old, new)
+    patched, error = json_patch(old, patch)
+    assert error is None
+    assert diff == diff_dicts(old, patched)[1]
+    assert old == pristine
@@ -0,0 +1,137 @@
+# coding: utf-8 -*-
+
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+import os
+import socket
+import threading
+
+import pytest
+
+from plugins.plugin_utils import api_worker
+
+MODULE_SOURCE = """
+import os
+from ansible.module_utils.basic import AnsibleModule
+
+
+def main():
+    module = AnsibleModule(argument_spec={"name": {"type": "str"}, "fail": {"type": "bool", "default": False}})
+    if module.params["fail"]:
+        raise RuntimeError("module bug")
+    module.warn(f"warned about {module.params['name']}")
+    module.exit_json(changed=True, name=module.params["name"], lang=os.environ.get("MODULE_LANG"))
+"""
+
+
+@pytest.fixture
+def module(tmp_path, monkeypatch):
+    """A module that can be imported by name, like the modules of the collection."""
+    (tmp_path / "worker_test_module.py").write_text(MODULE_SOURCE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    return "worker_test_module"
+
+
+@pytest.fixture
+def worker(tmp_path):
+    """Serve on a UNIX socket in a background thread, with a short idle timeout."""
+    path = str(tmp_path / "worker")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(8)
+    ca_file = tmp_path / "ca.crt"
+    ca_file.write_text("certificate")
+    config_cache = {("ca_data", "encoded"): str(ca_file)}
+    thread = threading.Thread(target=api_worker.serve, args=(listener, config_cache, 0.5), daemon=True)
+    thread.start()
+    yield path, ca_file, thread
+    thread.join(5)
+    listener.close()
+
+
+def test_run_module__exit(module):
+    """Test that the module runs with its arguments and the environment of the task."""
+    environment = dict(os.environ, MODULE_LANG="C")
+
+    response = api_worker.run_module(module, {"name": "device-a"}, environment)
+
+    assert response["rc"] == 0
+    result = json.loads(response["stdout"])
+    assert result["changed"] is True
+    assert result["name"] == "device-a"
+    assert result["lang"] == "C"
+    assert result["warnings"] == ["warned about device-a"]
+    assert "MODULE_LANG" not in os.environ
+
+
+def test_run_module__warnings_do_not_carry_over(module):
+    """Test that each run only returns its own warnings."""
+    api_worker.run_module(module, {"name": "device-a"}, dict(os.environ))
+
+    response = api_worker.run_module(module, {"name": "device-b"}, dict(os.environ))
+
+    assert json.loads(response["stdout"])["warnings"] == ["warned about device-b"]
+
+
+def test_run_module__exception(module):
+    """Test that a module that raises returns its traceback instead of taking the worker down."""
+    response = api_worker.run_module(module, {"name": "device-a", "fail": True}, dict(os.environ))
+
+    assert response["rc"] == 1
+    assert response["stdout"] == ""
+    assert "RuntimeError: module bug" in response["stderr"]
+
+
+def test_run__round_trip(worker, module):
+    """Test that successive clients are served by the same worker."""
+    path, _ca_file, thread = worker
+
+    for name in ("device-a", "device-b"):
+        request = json.dumps({"module": module, "args": {"name": name}, "environment": dict(os.environ)})
+        response = api_worker.run(path, request.encode(), 0.5)
+        assert response["rc"] == 0
+        assert json.loads(response["stdout"])["name"] == name
+
+    assert thread.is_alive()
+
+
+def test_serve__idle_timeout_removes_ca_files(worker):
+    """Test that an idle worker exits and removes the CA files it kept for its clients."""
+    _path, ca_file, thread = worker
+
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert not ca_file.exists()
+
+
+def test_worker_path__stable(tmp_path):
+    """Test that the actions of one controller share a worker."""
+    path = api_worker.worker_path(str(tmp_path))
+
+    assert path == api_worker.worker_path(str(tmp_path))
+    assert os.path.dirname(path) == str(tmp_path)
+    assert os.path.basename(path).startswith("flightctl-api-")
+
+
+@pytest.mark.parametrize("version, expected", [
+    ("2.16.19", True),
+    ("2.18.0rc1", True),
+    ("2.15.13", False),
+    ("2.19.0", False),
+])
+def test_internals_supported__version(version, expected):
+    """Test that the worker is only used with releases of ansible-core it was checked with."""
+    assert api_worker.internals_supported(version) is expected
+
+
+def test_internals_supported__changed_internals(monkeypatch):
+    """Test that the worker is not used if the warnings are no longer collected in lists."""
+    monkeypatch.setattr(api_worker.module_warnings, "_global_warnings", {})
+
+    assert not api_worker.internals_supported("2.16.0")
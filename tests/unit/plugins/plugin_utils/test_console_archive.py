@@ -0,0 +1,111 @@
+# coding: utf-8 -*-
+
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import hashlib
+import io
+import subprocess
+import tarfile
+
+import pytest
+
+from plugins.plugin_utils.console_archive import (
+    MISSING_DIR_MARKER,
+    build_archive,
+    collect_tree,
+    compare_tree,
+    manifest_command,
+)
+
+
+@pytest.fixture
+def bundle(tmp_path):
+    src = tmp_path / "bundle"
+    (src / "conf.d").mkdir(parents=True)
+    (src / "empty").mkdir()
+    (src / "app.conf").write_text("app")
+    (src / "conf.d" / "b.conf").write_text("b")
+    (src / "conf.d" / "a b.conf").write_text("a")
+    return src
+
+
+def test_collect_tree__with_directory_name(bundle):
+    """Test that a directory is copied with its name by default."""
+    tree = collect_tree(str(bundle))
+
+    assert tree.root == str(bundle.parent)
+    assert tree.files == ["bundle/app.conf", "bundle/conf.d/a b.conf", "bundle/conf.d/b.conf"]
+    assert tree.dirs == ["bundle", "bundle/conf.d", "bundle/empty"]
+
+
+def test_collect_tree__contents_only(bundle):
+    """Test that only the contents of the directory are copied with a trailing slash."""
+    tree = collect_tree(str(bundle) + "/", contents_only=True)
+
+    assert tree.files == ["app.conf", "conf.d/a b.conf", "conf.d/b.conf"]
+    assert tree.dirs == ["conf.d", "empty"]
+
+
+def test_collect_tree__single_file(bundle):
+    """Test that a single file is copied into the destination."""
+    tree = collect_tree(str(bundle / "app.conf"))
+
+    assert tree.files == ["app.conf"]
+    assert tree.dirs == []
+
+
+def test_compare_tree__against_shell(bundle, tmp_path):
+    """Test that the manifest command run by a shell finds the missing and changed files."""
+    tree = collect_tree(str(bundle) + "/", contents_only=True)
+    dest = tmp_path / "dest with space"
+    (dest / "conf.d").mkdir(parents=True)
+    (dest / "app.conf").write_text("app")
+    (dest / "conf.d" / "b.conf").write_text("old")
+
+    output = subprocess.run(["sh", "-c", manifest_command(str(dest), tree)], capture_output=True, text=True, check=True)
+    files, dirs = compare_tree(tree, output.stdout)
+
+    assert files == ["conf.d/a b.conf", "conf.d/b.conf"]
+    assert dirs == ["empty"]
+
+
+def test_compare_tree__missing_destination(bundle, tmp_path):
+    """Test that everything is copied when the destination does not exist."""
+    tree = collect_tree(str(bundle))
+
+    output = subprocess.run(["sh", "-c", manifest_command(str(tmp_path / "nope"), tree)], capture_output=True, text=True)
+    files, dirs = compare_tree(tree, output.stdout)
+
+    assert output.stdout == f"{MISSING_DIR_MARKER} .\n"
+    assert files == tree.files
+    assert dirs == tree.dirs
+
+
+def test_compare_tree__up_to_date(bundle):
+    """Test that nothing is copied when all checksums match."""
+    tree = collect_tree(str(bundle / "app.conf"))
+    manifest = f"{hashlib.sha256(b'app').hexdigest()}  app.conf\n"
+
+    assert compare_tree(tree, manifest) == ([], [])
+
+
+def test_build_archive(bundle):
+    """Test that the archive holds the requested members, owned by root."""
+    tree = collect_tree(str(bundle))
+    (bundle / "app.conf").chmod(0o600)
+    buf = io.BytesIO()
+
+    build_archive(tree, ["bundle/app.conf"], ["bundle/empty"], buf)
+
+    buf.seek(0)
+    with tarfile.open(fileobj=buf, mode="r:gz") as archive:
+        members = {m.name: m for m in archive.getmembers()}
+        assert sorted(members) == ["bundle/app.conf", "bundle/empty"]
+        assert members["bundle/empty"].isdir()
+        assert members["bundle/app.conf"].mode == 0o600
+        assert all(m.uid == 0 and m.uname == "root" for m in members.values())
+        assert archive.extractfile("bundle/app.conf").read() == b"app"
@@ -0,0 +1,167 @@
+# coding: utf-8 -*-
+
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import asyncio
+import re
+
+import pytest
+from websockets.asyncio.server import serve
+
+from plugins.plugin_utils import console_batch
+from plugins.plugin_utils.console_batch import RC_MARKER, new_marker, run_batch, wrap_command
+
+
+class FakeConsoles:
+    """Console endpoint answering each command with a canned, per-device response."""
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self.commands = []
+
+    async def handler(self, ws):
+        device = ws.request.path.rsplit("/", 1)[-1]
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            message = await ws.recv()
+            self.commands.append(message)
+            marker = re.search(rb'echo "(\w+)\$\?"', message).group(1).decode()
+            if device == "slow":
+                # Never answer, wait for the client to give up
+                await ws.wait_closed()
+                return
+            await asyncio.sleep(0.01)
+            if device == "tricky":
+                # Output that looks like the status of another command
+                await ws.send(b"\x01" + f"{RC_MARKER}7\n".encode())
+            await ws.send(b"\x01" + f"hello {device}\n".encode())
+            await ws.send(b"\x02oops")
+            # Split the marker between two messages
+            rc_line = f"{marker}{3 if device == 'bad' else 0}\n".encode()
+            await ws.send(b"\x01" + rc_line[:5])
+            await ws.send(b"\x01" + rc_line[5:])
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture
+def consoles(monkeypatch):
+    fake = FakeConsoles()
+    monkeypatch.setattr(console_batch, "console_url", lambda host_url, device: f"{host_url}/{device}")
+    return fake
+
+
+def run_against(consoles, devices, **kwargs):
+    async def main():
+        async with serve(consoles.handler, "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            return await run_batch(devices, "echo hello", f"ws://127.0.0.1:{port}", **kwargs)
+
+    return asyncio.run(main())
+
+
+def test_wrap_command__reports_rc():
+    """Test that the wrapped command echoes its exit status after the marker."""
+    marker = new_marker()
+    wrapped = wrap_command("false", marker)
+
+    assert wrapped.startswith("(\nfalse\n) </dev/null\n")
+    assert f'echo "{marker}$?"' in wrapped
+    assert marker.startswith(RC_MARKER)
+    assert marker != new_marker()
+    assert "systemd-cat" not in wrapped
+
+
+def test_wrap_command__audit_event():
+    """Test that the audit event is recorded before the command runs."""
+    wrapped = wrap_command("true", new_marker(), "exec_command")
+
+    assert wrapped.startswith("echo exec_command | systemd-cat -t ansible-console\n(\ntrue\n)")
+
+
+@pytest.mark.parametrize("audit_log, expected", [
+    ("command", b"echo exec_command | systemd-cat"),
+    ("session", b"echo console_session | systemd-cat"),
+    ("off", None),
+])
+def test_run_batch__audit_log(consoles, audit_log, expected):
+    """Test that each session records the event of the audit_log option in the device journal."""
+    results = run_against(consoles, ["dev-a"], audit_log=audit_log)
+
+    assert results[0]["rc"] == 0
+    if expected:
+        assert expected in consoles.commands[0]
+    else:
+        assert b"systemd-cat" not in consoles.commands[0]
+
+
+def test_run_batch__output_with_marker_prefix(consoles):
+    """Test that output looking like the status line of another command is kept as output."""
+    results = run_against(consoles, ["tricky"])
+
+    assert results[0]["rc"] == 0
+    assert results[0]["stdout"] == f"{RC_MARKER}7\nhello tricky"
+
+
+def test_run_batch__results_per_device(consoles):
+    """Test that each device reports its own output and exit status, in order."""
+    results = run_against(consoles, ["dev-a", "bad", "dev-b"])
+
+    assert [r["device"] for r in results] == ["dev-a", "bad", "dev-b"]
+    assert results[0] == {"device": "dev-a", "rc": 0, "stdout": "hello dev-a", "stderr": "oops", "failed": False}
+    assert results[1]["rc"] == 3
+    assert results[1]["failed"] is True
+    assert all(c[0] == 0 for c in consoles.commands)
+
+
+def test_run_batch__concurrency_limit(consoles):
+    """Test that no more than the allowed number of sessions are open at once."""
+    results = run_against(consoles, [f"dev-{i}" for i in range(10)], concurrency=3)
+
+    assert all(r["rc"] == 0 for r in results)
+    assert consoles.max_active == 3
+
+
+def test_run_batch__timeout(consoles):
+    """Test that a device that does not answer in time fails without holding up others."""
+    results = run_against(consoles, ["slow", "dev-a"], timeout=0.5)
+
+    assert results[0]["failed"] is True
+    assert "timed out" in results[0]["msg"]
+    assert results[1]["rc"] == 0
+
+
+def test_run_batch__unreachable(monkeypatch):
+    """Test that a device whose console cannot be opened is reported as unreachable."""
+    monkeypatch.setattr(console_batch, "console_url", lambda host_url, device: "ws://127.0.0.1:1/")
+
+    results = asyncio.run(run_batch(["dev-a"], "true", "unused", timeout=5))
+
+    assert results[0]["failed"] is True
+    assert results[0]["unreachable"] is True
+
+
+@pytest.mark.parametrize("results, expected", [
+    (
+        [{"device": "dev-a", "rc": 0, "failed": False}, {"device": "dev-b", "rc": 0, "failed": False}],
+        {"changed": True},
+    ),
+    (
+        [{"device": "dev-a", "rc": 0, "failed": False}, {"device": "dev-b", "rc": 3, "failed": True}],
+        {"changed": True, "failed": True, "msg": "The command failed on 1 of 2 devices: dev-b"},
+    ),
+    (
+        [{"device": "dev-a", "failed": True, "unreachable": True, "msg": "refused"}],
+        {"changed": False, "failed": True, "msg": "The command failed on 1 of 1 devices: dev-a"},
+    ),
+    ([], {"changed": False}),
+])
+def test_summarize(results, expected):
+    """Test that the task fails for any failed device, and changed only where the command may have run."""
+    assert console_batch.summarize(results) == expected
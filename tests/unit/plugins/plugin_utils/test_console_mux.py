@@ -0,0 +1,124 @@
+# coding: utf-8 -*-
+
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import queue
+import socket
+import threading
+
+import pytest
+
+from websockets.exceptions import ConnectionClosed, ConnectionClosedError
+from plugins.plugin_utils import console_mux
+from plugins.plugin_utils.persistent import control_path, recv_frame, send_frame
+
+
+class FakeWebSocket:
+    """Echoes every sent message back, prefixed with the stdout channel."""
+
+    def __init__(self):
+        self.messages = queue.Queue()
+        self.sent = []
+        self.closed = False
+
+    def send(self, message):
+        self.sent.append(message)
+        self.messages.put(b'\x01' + message[1:])
+
+    def recv(self):
+        message = self.messages.get()
+        if message is None:
+            raise ConnectionClosedError(None, None)
+        return message
+
+    def close(self):
+        self.closed = True
+        self.messages.put(None)
+
+
+@pytest.fixture
+def mux(tmp_path):
+    """Serve a fake WebSocket on a UNIX socket in a background thread."""
+    path = str(tmp_path / "mux")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(8)
+    ws = FakeWebSocket()
+    thread = threading.Thread(target=console_mux.serve, args=(listener, ws, 30), daemon=True)
+    thread.start()
+    yield path, ws, thread
+    ws.close()
+    thread.join(5)
+
+
+def test_frame_round_trip():
+    """Test that frames survive a round trip, including empty ones."""
+    left, right = socket.socketpair()
+    with left, right:
+        send_frame(left, b"payload")
+        send_frame(left, b"")
+        assert recv_frame(right) == b"payload"
+        assert recv_frame(right) == b""
+        left.close()
+        assert recv_frame(right) is None
+
+
+def test_control_path__stable_and_keyed(tmp_path):
+    """Test that control paths are stable per key and differ between keys."""
+    path_a = control_path(str(tmp_path), "flightctl-console", "host", "device-a")
+    assert path_a == control_path(str(tmp_path), "flightctl-console", "host", "device-a")
+    assert path_a != control_path(str(tmp_path), "flightctl-console", "host", "device-b")
+    assert path_a.startswith(str(tmp_path))
+
+
+def test_serve__relays_messages_across_clients(mux):
+    """Test that successive clients share the same WebSocket."""
+    path, ws, _thread = mux
+
+    for data in (b"first", b"second"):
+        client = console_mux.MuxClient(path)
+        client.send(b'\x00' + data)
+        assert client.recv() == b'\x01' + data
+        client.close()
+
+    assert ws.sent == [b'\x00first', b'\x00second']
+    assert not ws.closed
+
+
+def test_serve__shutdown_closes_websocket(mux):
+    """Test that a shutdown request closes the WebSocket and stops the daemon."""
+    path, ws, thread = mux
+
+    console_mux.MuxClient(path).shutdown()
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert ws.closed
+    with pytest.raises(OSError):
+        console_mux.MuxClient(path)
+
+
+def test_mux_client__lost_daemon_raises_connection_closed():
+    """Test that a vanished daemon looks like a closed WebSocket."""
+    left, right = socket.socketpair()
+    client = console_mux.MuxClient.__new__(console_mux.MuxClient)
+    client._sock = left
+    right.close()
+
+    with pytest.raises(ConnectionClosed):
+        client.recv()
+
+
+def test_mux_client__recv_timeout():
+    """Test that a daemon that sends nothing makes recv time out."""
+    left, right = socket.socketpair()
+    client = console_mux.MuxClient.__new__(console_mux.MuxClient)
+    client._sock = left
+
+    with right, pytest.raises(TimeoutError):
+        client.recv(timeout=0.05)
+    client.close()
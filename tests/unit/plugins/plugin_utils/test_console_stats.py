@@ -0,0 +1,47 @@
+# coding: utf-8 -*-
+
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+
+from plugins.plugin_utils.console_stats import SessionStats
+
+
+def test_session_stats__counters():
+    """Test that frames, commands and transfers are summarized."""
+    stats = SessionStats("dev1")
+    stats.count_frame("sent", b"\x00echo hi\n")
+    stats.count_frame("received", b"\x01hi\n")
+    stats.count_frame("received", b"\x02oops")
+    stats.count_frame("received", b"\x01more")
+    stats.count_command("exec", 0.5, 0.1)
+    stats.count_command("exec", 1.5, 0.3)
+    stats.count_transfer("put", 1000, 0.5)
+
+    summary = stats.as_dict()
+
+    assert summary["device"] == "dev1"
+    assert summary["bytes"] == {"sent": {"stdin": 9}, "received": {"stdout": 9, "stderr": 5}}
+    assert summary["frames"]["received"] == {"stdout": 2, "stderr": 1}
+    assert summary["commands"] == {"exec": 2}
+    assert summary["command_seconds_avg"] == 1.0
+    assert summary["command_seconds_max"] == 1.5
+    assert summary["first_byte_seconds_avg"] == 0.2
+    assert summary["transfers"]["put"]["bytes_per_second"] == 2000
+    assert "2 commands" in stats.summary()
+
+
+def test_session_stats__append_to(tmp_path):
+    """Test that each session is appended as one JSON line."""
+    path = tmp_path / "stats.jsonl"
+    SessionStats("dev1").append_to(str(path))
+    SessionStats("dev2").append_to(str(path))
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+
+    assert [line["device"] for line in lines] == ["dev1", "dev2"]
+    assert lines[0]["first_byte_seconds_avg"] is None
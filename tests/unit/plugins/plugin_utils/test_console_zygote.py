@@ -0,0 +1,101 @@
+# coding: utf-8 -*-
+
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import base64
+import json
+import subprocess
+import sys
+
+import pytest
+
+from plugins.plugin_utils import console_zygote
+
+
+def request_line(request):
+    return base64.b64encode(json.dumps(request).encode()) + b"\n"
+
+
+@pytest.fixture
+def server():
+    """Run the exec server like the device does, from its source."""
+    with open(console_zygote.__file__, "rb") as f:
+        source = f.read()
+    proc = subprocess.Popen(
+        [sys.executable, "-u", "-c", source],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    assert proc.stdout.readline().strip() == console_zygote.READY_LINE
+
+    def call(request):
+        proc.stdin.write(request_line(dict(request, marker="__END__")))
+        proc.stdin.flush()
+        line = proc.stdout.readline()
+        assert line.endswith(b"__END__\n")
+        response = json.loads(base64.b64decode(line[:-len(b"__END__\n")]))
+        return response["rc"], base64.b64decode(response["stdout"]), base64.b64decode(response["stderr"])
+
+    yield call, proc
+    proc.kill()
+    proc.wait()
+
+
+def test_serve__script(server, tmp_path):
+    """Test that a script runs in a child, with its arguments and environment."""
+    call, _proc = server
+    script = tmp_path / "module.py"
+    script.write_text(
+        "import os, sys\n"
+        "print(sys.argv[1:], os.environ['MODULE_LANG'])\n"
+        "sys.exit(3)\n"
+    )
+
+    assert call({"argv": [str(script), "args"], "env": {"MODULE_LANG": "C"}}) == (3, b"['args'] C\n", b"")
+    # The environment of the server is left alone
+    assert call({"cmd": "echo ${MODULE_LANG:-unset}"}) == (0, b"unset\n", b"")
+
+
+def test_serve__pipelined_code(server):
+    """Test that code read from stdin runs like a module sent with pipelining."""
+    call, _proc = server
+    code = base64.b64encode(b"import sys\nprint(__name__)\nraise ValueError('boom')\n").decode()
+
+    rc, stdout, stderr = call({"argv": [], "stdin": code})
+
+    assert (rc, stdout) == (1, b"__main__\n")
+    assert b"ValueError: boom" in stderr
+
+
+def test_serve__shell_command(server):
+    """Test that shell commands get their input and report their exit status."""
+    call, _proc = server
+
+    assert call({"cmd": "cat; exit 4", "stdin": base64.b64encode(b"input").decode()}) == (4, b"input", b"")
+
+
+def test_serve__exit(server):
+    """Test that the server exits when asked."""
+    _call, proc = server
+
+    proc.stdin.write(request_line({"exit": True}))
+    proc.stdin.flush()
+
+    assert proc.wait(timeout=10) == 0
+    assert proc.stdout.read() == b""
+
+
+@pytest.mark.parametrize("line", [b"not base64!\n", base64.b64encode(b"[1]") + b"\n", request_line({"cmd": "true"})])
+def test_serve__unreadable_request(server, line):
+    """Test that the server exits on a request it cannot answer, leaving stdin to the shell."""
+    _call, proc = server
+
+    proc.stdin.write(line)
+    proc.stdin.flush()
+
+    assert proc.wait(timeout=10) == 0
+    assert proc.stdout.read() == b""